@@ -88,6 +88,10 @@ geometrytypes = (('box',) * 3,
 
 linkobjignoretypes = {'link', 'joint', 'motor', 'submechanism', 'entity'}
 
+#: number of bits of the exported collision bitmasks, Blender's further collision groups are
+#: ignored on export and not assigned on import
+collision_bitmask_bits = 16
+
 type_properties = {"undefined": (),
                    "undefined_default": (),
                    "link": ('name',),
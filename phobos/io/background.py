@@ -0,0 +1,283 @@
+#!/usr/bin/python
+# coding=utf-8
+
+"""
+.. module:: phobos.io.background
+    :platform: Unix, Windows, Mac
+    :synopsis: Exports models in background Blender processes
+
+Copyright 2018, University of Bremen & DFKI GmbH Robotics Innovation Center
+
+This file is part of Phobos, a Blender Add-On to edit robot models.
+
+Phobos is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License
+as published by the Free Software Foundation, either version 3
+of the License, or (at your option) any later version.
+
+Phobos is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Phobos.  If not, see <http://www.gnu.org/licenses/>.
+
+File background.py
+
+Created on 27 Mar 2018
+
+For a background export, a copy of the current state of the .blend file is saved next to it
+(so relative paths stay valid) and opened by a `blender --background` process, which derives
+and exports one model. The worker reports its progress as JSON lines in a progress file,
+which is polled by the process that queued the export (see updateExports).
+"""
+
+import os
+import sys
+import json
+import tempfile
+import subprocess
+import bpy
+from bpy.app.handlers import persistent
+from phobos.phoboslog import log
+
+#: python expression run by the worker processes
+worker_expression = 'import phobos.io.background as background; background.runExport()'
+
+
+class BackgroundExport(object):
+    """The export of one model in a background Blender process.
+
+    The *state* of an export is one of 'queued', 'running', 'finished', 'failed' and
+    'cancelled'. *progress* (0 to 1) and *message* are updated by poll.
+    """
+
+    def __init__(self, rootname, snapshot, exportpath, progressfile):
+        self.rootname = rootname
+        self.snapshot = snapshot
+        self.exportpath = exportpath
+        self.progressfile = progressfile
+        self.process = None
+        self.state = 'queued'
+        self.progress = 0.
+        self.message = ''
+
+    @property
+    def active(self):
+        return self.state in ('queued', 'running')
+
+    def start(self):
+        """Starts the worker process."""
+        open(self.progressfile, 'w').close()
+        self.process = subprocess.Popen([bpy.app.binary_path, '--background', self.snapshot,
+                                         '--python-exit-code', '1',
+                                         '--python-expr', worker_expression,
+                                         '--', self.rootname, self.exportpath, self.progressfile],
+                                        stdout=subprocess.DEVNULL)
+        self.state = 'running'
+        log("Started background export of " + self.rootname + ".", "INFO")
+
+    def poll(self):
+        """Reads the progress reported by the worker and checks whether it is finished."""
+        if self.state != 'running':
+            return
+        with open(self.progressfile) as progressfile:
+            for line in progressfile:
+                try:
+                    report = json.loads(line)
+                except ValueError:
+                    # the worker is still writing the line
+                    break
+                self.progress = report.get('progress', self.progress)
+                self.message = report.get('message', self.message)
+                self.state = report.get('state', self.state)
+        if self.state == 'running' and self.process.poll() is not None:
+            self.state = 'failed'
+            self.message = "Worker exited with code " + str(self.process.returncode)
+        if self.state == 'finished':
+            log("Background export of " + self.rootname + " finished.", "INFO")
+        elif self.state == 'failed':
+            log("Background export of " + self.rootname + " failed: " + self.message, "ERROR")
+
+    def cancel(self):
+        """Cancels the export, terminating its worker."""
+        if self.state == 'running':
+            self.process.terminate()
+            self.process.wait()
+        if self.active:
+            self.state = 'cancelled'
+            log("Cancelled background export of " + self.rootname + ".", "WARNING")
+
+    def cleanup(self):
+        """Removes the progress file of the export."""
+        if os.path.isfile(self.progressfile):
+            os.remove(self.progressfile)
+
+
+#: all exports which are queued or running
+_exports = []
+
+#: whether the exports are polled by a modal operator, see startMonitoring
+_monitored = False
+
+
+def saveSnapshot():
+    """Saves a copy of the current state of the .blend file for the worker processes.
+
+    The copy is saved next to the .blend file, so that relative paths stay valid, or to the
+    temporary directory for files which have not been saved yet.
+
+    Returns:
+      str -- path of the snapshot
+
+    """
+    folder = os.path.dirname(bpy.data.filepath) if bpy.data.filepath else tempfile.gettempdir()
+    handle, snapshot = tempfile.mkstemp(suffix='.blend', prefix='.phobos_export_', dir=folder)
+    os.close(handle)
+    bpy.ops.wm.save_as_mainfile(filepath=snapshot, copy=True)
+    return snapshot
+
+
+def queueExports(roots, exportpath):
+    """Queues the export of the models of several roots, sharing one snapshot.
+
+    Args:
+      roots(list of bpy.types.Object): root objects of the models to export
+      exportpath(str): absolute path to export root
+
+    Returns:
+      list -- the BackgroundExport of every root
+
+    """
+    snapshot = saveSnapshot()
+    exports = [BackgroundExport(root.name, snapshot, exportpath,
+                                os.path.splitext(snapshot)[0] + '_{0}.progress'.format(i))
+               for i, root in enumerate(roots)]
+    _exports.extend(exports)
+    log("Queued {0} background exports.".format(len(exports)), "INFO")
+    return exports
+
+
+def updateExports(workers=1):
+    """Polls the running exports and starts queued ones while less than *workers* are running.
+
+    Snapshots and progress files of exports which are no longer active are removed.
+
+    Args:
+      workers(int): maximum number of worker processes
+
+    Returns:
+      list -- all exports which are still queued or running
+
+    """
+    for export in _exports:
+        export.poll()
+    running = sum(1 for export in _exports if export.state == 'running')
+    for export in _exports:
+        if running >= workers:
+            break
+        if export.state == 'queued':
+            export.start()
+            running += 1
+    _removeFinished()
+    return [export for export in _exports if export.active]
+
+
+def getExports():
+    """Returns all exports which are queued or running, without polling them."""
+    return [export for export in _exports if export.active]
+
+
+def cancelExports():
+    """Cancels all queued and running exports."""
+    for export in _exports:
+        export.cancel()
+    _removeFinished()
+
+
+def startMonitoring():
+    """Marks the exports as polled by the calling modal operator.
+
+    The operator has to call stopMonitoring when it ends, also if it fails.
+
+    Returns:
+      bool -- False if the exports are already polled by another operator
+
+    """
+    global _monitored
+    if _monitored:
+        return False
+    _monitored = True
+    return True
+
+
+def stopMonitoring():
+    """Marks the exports as no longer polled, see startMonitoring."""
+    global _monitored
+    _monitored = False
+
+
+@persistent
+def cancelExportsHandler(dummy):
+    """Cancels all exports before another file is loaded, which ends the polling operator."""
+    cancelExports()
+    stopMonitoring()
+
+
+def _removeFinished():
+    """Removes the exports which are no longer active, and snapshots no export uses anymore."""
+    finished = [export for export in _exports if not export.active]
+    for export in finished:
+        _exports.remove(export)
+        export.cleanup()
+    snapshots = set(export.snapshot for export in _exports)
+    for snapshot in set(export.snapshot for export in finished) - snapshots:
+        if os.path.isfile(snapshot):
+            os.remove(snapshot)
+
+
+def _report(progressfile, **report):
+    """Appends a progress report of the worker to the progress file."""
+    with open(progressfile, 'a') as output:
+        output.write(json.dumps(report) + '\n')
+
+
+def runExport():
+    """Runs the export of a background worker, see BackgroundExport.start.
+
+    The name of the root object, the export path and the progress file are read from the
+    command line arguments after '--'.
+
+    Returns:
+
+    """
+    rootname, exportpath, progressfile = sys.argv[sys.argv.index('--') + 1:][:3]
+    try:
+        if not hasattr(bpy.types.Scene, 'phobosexportsettings'):
+            import addon_utils
+            addon_utils.enable('phobos')
+        import phobos.model.models as models
+        import phobos.utils.io as ioUtils
+        import phobos.utils.jobs as jobs
+
+        root = bpy.data.objects[rootname]
+        graph = jobs.JobGraph()
+        model = graph.add(root.name + ' derive', models.deriveModelDictionary,
+                          (root, '', [], True), mainthread=True, stage='derive')
+        ioUtils.addModelExportJobs(graph, model, exportpath, label=root.name)
+        _report(progressfile, progress=0., message=rootname + ' derive')
+        ioUtils.runExportJobs(graph, lambda finished, total, name: _report(
+            progressfile, progress=finished / total, message=name))
+    except Exception as exception:
+        _report(progressfile, state='failed', message=str(exception))
+        raise
+    _report(progressfile, state='finished', progress=1.)
+
+
+def register():
+    bpy.app.handlers.load_pre.append(cancelExportsHandler)
+
+
+def unregister():
+    bpy.app.handlers.load_pre.remove(cancelExportsHandler)
@@ -4,7 +4,7 @@
 """
 .. module:: phobos.export.heightmap
     :platform: Unix, Windows, Mac
-    :synopsis: TODO: INSERT TEXT HERE
+    :synopsis: Exports heightmap entities as images or tiled meshes
 
 .. moduleauthor:: Ole Schwiegert
 
@@ -32,6 +32,7 @@ Created on 12 Sep 2016
 
 import os
 import shutil
+import numpy
 import bpy
 import phobos.model.models as models
 import phobos.utils.selection as sUtils
@@ -42,15 +43,176 @@ from phobos.phoboslog import log
 # information for structure export
 structure_subfolder = "heightmaps"
 
+#: mesh types the tiles can be written in
+tile_mesh_types = ('obj', 'stl')
+
+
+def readHeightmapImage(image):
+    """Returns the intensities of an image as 2D array.
+
+    The first row of the array is the bottom row of the image, as in Blender's pixel buffer.
+
+    Args:
+      image(bpy.types.Image): the heightmap image
+
+    Returns:
+      numpy.ndarray -- rows x columns array of intensities in [0, 1]
+
+    """
+    width, height = image.size
+    pixels = numpy.array(image.pixels[:], dtype=numpy.float32)
+    pixels = pixels.reshape((height, width, image.channels))
+    if image.channels >= 3:
+        return pixels[:, :, :3].mean(axis=2)
+    return pixels[:, :, 0]
+
+
+def heightmapVertices(heights, transform, strength, midlevel=0.5):
+    """Returns the vertices of a displaced grid spanning the default plane from -1 to 1.
+
+    The grid has one vertex per sample of *heights*, displaced along the z-axis as done by the
+    heightmap's displace modifier, and is transformed by *transform* afterwards.
+
+    Args:
+      heights(numpy.ndarray): rows x columns array of intensities
+      transform(numpy.ndarray): 4x4 transform of the plane
+      strength(float): strength of the displacement
+      midlevel(float): intensity which is not displaced (Default value = 0.5)
+
+    Returns:
+      numpy.ndarray -- rows x columns x 3 array of vertices
+
+    """
+    rows, columns = heights.shape
+    vertices = numpy.empty((rows, columns, 3))
+    vertices[:, :, 0] = numpy.linspace(-1., 1., columns)[None, :]
+    vertices[:, :, 1] = numpy.linspace(-1., 1., rows)[:, None]
+    vertices[:, :, 2] = strength * (heights - midlevel)
+    return numpy.dot(vertices, transform[:3, :3].T) + transform[:3, 3]
+
+
+def gridFaces(rows, columns):
+    """Returns the counter-clockwise triangles of a regular grid of vertices.
+
+    Args:
+      rows(int): number of vertex rows
+      columns(int): number of vertex columns
+
+    Returns:
+      numpy.ndarray -- F x 3 array of zero-based vertex indices
+
+    """
+    indices = numpy.arange(rows * columns).reshape((rows, columns))
+    a, b = indices[:-1, :-1], indices[:-1, 1:]
+    c, d = indices[1:, 1:], indices[1:, :-1]
+    return numpy.concatenate((numpy.stack((a, b, c), axis=-1).reshape((-1, 3)),
+                              numpy.stack((a, c, d), axis=-1).reshape((-1, 3))))
+
+
+def _tileSamples(start, stop, step):
+    """Returns the sample indices from start to stop (inclusive) with the given step."""
+    samples = numpy.arange(start, stop, step)
+    return numpy.append(samples, stop)
+
+
+def writeTile(filepath, vertices, faces, meshtype):
+    """Writes a mesh given as arrays of vertices and triangles.
+
+    As with Blender's exporters, .obj files are converted to a Y-up frame, .stl files are
+    written in binary format.
+
+    Args:
+      filepath(str): path of the mesh file
+      vertices(numpy.ndarray): N x 3 array of vertices
+      faces(numpy.ndarray): F x 3 array of zero-based vertex indices
+      meshtype(str): 'obj' or 'stl'
+
+    Returns:
+
+    """
+    if meshtype == 'obj':
+        yup = numpy.array([[1., 0., 0.], [0., 0., 1.], [0., -1., 0.]])
+        with open(filepath, 'w') as objfile:
+            numpy.savetxt(objfile, numpy.dot(vertices, yup.T), fmt='v %.6f %.6f %.6f')
+            numpy.savetxt(objfile, faces + 1, fmt='f %d %d %d')
+    else:
+        triangles = vertices[faces]
+        normals = numpy.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+        normals /= numpy.maximum(numpy.linalg.norm(normals, axis=1), 1e-12)[:, None]
+        records = numpy.zeros(len(faces), dtype=[('normal', '<f4', 3), ('vertices', '<f4', (3, 3)),
+                                                 ('attributes', '<u2')])
+        records['normal'] = normals
+        records['vertices'] = triangles
+        with open(filepath, 'wb') as stlfile:
+            stlfile.write(b'\0' * 80)
+            stlfile.write(numpy.array(len(faces), dtype='<u4').tobytes())
+            stlfile.write(records.tobytes())
+
+
+def exportHeightmapTiles(heights, transform, strength, midlevel, outpath, name,
+                         tilesize=0, lods=1, meshtype='obj'):
+    """Exports a heightmap as a set of mesh tiles.
+
+    The samples of the heightmap are split into tiles of *tilesize* x *tilesize* quads, neighbouring
+    tiles share their border vertices. Every tile is written in *lods* levels of detail, each
+    level using every second sample of the previous one; the border samples of a tile are always
+    kept, so tiles of different levels still fit together at their corners.
+
+    Args:
+      heights(numpy.ndarray): rows x columns array of intensities
+      transform(numpy.ndarray): 4x4 transform of the heightmap plane relative to the entity
+      strength(float): strength of the displacement
+      midlevel(float): intensity which is not displaced
+      outpath(str): folder the tiles are written to
+      name(str): name of the heightmap, used as prefix for the tile files
+      tilesize(int): number of quads per tile edge, 0 for a single tile (Default value = 0)
+      lods(int): number of levels of detail (Default value = 1)
+      meshtype(str): 'obj' or 'stl' (Default value = 'obj')
+
+    Returns:
+      list -- one manifest entry per tile with its grid index, bounds and files
+
+    """
+    vertices = heightmapVertices(heights, transform, strength, midlevel)
+    rows, columns = heights.shape
+    if tilesize <= 0:
+        tilesize = max(rows, columns) - 1
+    tiles = []
+    for row in range(0, max(rows - 1, 1), tilesize):
+        for column in range(0, max(columns - 1, 1), tilesize):
+            rowstop = min(row + tilesize, rows - 1)
+            columnstop = min(column + tilesize, columns - 1)
+            tilevertices = vertices[row:rowstop + 1, column:columnstop + 1].reshape((-1, 3))
+            tile = {'row': row // tilesize, 'column': column // tilesize,
+                    'min': tilevertices.min(axis=0).tolist(),
+                    'max': tilevertices.max(axis=0).tolist(),
+                    'lods': []}
+            for lod in range(lods):
+                # stop once the previous level only consisted of the tile's corners
+                if lod and 2 ** (lod - 1) >= max(rowstop - row, columnstop - column):
+                    break
+                rowsamples = _tileSamples(row, rowstop, 2 ** lod)
+                columnsamples = _tileSamples(column, columnstop, 2 ** lod)
+                filename = '{0}_{1}_{2}_lod{3}.{4}'.format(name, tile['row'], tile['column'],
+                                                           lod, meshtype)
+                writeTile(os.path.join(outpath, filename),
+                          vertices[numpy.ix_(rowsamples, columnsamples)].reshape((-1, 3)),
+                          gridFaces(len(rowsamples), len(columnsamples)), meshtype)
+                tile['lods'].append(os.path.join(structure_subfolder, filename))
+            tiles.append(tile)
+    return tiles
+
 
 def deriveEntity(entity, outpath):
     """This function handles a heightmap entity in a scene to export it
 
+    Depending on the export settings, the heightmap is either exported as its source image with
+    the dimensions of the heightmap, or as a set of mesh tiles generated from the image (see
+    exportHeightmapTiles). In the latter case, the entry lists the tiles as *tiles*.
+
     Args:
-      smurf(bpy.types.Object): The heightmap root object.
+      entity(bpy.types.Object): The heightmap root object.
       outpath(str): The path to export to.
-      savetosubfolder(bool): If True data will be exported into subfolders.
-      entity: 
 
     Returns:
       dict - An entry for the scenes entitiesList
@@ -65,52 +227,43 @@ def deriveEntity(entity, outpath):
     log("Exporting " + heightmap["entity/name"] + " as a heightmap entity", "INFO")
     entitypose = models.deriveObjectPose(heightmap)
     heightmapMesh = sUtils.getImmediateChildren(heightmap)[0]
-    if bpy.data.window_managers[0].heightmapMesh:
-        exMesh = heightmapMesh.to_mesh(bpy.context.scene, True, "PREVIEW")
-        exMesh.name = "hm_" + heightmap["entity/name"]
-        oldMesh = heightmapMesh.data
-        heightmapMesh.data = exMesh
-        heightmapMesh.modifiers["displace_heightmap"].show_render = False
-        heightmapMesh.modifiers["displace_heightmap"].show_viewport = False
-        # CHECK are the heightmaps exported to the right directory?
-        if bpy.data.window_managers[0].useObj:
-            ioUtils.exportObj(heightmap_outpath, heightmapMesh)
-            filename = os.path.join("heightmaps", exMesh.name + ".obj")
-        elif bpy.data.window_managers[0].useStl:
-            ioUtils.exportStl(heightmap_outpath, heightmapMesh)
-            filename = os.path.join("heightmaps", exMesh.name + ".stl")
-        elif bpy.data.window_managers[0].useDae:
-            ioUtils.exportDae(heightmap_outpath, heightmapMesh)
-            filename = os.path.join("heightmaps", exMesh.name + ".dae")
-        else:
-            log("No mesh export type checked! Aborting heightmap export.", "ERROR")
-            return {}
-        heightmapMesh.modifiers["displace_heightmap"].show_render = True
-        heightmapMesh.modifiers["displace_heightmap"].show_viewport = True
-        heightmapMesh.data = oldMesh
-        bpy.data.meshes.remove(exMesh)
-        entry = {"name": heightmap["entity/name"],
-                 "type": "mesh",
-                 "file": filename,
-                 "anchor": heightmap["anchor"] if "anchor" in heightmap else "none",
-                 "position": entitypose["translation"],
-                 "rotation": entitypose["rotation_quaternion"]
-                 }
+    displace = heightmapMesh.modifiers["displace_heightmap"]
+    image = displace.texture.image
+    expsettings = ioUtils.getExpSettings()
+    entry = {"name": heightmap["entity/name"],
+             "anchor": heightmap["anchor"] if "anchor" in heightmap else "none",
+             "position": entitypose["translation"],
+             "rotation": entitypose["rotation_quaternion"]
+             }
 
+    if expsettings.heightmapMesh:
+        meshtype = ioUtils.getOutputMeshtype()
+        if meshtype not in tile_mesh_types:
+            log("Heightmap tiles can not be written as " + meshtype + ", using obj instead.",
+                "WARNING")
+            meshtype = 'obj'
+        transform = numpy.array(heightmap.matrix_world.inverted() * heightmapMesh.matrix_world)
+        tiles = exportHeightmapTiles(readHeightmapImage(image), transform, displace.strength,
+                                     displace.mid_level, heightmap_outpath,
+                                     "hm_" + heightmap["entity/name"],
+                                     expsettings.heightmapTileSize, expsettings.heightmapLODs,
+                                     meshtype)
+        log("Exported heightmap as {0} tiles.".format(len(tiles)), "DEBUG")
+        entry.update({"type": "mesh", "tiles": tiles})
+        if len(tiles) == 1:
+            entry["file"] = tiles[0]['lods'][0]
     else:
-        imagepath = os.path.abspath(os.path.join(os.path.split(bpy.data.filepath)[0], heightmap["image"]))
+        imagepath = bpy.path.abspath(image.filepath)
         shutil.copy2(imagepath, heightmap_outpath)
-        entry = {"name": heightmap["entity/name"],
-                 "type": "heightmap",
-                 "file": os.path.join("heightmaps", os.path.basename(imagepath)),
-                 "anchor": heightmap["anchor"] if "anchor" in heightmap else "none",
-                 "width": heightmapMesh.dimensions[1],
-                 "length": heightmapMesh.dimensions[0],
-                 "height": heightmapMesh.modifiers["displace_heightmap"].strength,
-                 "position": entitypose["translation"],
-                 "rotation": entitypose["rotation_quaternion"]
-                 }
+        entry.update({"type": "heightmap",
+                      "file": os.path.join(structure_subfolder, os.path.basename(imagepath)),
+                      "width": heightmapMesh.dimensions[1],
+                      "length": heightmapMesh.dimensions[0],
+                      "height": displace.strength
+                      })
     return entry
 
-# information for the registration in the exporter
-entity_type_name = 'heightmap'
+
+# registering import/export functions of types with Phobos
+entity_type_dict = {'heightmap': {'derive': deriveEntity}
+                    }
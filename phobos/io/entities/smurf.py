@@ -86,67 +86,14 @@ def deriveEntity(root, outpath):
                     shutil.copytree(fullpath, os.path.join(smurf_outpath, filename))
         """
     else:
-        modelpath = os.path.join(outpath, root['modelname'], 'smurf')
+        # entities of the same model and version share the exported model files
+        modelpath = os.path.join(outpath, ioUtils.getModelFolderName(root), 'smurf')
         # TODO why the spacing between the paths?
         log("Scene paths: " + outpath + ' ' + modelpath, "DEBUG")
         entity['file'] = os.path.join(os.path.relpath(modelpath, os.path.dirname(outpath)), root['modelname']+".smurf")
     return entity
 
 
-def gatherAnnotations(model):
-    """Gathers custom properties annotating elements of the robot
-    across the model. These annotations were created in the model.py
-    module and are marked with a leading '$'.
-
-    Args:
-      model(dict): The robot model dictionary.
-
-    Returns:
-      dict -- A dictionary of the gathered annotations.
-
-    """
-    annotations = {}
-    elementlist = []
-    types = ('links', 'joints', 'sensors', 'motors', 'controllers', 'materials')
-    # gather information from directly accessible types
-    for objtype in types:
-        for elementname in model[objtype]:
-            tmpdict = model[objtype][elementname]
-            tmpdict['temp_type'] = objtype[:-1]
-            elementlist.append(tmpdict)
-    # add information from types hidden in links
-    for linkname in model['links']:
-        for objtype in ('collision', 'visual'):
-            if objtype in model['links'][linkname]:
-                for elementname in model['links'][linkname][objtype]:
-                    tmpdict = model['links'][linkname][objtype][elementname]
-                    tmpdict['temp_type'] = objtype
-                    elementlist.append(tmpdict)
-        if 'inertial' in model['links'][linkname]:
-            tmpdict = model['links'][linkname]['inertial']
-            tmpdict['temp_type'] = 'inertial'
-            elementlist.append(tmpdict)
-    # loop through the list of annotated elements and categorize the data
-    for element in elementlist:
-        delkeys = []
-        for key in element.keys():
-            if key.startswith('$'):
-                category = key[1:]
-                if category not in annotations:
-                    annotations[category] = {}
-                if element['temp_type'] not in annotations[category]:
-                    annotations[category][element['temp_type']] = []
-                tmpdict = {k: element[key][k] for k in element[key]}
-                tmpdict['name'] = element['name']
-                annotations[category][element['temp_type']].append(tmpdict)
-                delkeys.append(key)
-        delkeys.append('temp_type')
-        for key in delkeys:
-            if key in element:
-                del element[key]
-    return annotations
-
-
 def deriveRefinedCollisionData(model):
     """This function collects all collision bitmasks in a given model.
 
@@ -277,8 +224,8 @@ def exportSmurf(model, path):
     urdf_path = '../urdf/'
     urdf_filename = model['name'] + '.urdf'
 
-    # gather annotations and data from text files
-    annotationdict = gatherAnnotations(model)
+    # annotations were already sorted by category and element type during derivation
+    annotationdict = model.get('annotations', {})
     for category in annotationdict:
         # TODO use os.path?
         filenames[category] = model['name'] + '_' + category + '.yml'
@@ -286,9 +233,9 @@ def exportSmurf(model, path):
         exportdata[category] = True
 
     customdatalist = []
-    for text in bpy.data.texts:
-        if text.name.startswith(model['name']+'::'):
-            dataname = text.name.split('::')[-1]
+    for textname in sorted(ioUtils.getModelTexts(model['name'])):
+        if textname.startswith(model['name']+'::'):
+            dataname = textname.split('::')[-1]
             customdatalist.append(dataname)
             # TODO use os.path?
             filenames[dataname] = model['name'] + '_' + dataname + '.yml'
@@ -308,7 +255,7 @@ def exportSmurf(model, path):
         op.write('# created with Phobos ' + defs.version + ' - ' + defs.repository + '\n\n')
         op.write("SMURF version: " + defs.version + "\n")
         op.write("modelname: " + model['name'] + "\n")
-        op.write(yaml.dump(modeldata, default_flow_style=False))
+        op.write(yaml.dump(modeldata, default_flow_style=False, Dumper=ioUtils.YAMLDumper))
 
     # TODO delete me?
     # #write semantics (SRDF information in YML format)
@@ -339,7 +286,7 @@ def exportSmurf(model, path):
             op.write('#state' + infostring)
             op.write("modelname: " + model['name'] + '\n')
             # TODO am I still needed?
-            op.write(yaml.dump(states))  # , default_flow_style=False))
+            op.write(yaml.dump(states, Dumper=ioUtils.YAMLDumper))  # , default_flow_style=False))
 
     # write materials, sensors, motors & controllers
     for data in ['materials', 'sensors', 'motors', 'controllers', 'lights']:
@@ -347,7 +294,7 @@ def exportSmurf(model, path):
             with open(os.path.join(path, filenames[data]), 'w') as op:
                 op.write('#' + data + infostring)
                 op.write(yaml.dump(sort_for_yaml_dump({data: list(model[data].values())}, data),
-                                   default_flow_style=False))
+                                   default_flow_style=False, Dumper=ioUtils.YAMLDumper))
                 # TODO delete me?
                 #op.write(yaml.dump({data: list(model[data].values())}, default_flow_style=False))
 
@@ -358,13 +305,14 @@ def exportSmurf(model, path):
             # TODO delete me?
             #op.write(yaml.dump({'collision': list(bitmasks.values())}, default_flow_style=False))
             op.write(yaml.dump({'collision': [collisiondata[key] for key in sorted(collisiondata.keys())]},
-                               default_flow_style=False))
+                               default_flow_style=False, Dumper=ioUtils.YAMLDumper))
 
     # write visual information (level of detail, ...)
     if exportdata['visuals']:
         with open(os.path.join(path, filenames['visuals']), 'w') as op:
             op.write('#visual data' + infostring)
-            op.write(yaml.dump({'visuals': list(lodsettings.values())}, default_flow_style=False))
+            op.write(yaml.dump({'visuals': list(lodsettings.values())}, default_flow_style=False,
+                               Dumper=ioUtils.YAMLDumper))
 
     # write additional information
     for category in annotationdict.keys():
@@ -373,7 +321,7 @@ def exportSmurf(model, path):
             for elementtype in annotationdict[category]:
                 outstring += elementtype + ':\n'
                 outstring += yaml.dump(annotationdict[category][elementtype],
-                                       default_flow_style=False) + "\n"
+                                       default_flow_style=False, Dumper=ioUtils.YAMLDumper) + "\n"
             with open(os.path.join(path, filenames[category]), 'w') as op:
                 op.write(outstring)
 
@@ -382,13 +330,15 @@ def exportSmurf(model, path):
         if exportdata[data]:
             with open(os.path.join(path, filenames[data]), 'w') as op:
                 op.write('#' + data + infostring)
-                op.write(yaml.dump({data: list(model[data].values())}, default_flow_style=False))
+                op.write(yaml.dump({data: list(model[data].values())}, default_flow_style=False,
+                                   Dumper=ioUtils.YAMLDumper))
 
     # write submechanisms
     if model['submechanisms']:
         with open(os.path.join(path, filenames['submechanisms']), 'w') as op:
             op.write('#submechanisms' + infostring)
-            op.write(yaml.dump({'submechanisms': model['submechanisms']}))#, default_flow_style=False))
+            op.write(yaml.dump({'submechanisms': model['submechanisms']},
+                               Dumper=ioUtils.YAMLDumper))#, default_flow_style=False))
 
     # TODO delete me?
     ## write custom yml files
@@ -500,5 +450,6 @@ def exportSmurf(model, path):
 # registering import/export functions of types with Phobos
 entity_type_dict = {'smurf': {'export': exportSmurf,
                               'derive': deriveEntity,
-                              'extensions': ('smurf',)}
+                              'extensions': ('smurf',),
+                              'threadsafe': True}
                     }
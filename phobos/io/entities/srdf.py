@@ -30,10 +30,65 @@ File srdf.py
 Created on Nov 8 2016
 """
 
-import itertools
 import os
+import numpy
 import xml.etree.ElementTree as ET
-from phobos.utils.io import l2str, xmlline, indent, xmlHeader
+import phobos.defs as defs
+import phobos.model.collisions as collisions
+from phobos.phoboslog import log
+from phobos.utils.io import l2str, xmlline, indent, xmlHeader, getExpSettings
+
+
+def deriveCollisionExclusives(model, samples=0):
+    """Returns the sorted list of link pairs for which collisions are disabled.
+
+    Two links are collision-exclusive if their collision bitmasks share no bit. The test is done
+    for all pairs at once by broadcasting the bitmask vector of the links against itself. Links
+    without a 'collision_bitmask' are not considered. Additionally, every pair of parent and
+    child link connected by a joint is added, as these links touch at their joint anyway.
+
+    If *samples* is provided, the pairs found by sampling random joint configurations (see
+    phobos.model.collisions.deriveDisabledCollisions) are added as well.
+
+    Args:
+      model(dict): a robot model dictionary.
+      samples(int, optional): number of configurations to sample (Default value = 0)
+
+    Returns:
+      list -- sorted list of tuples (link1, link2, reason) with link1 < link2
+
+    """
+    linknames = sorted(model['links'].keys())
+    linkindices = {name: i for i, name in enumerate(linknames)}
+    pairs = {}
+
+    # pairwise bitmask test
+    masked = [name for name in linknames if 'collision_bitmask' in model['links'][name]]
+    if len(masked) > 1:
+        bitmasks = [model['links'][name]['collision_bitmask'] for name in masked]
+        # bitmasks wider than 64 bits are compared as Python integers
+        bitmasks = numpy.array(bitmasks, dtype=numpy.uint64 if max(bitmasks) < 2**64 else object)
+        exclusive = numpy.triu((bitmasks[:, None] & bitmasks[None, :]) == 0, k=1)
+        for i, j in zip(*numpy.nonzero(exclusive)):
+            pairs[(masked[i], masked[j])] = 'User'
+
+    # pairs which never or always collide in sampled configurations
+    if samples > 0:
+        pairs.update(collisions.deriveDisabledCollisions(model, samples=samples))
+
+    # parent-child adjacency from the joints
+    for joint in model['joints'].values():
+        try:
+            parent, child = joint['parent'], joint['child']
+        except KeyError:
+            continue
+        if parent not in linkindices or child not in linkindices or parent == child:
+            continue
+        pair = (parent, child) if linkindices[parent] < linkindices[child] else (child, parent)
+        pairs[pair] = 'Adjacent'
+
+    return [(model['links'][pair[0]]['name'], model['links'][pair[1]]['name'], pairs[pair])
+            for pair in sorted(pairs.keys())]
 
 
 def exportSRDF(model, path, mesh_format=''):
@@ -115,128 +170,204 @@ def exportSRDF(model, path, mesh_format=''):
             output.append(indent * 2 + '<link_sphere_approximation link="' + model['links'][link]['name'] + '">\n')
             output.append(xmlline(3, 'sphere', ('center', 'radius'), ('0.0 0.0 0.0', '0')))
             output.append(indent * 2 + '</link_sphere_approximation>\n\n')
-    # calculate collision-exclusive links
-    collisionExclusives = []
-    for combination in itertools.combinations(model['links'], 2):
-        link1 = model['links'][combination[0]]
-        link2 = model['links'][combination[1]]
-        # TODO: we might want to automatically add parent/child link combinations
-        try:
-            if link1['collision_bitmask'] & link2['collision_bitmask'] == 0:
-                # TODO delete me?
-                #output.append(xmlline(2, 'disable_collisions', ('link1', 'link2'), (link1['name'], link2['name'])))
-                collisionExclusives.append((link1['name'], link2['name']))
-        except KeyError:
-            pass
+    # disable collisions between collision-exclusive and adjacent links
+    for link1, link2, reason in deriveCollisionExclusives(model,
+                                                         getExpSettings().srdfCollisionSamples):
+        output.append(xmlline(2, 'disable_collisions', ('link1', 'link2', 'reason'), (link1, link2, reason)))
+    output.append(indent + '</robot>\n')
     with open(os.path.join(path, model['name'] + '.srdf'), 'w') as outputfile:
         outputfile.write(''.join(output))
 
 
-def parseSRDFModel(self, robot):
-    collision_Exclusives = self.buildCollisionExclusives()
-    collision_Dic = self.buildCollisionDictionary(collision_Exclusives, robot)
-    collision_Groups = self.buildCollisionGroups(collision_Dic)
-    robot = self.buildBitmasks(collision_Groups, robot)
-    return robot
+def findSRDF(urdfpath, modelname):
+    """Returns the path of the SRDF file belonging to a URDF file, if there is one.
+
+    The SRDF is looked for next to the URDF file and in the *srdf* folder of a structured
+    export.
+
+    Args:
+      urdfpath(str): path of the URDF file
+      modelname(str): name of the model
+
+    Returns:
+      str -- path of the SRDF file, None if there is none
+
+    """
+    folder = os.path.dirname(urdfpath)
+    for filepath in (os.path.splitext(urdfpath)[0] + '.srdf',
+                     os.path.join(folder, modelname + '.srdf'),
+                     os.path.join(folder, '..', 'srdf', modelname + '.srdf')):
+        if os.path.isfile(filepath):
+            return filepath
+    return None
+
+
+def parseSRDFModel(filepath, robot, maxbits=None):
+    """Assigns collision bitmasks to the links of a robot model according to the
+    <disable_collisions> entries of an SRDF file.
+
+    Pass the number of bits the target supports as *maxbits*, e.g.
+    phobos.defs.collision_bitmask_bits for models built in Blender.
+
+    Args:
+      filepath(str): path of the SRDF file
+      robot(dict): robot model dictionary to add the bitmasks to
+      maxbits(int, optional): maximum number of bits supported by the target (Default value = None)
+
+    Returns:
+      dict -- the robot model dictionary
 
+    """
+    collision_exclusives = buildCollisionExclusives(filepath)
+    collision_dict = buildCollisionDictionary(collision_exclusives, robot)
+    collision_groups = buildCollisionGroups(sorted(robot['links'].keys()), collision_dict)
+    return buildBitmasks(collision_groups, robot, maxbits)
+
+
+def buildBitmasks(collision_groups, robot, maxbits=None):
+    """Sets the collision bitmasks of all links from a list of collision groups.
+
+    Every group is represented by one bit, which is set in the bitmask of all collision
+    elements of the links in the group. If the target format supports fewer bits than there
+    are groups, the surplus groups are dropped and an error is logged.
+
+    Args:
+      collision_groups(list): list of sets of link names
+      robot(dict): robot model dictionary
+      maxbits(int, optional): maximum number of bits supported by the target (Default value = None)
+
+    Returns:
+      dict -- the robot model dictionary
 
-def buildBitmasks(self, collision_Groups, robot):
-    bits = len(collision_Groups)
-    if bits > 20:
-        # CHECK this was moved to logging. Is it printed twice?
-        print("The Blender bitmask is not capable of more than 20 bit. The bitmask will be cutted!")
-        bits = 20
+    """
+    bits = len(collision_groups)
+    if maxbits is not None and bits > maxbits:
+        log("The collision groups require {0} bits, but only {1} are supported. ".format(
+            bits, maxbits) + "Collisions covered by the remaining groups are dropped.", "ERROR")
+        bits = maxbits
+    bitmasks = {link: 0 for link in robot['links']}
+    for i in range(bits):
+        for link in collision_groups[i]:
+            bitmasks[link] |= 1 << i
     for link in robot['links']:
-        for i in range(0, bits):
-            if link in collision_Groups[i]:
-                for coll in robot['links'][link]['collision']:
-                    try:
-                        robot['links'][link]['collision'][coll]['bitmask'] += 2**i
-                    except KeyError:
-                        robot['links'][link]['collision'][coll]['bitmask'] = 2**i
+        for coll in robot['links'][link]['collision']:
+            robot['links'][link]['collision'][coll]['bitmask'] = bitmasks[link]
+        robot['links'][link]['collision_bitmask'] = bitmasks[link]
     return robot
 
 
-def buildCollisionExclusives(self):
-    print("\nParsing SRDF extensions from", self.filepath)
-    self.tree = ET.parse(self.filepath)
-    self.root = self.tree.getroot()
+def buildCollisionExclusives(filepath):
+    """Returns the link pairs listed as <disable_collisions> in an SRDF file.
+
+    Args:
+      filepath(str): path of the SRDF file
+
+    Returns:
+      list -- list of tuples of link names
+
+    """
+    log("Parsing SRDF extensions from " + filepath, "INFO")
+    root = ET.parse(filepath).getroot()
+    return [(disabled_coll.attrib['link1'], disabled_coll.attrib['link2'])
+            for disabled_coll in root.iter('disable_collisions')]
+
+
+def buildCollisionDictionary(collision_exclusives, robot):
+    """Returns a dictionary of the links each link must not collide with.
+
+    Pairs of links connected by a joint are skipped, as collisions between parents and children
+    are not considered anyway and leaving them out allows for fewer collision groups.
 
-    collision_Exclusives = []
-    for disabled_coll in self.root.iter('disable_collisions'):
-        pair = (disabled_coll.attrib['link1'], disabled_coll.attrib['link2'])
-        collision_Exclusives.append(pair)
-        # TODO delete me?
-        #print("Append ", pair, " to collision Exclusives")
-    return collision_Exclusives
+    Args:
+      collision_exclusives(list): list of tuples of link names
+      robot(dict): robot model dictionary
 
+    Returns:
+      dict -- sets of excluded link names per link name
 
-def buildCollisionDictionary(self, collision_exclusives, robot):
+    """
+    adjacent = set()
+    for joint in robot['joints'].values():
+        adjacent.add((joint['parent'], joint['child']))
+        adjacent.add((joint['child'], joint['parent']))
     dic = {}
     for pair in collision_exclusives:
-        if 'root' in pair or (pair[0] != robot['joints'][pair[1]]['parent'] and pair[1] != robot['joints'][pair[0]]['parent']):
-            if pair[0] not in dic:
-                dic[pair[0]]=[]
-                dic[pair[0]].append(pair[1])
-            else:
-                if pair[1] not in dic[pair[0]]:
-                    dic[pair[0]].append(pair[1])
-            if pair[1] not in dic:
-                dic[pair[1]]=[]
-                dic[pair[1]].append(pair[0])
-            else:
-                if pair[0] not in dic[pair[1]]:
-                    dic[pair[1]].append(pair[0])
-        else:
-            pass
-            # TODO handle this somehow...
-            #print("Pair: ", pair, " not included")
-    print("Collision Dictionary:\n", dic)
+        if pair in adjacent or pair[0] == pair[1]:
+            continue
+        dic.setdefault(pair[0], set()).add(pair[1])
+        dic.setdefault(pair[1], set()).add(pair[0])
     return dic
 
 
-def checkGroup(self, group, colls):
-    cut = []
-    for elem in group:
-        if elem in colls:
-            cut.append(elem)
-    if len(cut) == len(group):
-        return cut
-    else:
-        return []
-
-
-def processGroup(self, group, link, colls):
-    if link in group:
-        for coll in colls:
-            if coll in group:
-                colls.remove(coll)
-    else:
-        cut = self.checkGroup(group, colls)
-        if len(cut) > 0:
-            group.append(link)
-            for l in cut:
-                colls.remove(l)
-
-
-def buildCollisionGroups(self, dic):
-    groups=[]
-    for link in dic:
-        # TODO remove me?
-        #print("Current link: ", link)
-        colls = dic[link]
-        # TODO remove me?
-        #print("Current colls: ", colls)
-        for group in groups:
-            # TODO remove me?
-            #print("Current group: ", group)
-            self.processGroup(group, link, colls)
-        while len(colls) > 0:
-            newgroup = [link, colls.pop()]
-            groups.append(newgroup)
-            self.processGroup(newgroup, link, colls)
-    print("Number of collision Groups: ", len(groups))
-    #print ("Collision Groups:\n", groups)
+def _popcount(bitset):
+    """Returns the number of bits set in an integer."""
+    return bin(bitset).count('1')
+
+
+def buildCollisionGroups(linknames, collision_dict):
+    """Computes a compact set of collision groups for a list of links.
+
+    Links collide if their bitmasks share a bit, thus every collision group (one bit) has to be
+    a set of links which may all collide with each other, and every pair of links which may
+    collide has to share at least one group. This is an edge clique cover of the graph of
+    allowed collisions, which is computed greedily: starting from an uncovered pair, links are
+    added to the group as long as they are allowed to collide with all of its members, preferring
+    links adding the most uncovered pairs. Adjacency is stored as integer bitsets, so the cover
+    scales to several hundred links with dense exclusion lists.
+
+    Args:
+      linknames(list): names of all links
+      collision_dict(dict): sets of excluded link names per link name
+
+    Returns:
+      list -- list of sets of link names, one per bit
+
+    """
+    indices = {name: i for i, name in enumerate(linknames)}
+    alllinks = (1 << len(linknames)) - 1
+    allowed = []
+    for i, name in enumerate(linknames):
+        excluded = 1 << i
+        for other in collision_dict.get(name, ()):
+            if other in indices:
+                excluded |= 1 << indices[other]
+        allowed.append(alllinks & ~excluded)
+    uncovered = list(allowed)
+
+    groups = []
+    order = sorted(range(len(linknames)), key=lambda i: -_popcount(allowed[i]))
+    for start in order:
+        while uncovered[start]:
+            # start with the uncovered partner having the most uncovered pairs left
+            partners = uncovered[start]
+            partner = max((j for j in range(len(linknames)) if partners >> j & 1),
+                          key=lambda j: _popcount(uncovered[j]))
+            members = (1 << start) | (1 << partner)
+            candidates = allowed[start] & allowed[partner]
+            while candidates:
+                best, gain = None, 0
+                bits = candidates
+                while bits:
+                    low = bits & -bits
+                    j = low.bit_length() - 1
+                    bits ^= low
+                    jgain = _popcount(uncovered[j] & members)
+                    if jgain > gain:
+                        best, gain = j, jgain
+                if best is None:
+                    break
+                members |= 1 << best
+                candidates &= allowed[best]
+            group = set()
+            bits = members
+            while bits:
+                low = bits & -bits
+                j = low.bit_length() - 1
+                bits ^= low
+                uncovered[j] &= ~members
+                group.add(linknames[j])
+            groups.append(group)
+    log("Number of collision groups (bits) required: " + str(len(groups)), "INFO")
     return groups
 
 
@@ -1,16 +1,82 @@
 #!/usr/bin/python
 # coding=utf-8
 
+import os
+from concurrent.futures import ThreadPoolExecutor
 from phobos.phoboslog import log
 import phobos.utils.selection as sUtils
 import phobos.utils.naming as nUtils
-from phobos.model.models import deriveModelDictionary
-from phobos.utils.io import exportModel
+import phobos.utils.io as ioUtils
+from phobos.io.entities.urdf import generateUrdf
+
+
+def sliceModel(model, linknames, name, rootlink=None):
+    """Returns the part of a derived model consisting of the given links.
+
+    The link dictionaries are shared with *model*, not copied. Joints are kept if their child
+    is part of the slice, except for the joint of *rootlink*. Materials and meshes are kept if
+    they are used by the visuals and collisions of the slice, the *users* of the materials are
+    counted anew.
+
+    Args:
+      model(dict): the derived model dictionary
+      linknames(list of str): names of the links to keep
+      name(str): name of the sliced model
+      rootlink(str, optional): name of the root link of the slice
+
+    Returns:
+      dict -- the sliced model
+
+    """
+    links = {linkname: model['links'][linkname] for linkname in linknames
+             if linkname in model['links']}
+    joints = {jointname: joint for jointname, joint in model['joints'].items()
+              if joint['child'] in links and joint['child'] != rootlink}
+
+    materials = {}
+    meshes = {}
+    for link in links.values():
+        for visual in link['visual'].values():
+            if 'material' in visual:
+                if visual['material'] in materials:
+                    materials[visual['material']]['users'] += 1
+                else:
+                    materials[visual['material']] = dict(model['materials'][visual['material']],
+                                                         users=1)
+        for element in list(link['visual'].values()) + list(link['collision'].values()):
+            geometry = element.get('geometry', {})
+            if geometry.get('type') == 'mesh' and geometry['filename'] in model['meshes']:
+                meshobj = model['meshes'][geometry['filename']]
+                meshes[geometry['filename']] = meshobj
+                for lod in getattr(meshobj, 'lod_levels', ()):
+                    if lod.object and lod.object.data.name in model['meshes']:
+                        meshes[lod.object.data.name] = lod.object
+
+    return {'name': name,
+            'date': model['date'],
+            'links': links,
+            'joints': joints,
+            'motors': {motorname: motor for motorname, motor in model['motors'].items()
+                       if motor.get('joint') in joints},
+            'materials': materials,
+            'meshes': meshes}
+
+
+def _writeFile(output):
+    """Writes a (filepath, text) tuple."""
+    filepath, text = output
+    with open(filepath, 'w') as outputfile:
+        outputfile.write(text)
 
 
 def exportSubmechanisms(model, path):
     """This function exports the submechanisms contained in a robot model.
 
+    Every submechanism is sliced from the model (see sliceModel) using the links of its
+    spanning tree and freeloaders, so no part of the model is derived again. The URDFs are
+    generated one after another and written in parallel, the meshes used by any submechanism
+    are exported once for all of them.
+
     Args:
       model(dict): The robot model to export
       path(str): The filepath to export the submechanisms data to
@@ -19,20 +85,36 @@ def exportSubmechanisms(model, path):
 
     """
     log("Phobos Submechanisms export: Creating submechanisms data at " + path, "INFO")
+    submodels = []
     for submechanism in model['submechanisms']:
         root = sUtils.getObjectByProperty('submechanism/name', submechanism['contextual_name'])
         linkobjs = [root] + root['submechanism/spanningtree']
         if 'submechanism/freeloader' in root:
             linkobjs += root['submechanism/freeloader']
 
-        objects = [o for link in linkobjs for o in link.children if o.phobostype in
-                   ['visual', 'collision', 'inertial']] + linkobjs
-        model = deriveModelDictionary(root, root['submechanism/name'], objects)
-        jointname = nUtils.getObjectName(root, 'joint')
-        if jointname in model['joints']:
-            del model['joints'][jointname]
-            log('Removed joint which is not part of submodel: ' + jointname, 'DEBUG')
-        exportModel(model, path, ['urdf'])
+        linknames = [nUtils.getObjectName(link, 'link') for link in linkobjs]
+        missing = [linkname for linkname in linknames if linkname not in model['links']]
+        if missing:
+            log("Links of submechanism " + root['submechanism/name'] + " not part of the " +
+                "exported model: " + ', '.join(missing), 'WARNING')
+        submodels.append(sliceModel(model, linknames, root['submechanism/name'],
+                                    nUtils.getObjectName(root, 'link')))
+
+    urdfpath = ioUtils.securepath(os.path.join(path, 'urdf'))
+    outputs = [(os.path.join(urdfpath, submodel['name'] + '.urdf'),
+                generateUrdf(submodel, urdfpath)) for submodel in submodels]
+    with ThreadPoolExecutor() as executor:
+        list(executor.map(_writeFile, outputs))
+    log("Wrote {0} submechanism URDFs to {1}".format(len(outputs), urdfpath), "INFO")
+
+    meshes = {}
+    materials = {}
+    for submodel in submodels:
+        meshes.update(submodel['meshes'])
+        materials.update(submodel['materials'])
+    ioUtils.exportMeshes(meshes, path)
+    if ioUtils.getExpSettings().exportTextures:
+        ioUtils.exportTextures(materials, path)
 
 
 # registering export functions of types with Phobos
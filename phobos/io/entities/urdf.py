@@ -31,12 +31,13 @@ import re
 import yaml
 import xml.etree.ElementTree as ET
 
-import bpy
 import mathutils
-from phobos.utils.io import l2str, xmlline, indent, xmlHeader
+from phobos.utils.io import l2str, xmlline, indent, xmlHeader, formatNumber
+import phobos.defs as defs
 import phobos.model.materials as materials
 import phobos.utils.general as gUtils
 import phobos.utils.io as ioUtils
+import phobos.io.entities.srdf as srdf
 from phobos.phoboslog import log
 
 
@@ -107,12 +108,30 @@ def exportUrdf(model, outpath):
     """
     log("Export URDF to " + outpath, "INFO")
     filename = path.join(outpath, model['name']+'.urdf')
+    output = generateUrdf(model, outpath)
+    with open(filename, 'w') as outputfile:
+        outputfile.write(output)
+    # FIXME: different joint transformations needed for fixed joints
+    log("Writing model data to " + filename, "INFO")
+
+
+def generateUrdf(model, outpath):
+    """Generates the URDF of a given model as string, see exportUrdf.
+
+    Args:
+      model(dict): Dictionary of the model to be exported as URDF.
+      outpath(str): The path the URDF is going to be written to, mesh paths are relative to it.
 
+    Returns:
+      str -- the URDF
+
+    """
     stored_element_order = None
     # CHECK test Windows path consistency
     order_file_name = model['name'] + '_urdf_order'
-    if order_file_name in bpy.data.texts:
-        stored_element_order = yaml.load(bpy.data.texts[order_file_name].as_string())
+    texts = ioUtils.getModelTexts(model['name'])
+    if order_file_name in texts:
+        stored_element_order = yaml.load(texts[order_file_name])
 
     output = [xmlHeader, indent + '<robot name="' + model['name'] + '">\n\n']
     # export link information
@@ -135,9 +154,9 @@ def exportUrdf(model, outpath):
                     output.append(xmlline(4, 'origin', ['xyz', 'rpy'],
                                           [l2str(link['inertial']['pose']['translation']),
                                            l2str(link['inertial']['pose']['rotation_euler'])]))
-                output.append(xmlline(4, 'mass', ['value'], [str(link['inertial']['mass'])]))
+                output.append(xmlline(4, 'mass', ['value'], [link['inertial']['mass']]))
                 output.append(xmlline(4, 'inertia', ['ixx', 'ixy', 'ixz', 'iyy', 'iyz', 'izz'],
-                                      [str(i) for i in link['inertial']['inertia']]))
+                                      link['inertial']['inertia']))
                 output.append(indent * 3 + '</inertial>\n')
             # visual object
             if link['visual']:
@@ -167,7 +186,7 @@ def exportUrdf(model, outpath):
                                 color = mat['diffuseColor']
                                 output.append(indent * 5 + '<color rgba="'
                                               + l2str([color[num] for num in ['r', 'g', 'b']])
-                                              + ' ' + str(mat["transparency"]) + '"/>\n')
+                                              + ' ' + formatNumber(mat["transparency"]) + '"/>\n')
                                 if 'diffuseTexture' in mat:
                                     output.append(indent * 5 + '<texture filename="'
                                                   + mat['diffuseTexture'] + '"/>\n')
@@ -258,16 +277,13 @@ def exportUrdf(model, outpath):
                 color = model['materials'][m]['diffuseColor']
                 transparency = model['materials'][m]['transparency'] if 'transparency' in model['materials'][m] else 0.0
                 output.append(indent * 3 + '<color rgba="' + l2str([color[num]
-                            for num in ['r', 'g', 'b']]) + ' ' + str(1.0 - transparency) + '"/>\n')
+                            for num in ['r', 'g', 'b']]) + ' ' + formatNumber(1.0 - transparency) + '"/>\n')
                 if 'diffuseTexture' in model['materials'][m]:
                     output.append(indent * 3 + '<texture filename="' + model['materials'][m]['diffuseTexture'] + '"/>\n')
                 output.append(indent * 2 + '</material>\n\n')
     # finish the export
     output.append(indent + '</robot>\n')
-    with open(filename, 'w') as outputfile:
-        outputfile.write(''.join(output))
-    # FIXME: different joint transformations needed for fixed joints
-    log("Writing model data to " + filename, "INFO")
+    return ''.join(output)
 
 
 def store_element_order(element_order, path):
@@ -619,6 +635,11 @@ def importUrdf(filepath):
     model['materials'] = {m['name']: m for m in materiallist}
         # TODO delete me?
         #element_order['materials'].append(m['name'])
+
+    # assign collision bitmasks from the disabled collisions of an accompanying SRDF
+    srdfpath = srdf.findSRDF(filepath, model['name'])
+    if srdfpath:
+        srdf.parseSRDFModel(srdfpath, model, defs.collision_bitmask_bits)
     return model
 
 
@@ -736,5 +757,6 @@ def parseJoint(joint):
 # registering export functions of types with Phobos
 entity_type_dict = {'urdf': {'export': exportUrdf,
                              'import': importUrdf,
-                             'extensions': ('urdf', 'xml')}
+                             'extensions': ('urdf', 'xml'),
+                             'threadsafe': True}
                     }
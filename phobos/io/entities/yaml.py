@@ -4,6 +4,7 @@ import yaml
 import os
 from datetime import datetime
 import phobos.defs as defs
+import phobos.utils.io as ioUtils
 from phobos.phoboslog import log
 
 
@@ -22,13 +23,18 @@ def exportYAML(model, path):
         outputfile.write('# YAML dump of robot model "' + model['name'] + '", ' + datetime.now().strftime(
             "%Y%m%d_%H:%M") + "\n")
         outputfile.write("# created with Phobos" + defs.version + " - https://github.com/dfki-ric/phobos\n\n")
+        # the mesh objects are Blender data, which must not be accessed by the export threads,
+        # so only the names of the meshes are written
+        modeldata = dict(model.items())
+        modeldata['meshes'] = sorted(model.get('meshes', {}))
         # TODO delete me?
         outputfile.write(yaml.dump(
-            model))  # default_flow_style=False))
+            modeldata, Dumper=ioUtils.YAMLDumper))  # default_flow_style=False))
         #last parameter prevents inline formatting for lists and dictionaries
 
 
 # registering export functions of types with Phobos
 entity_type_dict = {'yaml': {'export': exportYAML,
-                             'extensions': ('yaml', 'yml')}
+                             'extensions': ('yaml', 'yml'),
+                             'threadsafe': True}
                     }
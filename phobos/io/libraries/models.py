@@ -27,6 +27,12 @@ along with Phobos.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 import os
+import json
+import bisect
+import threading
+import xml.etree.ElementTree as ET
+import yaml
+import numpy
 import bpy
 import bpy.utils.previews
 import phobos.utils.naming as nUtils
@@ -42,11 +48,25 @@ model_data = {}
 model_previews = {}
 categories = set([])
 
+#: version of the library index file format
+INDEX_VERSION = 3
+
+# sorted (lower case name, category, model name) tuples of all models for prefix searches
+_searchindex = []
+
+# result of the last background scan, picked up by the main thread
+_scanlock = threading.Lock()
+_scanresult = None
+_scanthread = None
+
 
 def getModelListForEnumProperty(self, context):
     """Returns a list of (str, str, str) elements which contains the models
     contained in the currently selected model category.
-    If there are no model categories (i.e. '-') return ('-', '-', '-').
+    If there are no model categories (i.e. '-') or no models match the search, return
+    ('-', '-', '-').
+
+    The previews of a category are loaded when it is shown for the first time.
 
     Args:
       context: 
@@ -54,9 +74,18 @@ def getModelListForEnumProperty(self, context):
     Returns:
 
     """
+    collectLibraryScan()
     category = context.window_manager.category
-    if category == '-' or category == '':
+    if category == '-' or category == '' or category not in model_data:
         return [('-',) * 3]
+    if category not in model_previews:
+        loadCategoryPreviews(category)
+    if context.window_manager.modelsearch:
+        matches = set(modelname for modelcategory, modelname, metadata in
+                      queryModels(context.window_manager.modelsearch, category))
+        items = sorted(item for item in model_previews[category].enum_items if item[0] in matches)
+        # enum properties need at least one item
+        return items if items else [('-',) * 3]
     return sorted(model_previews[category].enum_items)
 
 
@@ -71,69 +100,431 @@ def getCategoriesForEnumProperty(self, context):
       If there are no categories return ('-', '-', '-').
 
     """
+    collectLibraryScan()
     if len(categories) == 0:
         return [('-',) * 3]
     return sorted([(item,) * 3 for item in categories])
 
 
-def compileModelList():
-    from bpy.props import EnumProperty
-    from bpy.types import WindowManager
-    # DOCU missing some docstring
-    log("Compiling model list from local library...", "INFO")
+def getLibraryIndexPath():
+    """Returns the path of the file the model library index is cached in."""
+    return os.path.join(bUtils.getPhobosConfigPath(), 'model_library.json')
 
-    # clear old preview collections
-    for previews in model_previews.values():
-        bpy.utils.previews.remove(previews)
-    model_previews.clear()
+
+def loadLibraryIndex(indexpath, rootpath):
+    """Loads the cached index of a model library.
+
+    Args:
+      indexpath(str): path of the index file
+      rootpath(str): path of the model library the index has to belong to
+
+    Returns:
+      dict -- the library index, an empty index if there is no valid index for rootpath
+
+    """
+    try:
+        with open(indexpath, 'r') as indexfile:
+            index = json.load(indexfile)
+        if index.get('version') == INDEX_VERSION and index.get('root') == rootpath:
+            return index
+    except (IOError, ValueError):
+        pass
+    return {'version': INDEX_VERSION, 'root': rootpath, 'categories': {}}
+
+
+def _originToMatrix(element):
+    """Returns the 4x4 transform of the origin tag of a URDF element."""
+    matrix = numpy.identity(4)
+    origin = element.find('origin')
+    if origin is None:
+        return matrix
+    roll, pitch, yaw = (float(v) for v in origin.get('rpy', '0 0 0').split())
+    cr, sr = numpy.cos(roll), numpy.sin(roll)
+    cp, sp = numpy.cos(pitch), numpy.sin(pitch)
+    cy, sy = numpy.cos(yaw), numpy.sin(yaw)
+    matrix[:3, :3] = [[cy * cp, cy * sp * sr - sy * cr, cy * sp * cr + sy * sr],
+                      [sy * cp, sy * sp * sr + cy * cr, sy * sp * cr - cy * sr],
+                      [-sp, cp * sr, cp * cr]]
+    matrix[:3, 3] = [float(v) for v in origin.get('xyz', '0 0 0').split()]
+    return matrix
+
+
+def _geometryExtent(geometry):
+    """Returns the half extents of a URDF geometry tag, zero for meshes."""
+    for shape in geometry:
+        if shape.tag == 'box':
+            return numpy.array([float(v) for v in shape.get('size').split()]) / 2
+        elif shape.tag == 'sphere':
+            return numpy.array([float(shape.get('radius'))] * 3)
+        elif shape.tag == 'cylinder':
+            radius = float(shape.get('radius'))
+            return numpy.array([radius, radius, float(shape.get('length')) / 2])
+    return numpy.zeros(3)
+
+
+def readURDFMetadata(urdfpath):
+    """Extracts summary information of a model from its URDF file.
+
+    The bounding box is computed in the zero configuration of the model from the link frames
+    and the primitive visual geometry; meshes only contribute their origin.
+
+    Args:
+      urdfpath(str): path of the URDF file
+
+    Returns:
+      dict -- number of links and joints, total mass and bounding box of the model
+
+    """
+    robot = ET.parse(urdfpath).getroot()
+    links = robot.findall('link')
+    joints = robot.findall('joint')
+    mass = sum(float(tag.get('value', 0)) for tag in robot.findall('link/inertial/mass'))
+
+    # link frames in the zero configuration
+    parents = {}
+    for joint in joints:
+        parents[joint.find('child').get('link')] = (joint.find('parent').get('link'),
+                                                   _originToMatrix(joint))
+    frames = {}
+    for link in links:
+        chain = []
+        name = link.get('name')
+        while name not in frames and name in parents and len(chain) <= len(links):
+            chain.append(name)
+            name = parents[name][0]
+        matrix = frames.get(name, numpy.identity(4))
+        frames.setdefault(name, matrix)
+        for name in reversed(chain):
+            matrix = numpy.dot(matrix, parents[name][1])
+            frames[name] = matrix
+
+    # corners of the visual geometry in the model frame
+    corners = numpy.array([[x, y, z] for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)])
+    points = [numpy.zeros((1, 3))]
+    for link in links:
+        frame = frames.get(link.get('name'), numpy.identity(4))
+        points.append(frame[None, :3, 3])
+        for visual in link.findall('visual'):
+            transform = numpy.dot(frame, _originToMatrix(visual))
+            geometry = visual.find('geometry')
+            extent = _geometryExtent(geometry) if geometry is not None else numpy.zeros(3)
+            points.append(numpy.dot(corners * extent, transform[:3, :3].T) + transform[:3, 3])
+    points = numpy.concatenate(points)
+    return {'links': len(links),
+            'joints': len(joints),
+            'mass': mass,
+            'bbox': [points.min(axis=0).tolist(), points.max(axis=0).tolist()]}
+
+
+def readSMURFTypes(smurfpath, modelname, category):
+    """Returns the types of all elements of a category (e.g. sensors) of an exported SMURF model.
+
+    Args:
+      smurfpath(str): path of the SMURF folder of the model
+      modelname(str): name of the model
+      category(str): the SMURF category, e.g. *sensors* or *submechanisms*
+
+    Returns:
+      list -- sorted list of the types occurring in the category
+
+    """
+    filepath = os.path.join(smurfpath, modelname + '_' + category + '.yml')
+    if not os.path.exists(filepath):
+        return []
+    with open(filepath, 'r') as ymlfile:
+        data = yaml.load(ymlfile) or {}
+    return sorted(set(str(element['type']) for element in data.get(category, [])
+                      if isinstance(element, dict) and 'type' in element))
+
+
+def readModelMetadata(modelpath, modelname):
+    """Extracts the metadata of a library model from its exported URDF and SMURF files.
+
+    Args:
+      modelpath(str): path of the model folder in the library
+      modelname(str): name of the model
+
+    Returns:
+      dict -- the metadata of the model, empty if neither URDF nor SMURF files exist
+
+    """
+    metadata = {}
+    urdfpath = os.path.join(modelpath, 'urdf', modelname + '.urdf')
+    if os.path.exists(urdfpath):
+        try:
+            metadata.update(readURDFMetadata(urdfpath))
+        except (ET.ParseError, AttributeError, ValueError) as error:
+            log("Could not read " + urdfpath + ": " + str(error), 'WARNING')
+    smurfpath = os.path.join(modelpath, 'smurf')
+    if os.path.isdir(smurfpath):
+        try:
+            metadata['sensors'] = readSMURFTypes(smurfpath, modelname, 'sensors')
+            metadata['submechanisms'] = readSMURFTypes(smurfpath, modelname, 'submechanisms')
+        except yaml.YAMLError as error:
+            log("Could not read SMURF files of " + modelname + ": " + str(error), 'WARNING')
+    return metadata
+
+
+#: files of a library model (relative to its folder, formatted with the model name) which
+#: the index is built from, see readModelMetadata
+model_files = ('blender/{0}.blend', 'urdf/{0}.urdf', 'smurf/{0}_sensors.yml',
+               'smurf/{0}_submechanisms.yml', 'thumbnails/{0}.png')
+
+
+def _modelSignature(modelpath, modelname):
+    """Returns the modification times of a model folder, its immediate subfolders and files.
+
+    The files are the ones listed in model_files, as re-exporting a model overwrites them in
+    place without changing the modification time of any folder. Missing files count as 0.
+    """
+    signature = [os.stat(modelpath).st_mtime]
+    for entry in sorted(os.scandir(modelpath), key=lambda entry: entry.name):
+        if entry.is_dir():
+            signature.append(entry.stat().st_mtime)
+    for filename in model_files:
+        filepath = os.path.join(modelpath, filename.format(modelname))
+        signature.append(os.stat(filepath).st_mtime if os.path.exists(filepath) else 0)
+    return signature
+
+
+def scanModelLibrary(rootpath, index, full=False):
+    """Updates the index of a model library with the contents of the library folder.
+
+    The model folders of all categories are listed on every scan, but a model is only inspected
+    again if the modification time of its folder, one of its subfolders or one of the files
+    the index is built from has changed, which is when its metadata is read again as well
+    (see readModelMetadata). Folders without a
+    Blender file are checked again on every scan, so models are found as soon as their export
+    is complete. With *full* set, all models are inspected again.
+
+    This function does not access Blender data and can thus run in a background thread, its
+    messages are logged once the main thread logs again.
+
+    Args:
+      rootpath(str): path of the model library
+      index(dict): the previous index as returned by loadLibraryIndex
+      full(bool, optional): ignore the modification times of the index (Default value = False)
+
+    Returns:
+      dict -- the updated index
+
+    """
+    oldcategories = {} if full else index['categories']
+    newcategories = {}
+    for categoryentry in os.scandir(rootpath):
+        # skip all non folders
+        if not categoryentry.is_dir():
+            continue
+        category = categoryentry.name
+        oldcategory = oldcategories.get(category, {'models': {}})
+        modelnames = [entry.name for entry in os.scandir(categoryentry.path) if entry.is_dir()]
+
+        models = {}
+        for modelname in modelnames:
+            modelpath = os.path.join(categoryentry.path, modelname)
+            try:
+                signature = _modelSignature(modelpath, modelname)
+            except OSError:
+                continue
+            model = oldcategory['models'].get(modelname)
+            if not model or model['signature'] != signature:
+                model = {'path': modelpath, 'signature': signature}
+                # check for valid blender savefile in the model folder
+                if not os.path.exists(os.path.join(modelpath, 'blender', modelname + '.blend')):
+                    continue
+                thumbnail = os.path.join(modelpath, 'thumbnails', modelname + '.png')
+                model['thumbnail'] = thumbnail if os.path.exists(thumbnail) else ''
+                model['metadata'] = readModelMetadata(modelpath, modelname)
+            models[modelname] = model
+        if models:
+            newcategories[category] = {'models': models}
+    return {'version': INDEX_VERSION, 'root': rootpath, 'categories': newcategories}
+
+
+def _scanInBackground(rootpath, indexpath, index, full):
+    """Thread target scanning the library and saving the index for pickup by the main thread."""
+    global _scanresult
+    try:
+        index = scanModelLibrary(rootpath, index, full)
+        with open(indexpath, 'w') as indexfile:
+            json.dump(index, indexfile)
+    except OSError as error:
+        index = None
+        log("Could not scan model library: " + str(error), 'ERROR')
+    with _scanlock:
+        _scanresult = index
+
+
+def collectLibraryScan():
+    """Applies the result of a finished background scan of the model library, if any.
+
+    Returns:
+      bool -- True if a new scan result has been applied
+
+    """
+    global _scanresult
+    with _scanlock:
+        index = _scanresult
+        _scanresult = None
+    if not index:
+        return False
+    _applyLibraryIndex(index)
+    log("Finished parsing model folder. Found {0} models.".format(
+        sum(len(category) for category in model_data.values())), 'INFO')
+    return True
+
+
+def _applyLibraryIndex(index):
+    """Updates the model list from an index, dropping the previews of changed categories."""
+    newdata = {category: {modelname: {'path': model['path'],
+                                      'thumbnail': model.get('thumbnail', ''),
+                                      'metadata': model.get('metadata', {})}
+                          for modelname, model in entry['models'].items()}
+               for category, entry in index['categories'].items()}
+    for category in list(model_previews):
+        if newdata.get(category) != model_data.get(category):
+            bpy.utils.previews.remove(model_previews.pop(category))
     model_data.clear()
+    model_data.update(newdata)
+    categories.clear()
+    categories.update(model_data)
+    _searchindex[:] = sorted((modelname.lower(), category, modelname)
+                             for category, models in model_data.items() for modelname in models)
+
+
+def describeModel(metadata):
+    """Returns a one-line description of a library model from its metadata."""
+    description = []
+    if 'links' in metadata:
+        description.append('{0} links, {1} joints, {2:.2f} kg'.format(
+            metadata['links'], metadata['joints'], metadata['mass']))
+    if metadata.get('sensors'):
+        description.append('sensors: ' + ', '.join(metadata['sensors']))
+    if metadata.get('submechanisms'):
+        description.append('submechanisms: ' + ', '.join(metadata['submechanisms']))
+    return '; '.join(description)
+
+
+def queryModels(prefix='', category=None, min_links=None, max_links=None, min_joints=None,
+                max_joints=None, min_mass=None, max_mass=None, sensors=(), submechanisms=(),
+                max_size=None):
+    """Searches the model library by name prefix and metadata.
+
+    The prefix is matched case-insensitively by bisecting a sorted name index, the remaining
+    filters are only evaluated for the models matching the prefix. Models without metadata
+    never match metadata filters.
+
+    Args:
+      prefix(str, optional): beginning of the model name (Default value = '')
+      category(str, optional): only return models of this category (Default value = None)
+      min_links, max_links(int, optional): bounds of the number of links
+      min_joints, max_joints(int, optional): bounds of the number of joints
+      min_mass, max_mass(float, optional): bounds of the total mass
+      sensors(iterable, optional): sensor types all of which the model has to contain
+      submechanisms(iterable, optional): submechanism types all of which the model has to contain
+      max_size(float, optional): maximum edge length of the bounding box
+
+    Returns:
+      list -- (category, modelname, metadata) tuples of the matching models sorted by name
+
+    """
+    collectLibraryScan()
+    prefix = prefix.lower()
+    start = bisect.bisect_left(_searchindex, (prefix,))
+    bounds = [(key, lower, upper) for key, lower, upper in
+              (('links', min_links, max_links), ('joints', min_joints, max_joints),
+               ('mass', min_mass, max_mass)) if lower is not None or upper is not None]
+    sensors = set(sensors)
+    submechanisms = set(submechanisms)
+
+    results = []
+    for lowername, modelcategory, modelname in _searchindex[start:]:
+        if not lowername.startswith(prefix):
+            break
+        if category and modelcategory != category:
+            continue
+        metadata = model_data[modelcategory][modelname]['metadata']
+        if bounds or max_size is not None:
+            if 'links' not in metadata:
+                continue
+            if any((lower is not None and metadata[key] < lower) or
+                   (upper is not None and metadata[key] > upper)
+                   for key, lower, upper in bounds):
+                continue
+            if (max_size is not None and
+                    max(numpy.subtract(metadata['bbox'][1], metadata['bbox'][0])) > max_size):
+                continue
+        if not sensors.issubset(metadata.get('sensors', ())):
+            continue
+        if not submechanisms.issubset(metadata.get('submechanisms', ())):
+            continue
+        results.append((modelcategory, modelname, metadata))
+    return results
+
+
+def loadCategoryPreviews(category):
+    """Loads the previews of all models of a category.
+
+    Args:
+      category(str): the model category
+
+    Returns:
+
+    """
+    newpreviewcollection = bpy.utils.previews.new()
+    enum_items = []
+    for i, modelname in enumerate(sorted(model_data[category])):
+        model = model_data[category][modelname]
+        # use existing thumbnail if available
+        if model['thumbnail']:
+            previewpath = model['thumbnail']
+            preview = newpreviewcollection.load(modelname, previewpath, 'IMAGE')
+        # otherwise create one from the blend file
+        else:
+            previewpath = os.path.join(model['path'], 'blender', modelname + '.blend')
+            preview = newpreviewcollection.load(modelname, previewpath, 'BLEND')
+        log("Adding model to preview: " + previewpath, 'DEBUG')
+        enum_items.append((modelname, modelname, describeModel(model['metadata']),
+                           preview.icon_id, i))
+    newpreviewcollection.enum_items = enum_items
+    model_previews[category] = newpreviewcollection
+
+
+def compileModelList(full=False, background=True):
+    """Compiles the list of models in the model library.
+
+    The cached library index is applied right away and the library folder is rescanned
+    incrementally, by default in a background thread. The result of the rescan is applied the
+    next time the model list is accessed (see collectLibraryScan).
+
+    Args:
+      full(bool, optional): rescan all categories and models (Default value = False)
+      background(bool, optional): rescan in a background thread (Default value = True)
+
+    Returns:
+
+    """
+    global _scanthread
+    log("Compiling model list from local library...", "INFO")
 
     rootpath = bUtils.getPhobosPreferences().modelsfolder
     if rootpath == '' or not os.path.exists(rootpath):
         log('Model library folder does not exist.')
+        _applyLibraryIndex({'categories': {}})
         return
 
-    # parse the model folder
-    i = 0
-    for category in os.listdir(rootpath):
-        categorypath = os.path.join(rootpath, category)
-        # skip all non folders
-        if not os.path.isdir(categorypath):
-            continue
-
-        # initialise new dictionaries
-        model_data[category] = {}
-        newpreviewcollection = bpy.utils.previews.new()
-        enum_items = []
-
-        # parse category folder
-        for modelname in os.listdir(categorypath):
-            modelpath = os.path.join(categorypath, modelname)
-
-            # check for valid blender savefile in the model folder
-            if os.path.exists(os.path.join(modelpath, 'blender', modelname+'.blend')):
-                model_data[category][modelname] = {'path': modelpath}
-
-                # use existing thumbnail if available
-                if os.path.exists(os.path.join(modelpath, 'thumbnails')):
-                    previewpath = os.path.join(modelpath,'thumbnails', modelname+'.png')
-                    preview = newpreviewcollection.load(modelname, previewpath, 'IMAGE')
-                # otherwise create one from the blend file
-                else:
-                    previewpath = os.path.join(modelpath, 'blender', modelname + '.blend')
-                    preview = newpreviewcollection.load(modelname, previewpath, 'BLEND')
-                log("Adding model to preview: " + previewpath, 'DEBUG')
-                enum_items.append((modelname, modelname, "", preview.icon_id, i))
-                i += 1
-                categories.add(category)
-        # save the category
-        newpreviewcollection.enum_items = enum_items
-        model_previews[category] = newpreviewcollection
-        log("Finished parsing model folder. Imported {0} models.".format(i), 'INFO')
-
-    ## reregister the enumproperty to ensure new items are displayed
-    #WindowManager.modelpreview = EnumProperty(items=getModelListForEnumProperty, name='Model')
-    #WindowManager.category = EnumProperty(items=getCategoriesForEnumProperty, name='Category')
+    indexpath = getLibraryIndexPath()
+    index = loadLibraryIndex(indexpath, rootpath)
+    _applyLibraryIndex(index)
+    if _scanthread and _scanthread.is_alive():
+        log("Model library is already being scanned.", 'DEBUG')
+        return
+    _scanthread = threading.Thread(target=_scanInBackground,
+                                   args=(rootpath, indexpath, index, full), daemon=True)
+    _scanthread.start()
+    if not background:
+        _scanthread.join()
+        collectLibraryScan()
 
 
 class UpdateModelLibraryOperator(bpy.types.Operator):
@@ -142,7 +533,7 @@ class UpdateModelLibraryOperator(bpy.types.Operator):
     bl_label = "Update Library"
 
     def execute(self, context):
-        compileModelList()
+        compileModelList(full=True)
         return {'FINISHED'}
 
 
@@ -165,13 +556,23 @@ class ImportModelFromLibraryOperator(bpy.types.Operator):
        default=False,
        description="Import model with fixed prefixed instead of removable namespace.")
 
-    #as_reference = BoolProperty(
-    #    name='Import reference'
-    #    default=False,
-    #    description="Import model as reference to original model instead of importing all elements.")
+    modelname = StringProperty(
+        name='Model',
+        default='',
+        description="Name of the model to import, the model selected in the library if empty.")
+
+    category = StringProperty(
+        name='Category',
+        default='',
+        description="Category of the model, searched in the library index if empty.")
+
+    as_reference = BoolProperty(
+        name='Import reference',
+        default=False,
+        description="Import model as reference to original model instead of importing all elements.")
 
     def invoke(self, context, event):
-        modelname = context.window_manager.modelpreview
+        modelname = self.modelname or context.window_manager.modelpreview
         self.namespace = modelname
         # prevent duplicate names
         namespaces = nUtils.gatherNamespaces('__' if self.use_prefix else '::')
@@ -188,13 +589,24 @@ class ImportModelFromLibraryOperator(bpy.types.Operator):
         wm = context.window_manager
         # FIXME: the following is a hack to fix the problem mentioned at the top
         if not model_data:
-            compileModelList()
-        filepath = os.path.join(model_data[wm.category][wm.modelpreview]['path'],
-                                'blender', wm.modelpreview+'.blend')
-        if ioUtils.importBlenderModel(filepath, self.namespace, self.use_prefix):
+            compileModelList(background=False)
+        modelname = self.modelname or wm.modelpreview
+        category = self.category or wm.category
+        if self.modelname and not self.category:
+            # look up the category in the library index instead of the selected category
+            matches = [match for match in queryModels(modelname) if match[1] == modelname]
+            if matches:
+                category = matches[0][0]
+        if modelname not in model_data.get(category, {}):
+            log("Model " + modelname + " is not part of the model library.", "ERROR")
+            return {'CANCELLED'}
+        filepath = os.path.join(model_data[category][modelname]['path'],
+                                'blender', modelname + '.blend')
+        if ioUtils.importBlenderModel(filepath, self.namespace, self.use_prefix,
+                                      link=self.as_reference):
             return {'FINISHED'}
         else:
-            log("Model " + wm.modelpreview + " could not be loaded from library:"
+            log("Model " + modelname + " could not be loaded from library:"
                 "No valid .blend file.", "ERROR")
             return {'CANCELLED'}
 
@@ -208,6 +620,8 @@ def register():
             )
     WindowManager.modelpreview = EnumProperty(items=getModelListForEnumProperty, name='Model')
     WindowManager.category = EnumProperty(items=getCategoriesForEnumProperty, name='Category')
+    WindowManager.modelsearch = StringProperty(name='Search',
+                                               description="Beginning of the model name")
     compileModelList()
 
 def unregister():
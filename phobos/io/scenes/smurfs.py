@@ -31,7 +31,6 @@ from datetime import datetime
 from phobos.defs import version
 from phobos.defs import repository
 from phobos.utils import io as ioUtils
-from phobos.utils.general import roundFloatsInDict
 from phobos.phoboslog import log
 
 
@@ -55,8 +54,7 @@ def exportSMURFScene(entities, path):
         sceneinfo += "# created with Phobos " + version + " - " + repository + "\n\n"
         ioUtils.securepath(path)
         outputfile.write(sceneinfo)
-        entitiesdict = roundFloatsInDict({'entities': entities}, ioUtils.getExpSettings().decimalPlaces)
-        outputfile.write(yaml.dump(entitiesdict))
+        outputfile.write(yaml.dump({'entities': entities}, Dumper=ioUtils.YAMLDumper))
 
 # registering import/export functions of types with Phobos
 scene_type_dict = {'smurfs': {'export': exportSMURFScene,
@@ -0,0 +1,287 @@
+#!/usr/bin/python
+# coding=utf-8
+
+"""
+.. module:: phobos.model.collisions
+    :platform: Unix, Windows, Mac
+    :synopsis: Sampling-based self-collision analysis of derived models
+
+Copyright 2018, University of Bremen & DFKI GmbH Robotics Innovation Center
+
+This file is part of Phobos, a Blender Add-On to edit robot models.
+
+Phobos is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License
+as published by the Free Software Foundation, either version 3
+of the License, or (at your option) any later version.
+
+Phobos is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Phobos.  If not, see <http://www.gnu.org/licenses/>.
+
+File collisions.py
+
+Created on 12 Mar 2018
+"""
+
+import multiprocessing
+import numpy
+import phobos.model.kinematics as kinematics
+from phobos.phoboslog import log
+
+
+def compileCollisionModel(model):
+    """Compiles the kinematic structure and collision geometry of a model into plain arrays.
+
+    The returned dictionary only contains lists and numpy arrays, so it can be sent to worker
+    processes. The kinematics are compiled by phobos.model.kinematics.compileKinematics.
+
+    Collision geometry is reduced to spheres and boxes: spheres are kept as they are, all other
+    geometry types (boxes, cylinders, capsules, meshes) are represented by their bounding box.
+    Boxes of meshes are centred on the *center* of their geometry. Links with collision
+    geometry which can not be represented are marked as *unsupported*.
+
+    Args:
+      model(dict): a robot model dictionary as returned by deriveModelDictionary
+
+    Returns:
+      dict -- compiled representation of the model
+
+    """
+    compiled = kinematics.compileKinematics(model)
+    linknames = compiled['links']
+    nlinks = len(linknames)
+    adjacent = [(parent, i) for i, parent in enumerate(compiled['parents']) if parent >= 0]
+
+    # collect collision geometry per link
+    shapes = []
+    unsupported = numpy.zeros(nlinks, dtype=bool)
+    for i, linkname in enumerate(linknames):
+        collisions = model['links'][linkname].get('collision', {})
+        for collisionname in sorted(collisions):
+            collision = collisions[collisionname]
+            if not collision or not collision.get('geometry'):
+                continue
+            geometry = collision['geometry']
+            if geometry['type'] == 'sphere':
+                shapetype = 'sphere'
+                extent = numpy.array([geometry['radius']] * 3, dtype=float)
+                radius = geometry['radius']
+            else:
+                shapetype = 'box'
+                if 'size' in geometry:
+                    extent = numpy.abs(numpy.array(geometry['size'], dtype=float)) / 2
+                elif 'radius' in geometry and 'length' in geometry:
+                    extent = numpy.array([geometry['radius'], geometry['radius'],
+                                          geometry['length'] / 2], dtype=float)
+                else:
+                    log("Unsupported collision geometry of " + collisionname +
+                        ", its link is never considered collision-free.", "WARNING")
+                    unsupported[i] = True
+                    continue
+                radius = numpy.linalg.norm(extent)
+            transform = kinematics.poseToMatrix(collision.get('pose'))
+            if 'center' in geometry:
+                transform[:3, 3] += numpy.dot(transform[:3, :3], geometry['center'])
+            shapes.append({'link': i, 'type': shapetype, 'extent': extent, 'radius': radius,
+                           'transform': transform})
+
+    # bounding spheres of the links in their own frames
+    centers = numpy.zeros((nlinks, 3))
+    radii = numpy.zeros(nlinks)
+    hasgeometry = numpy.zeros(nlinks, dtype=bool)
+    shapesbylink = {}
+    for shape in shapes:
+        shapesbylink.setdefault(shape['link'], []).append(shape)
+    for i, linkshapes in shapesbylink.items():
+        shapecenters = numpy.array([shape['transform'][:3, 3] for shape in linkshapes])
+        centers[i] = shapecenters.mean(axis=0)
+        radii[i] = max(numpy.linalg.norm(center - centers[i]) + shape['radius']
+                       for center, shape in zip(shapecenters, linkshapes))
+        hasgeometry[i] = True
+
+    return {'kinematics': compiled,
+            'links': linknames,
+            'adjacent': adjacent,
+            'shapes': shapes,
+            'centers': centers,
+            'radii': radii,
+            'hasgeometry': hasgeometry,
+            'unsupported': unsupported}
+
+
+def _spheresCollide(centera, radiusa, centerb, radiusb):
+    """Vectorized sphere-sphere test."""
+    return numpy.linalg.norm(centera - centerb, axis=1) < radiusa + radiusb
+
+
+def _sphereBoxCollide(center, radius, boxtransforms, extent):
+    """Vectorized sphere-box test via the closest point of the box to the sphere center."""
+    rotations = boxtransforms[:, :3, :3]
+    local = numpy.einsum('kji,kj->ki', rotations, center - boxtransforms[:, :3, 3])
+    closest = numpy.clip(local, -extent, extent)
+    return numpy.linalg.norm(local - closest, axis=1) < radius
+
+
+def _boxesCollide(transformsa, extenta, transformsb, extentb):
+    """Vectorized separating axis test of two oriented boxes (15 candidate axes)."""
+    rotation = numpy.einsum('kji,kjl->kil', transformsa[:, :3, :3], transformsb[:, :3, :3])
+    translation = numpy.einsum('kji,kj->ki', transformsa[:, :3, :3],
+                               transformsb[:, :3, 3] - transformsa[:, :3, 3])
+    absrotation = numpy.abs(rotation) + 1e-9
+    separated = numpy.zeros(rotation.shape[0], dtype=bool)
+    for i in range(3):
+        separated |= (numpy.abs(translation[:, i]) >
+                      extenta[i] + numpy.dot(absrotation[:, i, :], extentb))
+        separated |= (numpy.abs(numpy.einsum('ki,ki->k', translation, rotation[:, :, i])) >
+                      numpy.dot(absrotation[:, :, i], extenta) + extentb[i])
+    for i in range(3):
+        i1, i2 = (i + 1) % 3, (i + 2) % 3
+        for j in range(3):
+            j1, j2 = (j + 1) % 3, (j + 2) % 3
+            ra = extenta[i1] * absrotation[:, i2, j] + extenta[i2] * absrotation[:, i1, j]
+            rb = extentb[j1] * absrotation[:, i, j2] + extentb[j2] * absrotation[:, i, j1]
+            distance = numpy.abs(translation[:, i2] * rotation[:, i1, j] -
+                                 translation[:, i1] * rotation[:, i2, j])
+            separated |= distance > ra + rb
+    return ~separated
+
+
+def _shapesCollide(shapea, transformsa, shapeb, transformsb):
+    """Dispatches the narrow-phase test for two shapes given their world transforms."""
+    if shapea['type'] == 'sphere' and shapeb['type'] == 'sphere':
+        return _spheresCollide(transformsa[:, :3, 3], shapea['radius'],
+                               transformsb[:, :3, 3], shapeb['radius'])
+    elif shapea['type'] == 'sphere':
+        return _sphereBoxCollide(transformsa[:, :3, 3], shapea['radius'],
+                                 transformsb, shapeb['extent'])
+    elif shapeb['type'] == 'sphere':
+        return _sphereBoxCollide(transformsb[:, :3, 3], shapeb['radius'],
+                                 transformsa, shapea['extent'])
+    return _boxesCollide(transformsa, shapea['extent'], transformsb, shapeb['extent'])
+
+
+def countCollisions(compiled, configurations):
+    """Counts for every pair of links in how many of the configurations they collide.
+
+    Link pairs are first filtered by the bounding spheres of the links (broad phase) before the
+    individual collision shapes are tested against each other (narrow phase).
+
+    Args:
+      compiled(dict): compiled model as returned by compileCollisionModel
+      configurations(numpy.ndarray): K x N array of joint values
+
+    Returns:
+      numpy.ndarray -- L x L upper triangular matrix of collision counts
+
+    """
+    nlinks = len(compiled['links'])
+    counts = numpy.zeros((nlinks, nlinks), dtype=int)
+    world = kinematics.forwardKinematics(compiled['kinematics'], configurations)
+
+    # broad phase, comparing squared distances |a|^2 + |b|^2 - 2ab per sample, so only one
+    # L x L array of floats is needed at a time
+    centers = numpy.einsum('klij,lj->kli', world[:, :, :3, :3], compiled['centers']) + world[:, :, :3, 3]
+    thresholds = (compiled['radii'][:, None] + compiled['radii'][None, :]) ** 2
+    geometrymask = numpy.triu(compiled['hasgeometry'][:, None] & compiled['hasgeometry'][None, :],
+                              k=1)
+    candidates = numpy.empty((len(configurations), nlinks, nlinks), dtype=bool)
+    for k, samplecenters in enumerate(centers):
+        squared = numpy.einsum('li,li->l', samplecenters, samplecenters)
+        distances = squared[:, None] + squared[None, :] - 2 * numpy.dot(samplecenters,
+                                                                          samplecenters.T)
+        numpy.less(distances, thresholds, out=candidates[k])
+        candidates[k] &= geometrymask
+
+    # narrow phase
+    shapesbylink = {}
+    for shape in compiled['shapes']:
+        shapesbylink.setdefault(shape['link'], []).append(shape)
+    for linka, linkb in zip(*numpy.nonzero(candidates.any(axis=0))):
+        samples = numpy.nonzero(candidates[:, linka, linkb])[0]
+        collided = numpy.zeros(len(samples), dtype=bool)
+        for shapea in shapesbylink[linka]:
+            transformsa = numpy.matmul(world[samples, linka], shapea['transform'])
+            for shapeb in shapesbylink[linkb]:
+                transformsb = numpy.matmul(world[samples, linkb], shapeb['transform'])
+                collided |= _shapesCollide(shapea, transformsa, shapeb, transformsb)
+        counts[linka, linkb] = numpy.count_nonzero(collided)
+    return counts
+
+
+def _countSampledCollisions(job):
+    """Worker function sampling one batch of configurations with its own seed."""
+    compiled, nsamples, seed = job
+    configurations = kinematics.randomConfigurations(compiled['kinematics'], nsamples, seed)
+    return countCollisions(compiled, configurations)
+
+
+def deriveDisabledCollisions(model, samples=1000, seed=0, batchsize=250, processes=None,
+                             alwaysratio=0.95):
+    """Classifies all link pairs of a model by sampling random joint configurations.
+
+    Every batch of samples is drawn with a seed derived from *seed* and its batch index, so the
+    result is reproducible independent of the number of processes. The batches are distributed
+    to a process pool where forking is available and evaluated serially otherwise.
+
+    Link pairs are classified as:
+        *Adjacent*: the links are connected by a joint
+        *Default*: the links collide in the zero configuration of the model
+        *Always*: the links collide in at least *alwaysratio* of all samples
+        *Never*: the links never collide in any sample
+
+    Pairs which only collide in some of the configurations are not part of the result, neither
+    are pairs of which a link has collision geometry the analysis does not support, as they
+    might collide although no sample says so.
+
+    Args:
+      model(dict): a robot model dictionary as returned by deriveModelDictionary
+      samples(int): number of random joint configurations to evaluate
+      seed(int): seed of the random number generator
+      batchsize(int): number of configurations evaluated at once
+      processes(int): number of worker processes, all available cores if None
+      alwaysratio(float): ratio of samples above which a pair is considered to always collide
+
+    Returns:
+      dict -- reasons for disabling collisions of link pairs (link1, link2) with link1 < link2
+
+    """
+    compiled = compileCollisionModel(model)
+    linknames = compiled['links']
+    log("Sampling {0} configurations for self-collision analysis of {1} links...".format(
+        samples, len(linknames)), "INFO")
+
+    jobs = [(compiled, min(batchsize, samples - start), seed + i)
+            for i, start in enumerate(range(0, samples, batchsize))]
+    try:
+        context = multiprocessing.get_context('fork')
+    except ValueError:
+        context = None
+    if context and len(jobs) > 1 and processes != 1:
+        with context.Pool(processes) as pool:
+            results = pool.map(_countSampledCollisions, jobs)
+    else:
+        results = [_countSampledCollisions(job) for job in jobs]
+    counts = sum(results, numpy.zeros((len(linknames), len(linknames)), dtype=int))
+    default = countCollisions(compiled, numpy.zeros((1, len(compiled['kinematics']['joints']))))
+
+    reasons = {}
+    for i, j in zip(*numpy.triu_indices(len(linknames), k=1)):
+        if default[i, j]:
+            reason = 'Default'
+        elif samples and counts[i, j] >= alwaysratio * samples:
+            reason = 'Always'
+        elif counts[i, j] == 0 and not (compiled['unsupported'][i] or
+                                        compiled['unsupported'][j]):
+            reason = 'Never'
+        else:
+            continue
+        reasons[tuple(sorted((linknames[i], linknames[j])))] = reason
+    for i, j in compiled['adjacent']:
+        reasons[tuple(sorted((linknames[i], linknames[j])))] = 'Adjacent'
+    log("Derived {0} disabled collision pairs.".format(len(reasons)), "INFO")
+    return reasons
@@ -53,6 +53,11 @@ def deriveGeometry(obj):
             geometry['scale'] = list(obj.scale)
             # FIXME: is this needed to calculate an approximate inertia
             geometry['size'] = list(obj.dimensions)
+            # the vertices need not be centred on the origin of the object, so the centre of
+            # the (scaled) bounding box is kept along with its size
+            geometry['center'] = [(min(corner[i] for corner in obj.bound_box) +
+                                   max(corner[i] for corner in obj.bound_box)) / 2 * obj.scale[i]
+                                  for i in range(3)]
         # any other geometry type, i.e. 'plane'
         else:
             geometry['size'] = list(obj.dimensions)
@@ -63,6 +68,27 @@ def deriveGeometry(obj):
         return None
 
 
+def setCollisionGroups(obj, bitmask):
+    """Sets the rigid body collision groups of an object from a collision bitmask.
+
+    Bit i of the bitmask corresponds to collision group i, bits beyond Blender's 20 groups are
+    ignored. Rigid body settings are added to the object if necessary.
+
+    Args:
+      obj(bpy.types.Object): collision object
+      bitmask(int): collision bitmask
+
+    Returns:
+
+    """
+    if not obj.rigid_body:
+        bpy.context.scene.objects.active = obj
+        bpy.ops.rigidbody.object_add(type='ACTIVE')
+        obj.rigid_body.kinematic = True
+    obj.rigid_body.collision_groups = [bool(bitmask >> i & 1)
+                                       for i in range(len(obj.rigid_body.collision_groups))]
+
+
 def createGeometry(viscol, geomsrc, linkobj=None):
     """Creates Blender object for visual or collision objects.
     Returns reference to new object or None if creation failed.
@@ -140,7 +166,10 @@ def createGeometry(viscol, geomsrc, linkobj=None):
                 newgeom[prop[1:]+'/'+tag] = viscol[prop][tag]
     nUtils.safelyName(newgeom, viscol['name'])
     newgeom[geomsrc+"/name"] = viscol['name']
+    sUtils.updateObjectName(newgeom)
     newgeom.phobostype = geomsrc
+    if geomsrc == 'collision' and viscol.get('bitmask'):
+        setCollisionGroups(newgeom, viscol['bitmask'])
 
     # place geometric object relative to its parent link
     if linkobj:
@@ -62,7 +62,7 @@ def createInertial(inertialdict, obj=None):
     if not isInertiaDataValid(inertialdict):
         return None
 
-    name = nUtils.getUniqueName('inertial_' + nUtils.getObjectName(obj), bpy.data.objects)
+    name = 'inertial_' + nUtils.getObjectName(obj)
     inertialobject = bUtils.createPrimitive(name, 'box', (size,) * 3, defs.layerTypes["inertial"],
                                             pmaterial='phobos_inertial', phobostype='inertial')
     sUtils.selectObjects((inertialobject,), clear=True, active=0)
@@ -57,6 +57,7 @@ def createJoint(joint, linkobj=None):
             return
     if joint['name'] != linkobj.name:
         linkobj['joint/name'] = joint['name']
+        sUtils.updateObjectName(linkobj)
     # get hold of object
     bUtils.toggleLayer(list(linkobj.layers).index(True), True)  # any layer containing the object
     sUtils.selectObjects([linkobj], clear=True, active=0)
@@ -0,0 +1,272 @@
+#!/usr/bin/python
+# coding=utf-8
+
+"""
+.. module:: phobos.model.kinematics
+    :platform: Unix, Windows, Mac
+    :synopsis: Batched forward kinematics on derived model dictionaries
+
+Copyright 2018, University of Bremen & DFKI GmbH Robotics Innovation Center
+
+This file is part of Phobos, a Blender Add-On to edit robot models.
+
+Phobos is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License
+as published by the Free Software Foundation, either version 3
+of the License, or (at your option) any later version.
+
+Phobos is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Phobos.  If not, see <http://www.gnu.org/licenses/>.
+
+File kinematics.py
+
+Created on 14 Mar 2018
+
+This module does not depend on Blender, so it can be used headless and in worker processes.
+"""
+
+import math
+import numpy
+
+#: Joint type ids used in compiled kinematics.
+FIXED, REVOLUTE, PRISMATIC = 0, 1, 2
+
+
+def quaternionToMatrix(quaternion):
+    """Returns the 3x3 rotation matrix of a quaternion given as [w, x, y, z].
+
+    The quaternion is normalized first, so quaternions derived from scaled matrices can be used.
+
+    Args:
+      quaternion(list): quaternion in Blender's (w, x, y, z) order
+
+    Returns:
+      numpy.ndarray -- 3x3 rotation matrix
+
+    """
+    w, x, y, z = numpy.array(quaternion, dtype=float) / numpy.linalg.norm(quaternion)
+    return numpy.array([[1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)],
+                        [2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)],
+                        [2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)]])
+
+
+def poseToMatrix(pose):
+    """Returns the homogeneous 4x4 transform of a pose dictionary as returned by deriveObjectPose.
+
+    Only the translation and the rotation of the pose are used, any scaling is dropped. The
+    transform of a phobos.model.records.Pose is copied directly.
+
+    Args:
+      pose(dict): pose dictionary containing 'translation' and 'rotation_quaternion'
+
+    Returns:
+      numpy.ndarray -- 4x4 transformation matrix
+
+    """
+    if isinstance(getattr(pose, 'matrix', None), numpy.ndarray):
+        return pose.matrix.copy()
+    matrix = numpy.identity(4)
+    if not pose:
+        return matrix
+    if 'rotation_quaternion' in pose:
+        matrix[:3, :3] = quaternionToMatrix(pose['rotation_quaternion'])
+    if 'translation' in pose:
+        matrix[:3, 3] = pose['translation']
+    return matrix
+
+
+def compileKinematics(model):
+    """Compiles the kinematic tree of a model dictionary into flat arrays.
+
+    Links are ordered such that every parent precedes its children and are grouped into levels
+    of equal depth, which are evaluated together by forwardKinematics. The link poses of the
+    model are used as transforms relative to the parent link, i.e. as joint origins.
+
+    Joints of type *revolute* and *continuous* become rotational, *prismatic* joints
+    translational variables. All other joints (*fixed*, *floating*, *planar*) are kept fixed
+    in their derived pose. The bounds of every variable are taken from the joint limits;
+    continuous joints and revolute joints without limits span a full turn, prismatic joints
+    without limits are kept fixed.
+
+    The returned dictionary contains:
+        *links*: list of link names in evaluation order
+        *parents*: parent index per link, -1 for roots
+        *transforms*: L x 4 x 4 array of the link transforms relative to their parents
+        *jointtypes*: joint type id per link (FIXED, REVOLUTE or PRISMATIC)
+        *axes*: L x 3 array of the normalized joint axes
+        *variables*: index of the joint variable per link, -1 for fixed joints
+        *joints*: list of joint names, one per variable
+        *lower*, *upper*: arrays of the variable bounds
+        *levels*: list of index arrays of the links per depth in the tree
+
+    Args:
+      model(dict): a robot model dictionary as returned by deriveModelDictionary
+
+    Returns:
+      dict -- compiled kinematics of the model
+
+    """
+    jointsbychild = {joint['child']: joint for joint in model['joints'].values()
+                     if joint and 'child' in joint}
+
+    # sort links by depth, keeping parents before children
+    children = {}
+    level = []
+    for linkname in sorted(model['links']):
+        parent = model['links'][linkname].get('parent')
+        if parent in model['links']:
+            children.setdefault(parent, []).append(linkname)
+        else:
+            level.append(linkname)
+    linknames = []
+    levelnames = []
+    while level:
+        levelnames.append(level)
+        linknames.extend(level)
+        level = [child for linkname in level for child in children.get(linkname, [])]
+    linkindices = {name: i for i, name in enumerate(linknames)}
+
+    nlinks = len(linknames)
+    parents = numpy.full(nlinks, -1, dtype=int)
+    transforms = numpy.tile(numpy.identity(4), (nlinks, 1, 1))
+    jointtypes = numpy.full(nlinks, FIXED, dtype=int)
+    axes = numpy.zeros((nlinks, 3))
+    variables = numpy.full(nlinks, -1, dtype=int)
+    jointnames = []
+    lower = []
+    upper = []
+    for i, linkname in enumerate(linknames):
+        link = model['links'][linkname]
+        transforms[i] = poseToMatrix(link.get('pose'))
+        if link.get('parent') in linkindices:
+            parents[i] = linkindices[link['parent']]
+        joint = jointsbychild.get(linkname)
+        if not joint or not any(joint.get('axis', ())):
+            continue
+        limits = joint.get('limits', {})
+        haslimits = 'lower' in limits and 'upper' in limits
+        if joint['type'] == 'revolute' and haslimits:
+            jointtypes[i] = REVOLUTE
+            bounds = (limits['lower'], limits['upper'])
+        elif joint['type'] in ('revolute', 'continuous'):
+            jointtypes[i] = REVOLUTE
+            bounds = (-math.pi, math.pi)
+        elif joint['type'] == 'prismatic' and haslimits:
+            jointtypes[i] = PRISMATIC
+            bounds = (limits['lower'], limits['upper'])
+        else:
+            continue
+        axes[i] = numpy.array(joint['axis'], dtype=float) / numpy.linalg.norm(joint['axis'])
+        variables[i] = len(jointnames)
+        jointnames.append(joint['name'])
+        lower.append(bounds[0])
+        upper.append(bounds[1])
+
+    return {'links': linknames,
+            'parents': parents,
+            'transforms': transforms,
+            'jointtypes': jointtypes,
+            'axes': axes,
+            'variables': variables,
+            'joints': jointnames,
+            'lower': numpy.array(lower, dtype=float),
+            'upper': numpy.array(upper, dtype=float),
+            'levels': [numpy.array([linkindices[name] for name in names], dtype=int)
+                       for names in levelnames]}
+
+
+def configurationArray(compiled, configurations):
+    """Converts joint configurations to the K x N array expected by forwardKinematics.
+
+    Configurations can be given as dictionaries mapping joint names to values; joints missing
+    in a dictionary are set to zero, unknown joints are ignored.
+
+    Args:
+      compiled(dict): compiled kinematics as returned by compileKinematics
+      configurations(dict, list or numpy.ndarray): one configuration or a sequence of them
+
+    Returns:
+      numpy.ndarray -- K x N array of joint values
+
+    """
+    if isinstance(configurations, dict):
+        configurations = [configurations]
+    if len(configurations) and isinstance(configurations[0], dict):
+        indices = {name: i for i, name in enumerate(compiled['joints'])}
+        array = numpy.zeros((len(configurations), len(indices)))
+        for k, configuration in enumerate(configurations):
+            for name, value in configuration.items():
+                if name in indices:
+                    array[k, indices[name]] = value
+        return array
+    return numpy.atleast_2d(numpy.asarray(configurations, dtype=float))
+
+
+def randomConfigurations(compiled, number, seed=None):
+    """Returns joint configurations sampled uniformly within the joint bounds.
+
+    Args:
+      compiled(dict): compiled kinematics as returned by compileKinematics
+      number(int): number of configurations
+      seed(int, optional): seed of the random number generator (Default value = None)
+
+    Returns:
+      numpy.ndarray -- K x N array of joint values
+
+    """
+    randomstate = numpy.random.RandomState(seed)
+    return randomstate.uniform(compiled['lower'], compiled['upper'],
+                               (number, len(compiled['joints'])))
+
+
+def forwardKinematics(compiled, configurations):
+    """Returns the world transforms of all links for a batch of joint configurations.
+
+    All links of one depth in the tree are evaluated at once for all configurations, so the
+    number of numpy operations only depends on the depth of the tree.
+
+    Args:
+      compiled(dict): compiled kinematics as returned by compileKinematics
+      configurations(numpy.ndarray): K x N array of joint values (see configurationArray)
+
+    Returns:
+      numpy.ndarray -- K x L x 4 x 4 array of link transforms in the order of compiled['links']
+
+    """
+    configurations = configurationArray(compiled, configurations)
+    nsamples = configurations.shape[0]
+    world = numpy.empty((nsamples, len(compiled['links']), 4, 4))
+    for level in compiled['levels']:
+        local = numpy.broadcast_to(compiled['transforms'][level],
+                                   (nsamples, len(level), 4, 4)).copy()
+        variables = compiled['variables'][level]
+        moving = variables >= 0
+        if moving.any():
+            values = configurations[:, variables[moving]]
+            axes = compiled['axes'][level[moving]]
+            motion = numpy.tile(numpy.identity(4), (nsamples, len(axes), 1, 1))
+
+            # rotations by Rodrigues' formula, translations along the axes
+            revolute = compiled['jointtypes'][level[moving]] == REVOLUTE
+            cross = numpy.zeros((len(axes), 3, 3))
+            cross[:, 0, 1], cross[:, 0, 2] = -axes[:, 2], axes[:, 1]
+            cross[:, 1, 0], cross[:, 1, 2] = axes[:, 2], -axes[:, 0]
+            cross[:, 2, 0], cross[:, 2, 1] = -axes[:, 1], axes[:, 0]
+            angles = numpy.where(revolute, values, 0.)[:, :, None, None]
+            motion[:, :, :3, :3] += (numpy.sin(angles) * cross +
+                                     (1 - numpy.cos(angles)) * numpy.matmul(cross, cross))
+            motion[:, :, :3, 3] = numpy.where(revolute, 0., values)[:, :, None] * axes
+            local[:, moving] = numpy.matmul(local[:, moving], motion)
+
+        parents = compiled['parents'][level]
+        hasparent = parents >= 0
+        world[:, level[~hasparent]] = local[:, ~hasparent]
+        if hasparent.any():
+            world[:, level[hasparent]] = numpy.matmul(world[:, parents[hasparent]],
+                                                      local[:, hasparent])
+    return world
@@ -51,6 +51,7 @@ def addLight(light_dict):
 
     light_data = light.data
     light.name = light_dict['name']
+    sUtils.updateObjectName(light)
 
     colour_vals = ['r', 'g', 'b']
     colour_data = light_dict['color']['diffuse']
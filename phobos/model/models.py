@@ -28,6 +28,7 @@ Created on 28 Jul 2014
 
 import os
 import copy
+import time
 from datetime import datetime
 import yaml
 
@@ -41,13 +42,13 @@ import phobos.model.joints as jointmodel
 import phobos.model.sensors as sensormodel
 import phobos.model.lights as lightmodel
 import phobos.model.poses as poses
+import phobos.model.records as records
 import phobos.utils.naming as nUtils
 import phobos.utils.selection as sUtils
 import phobos.utils.blender as bUtils
 import phobos.utils.editing as eUtils
 import phobos.utils.io as ioUtils
 from phobos.phoboslog import log
-from phobos.utils.general import roundFloatsInDict
 from phobos.model.poses import deriveObjectPose
 from phobos.model.geometries import deriveGeometry
 from phobos.defs import linkobjignoretypes
@@ -384,13 +385,14 @@ def deriveCollision(obj):
         collision['pose'] = deriveObjectPose(obj)
         # the bitmask is cut to length = 16 and reverted for int parsing
         try:
+            bits = defs.collision_bitmask_bits
             collision['bitmask'] = int(''.join(
-                ['1' if group else '0' for group in obj.rigid_body.collision_groups[:16]])[::-1], 2)
-            for group in obj.rigid_body.collision_groups[16:]:
+                ['1' if group else '0' for group in obj.rigid_body.collision_groups[:bits]])[::-1],
+                2)
+            for group in obj.rigid_body.collision_groups[bits:]:
                 if group:
-                    log(('Object {0} is on a collision layer higher than ' +
-                        '16. These layers are ignored when exporting.').format(
-                        obj.name), "WARNING")
+                    log(('Object {0} is on a collision layer higher than {1}. These layers ' +
+                         'are ignored when exporting.').format(obj.name, bits), "WARNING")
                     break
         except AttributeError:
             pass
@@ -444,7 +446,8 @@ def deriveCapsule(obj):
         viscol['pose'] = pose
         try:
             viscol['bitmask'] = int(''.join(
-                ['1' if group else '0' for group in obj.rigid_body.collision_groups]), 2)
+                ['1' if group else '0' for group in
+                 obj.rigid_body.collision_groups[:defs.collision_bitmask_bits]])[::-1], 2)
         except AttributeError:
             pass
         viscol_dict[part] = viscol
@@ -597,6 +600,30 @@ def initObjectProperties(obj, phobostype=None, ignoretypes=(), includeannotation
     return props
 
 
+def indexAnnotations(annotations, elementtype, element):
+    """Moves the annotation categories of an element dictionary into the model's annotation index.
+
+    Annotations are stored by *initObjectProperties* as keys with a leading '$'. This function
+    removes them from the element and appends them to *annotations*, which is structured as
+    category -> element type -> list of entries, each carrying the name of the element.
+
+    Args:
+      annotations(dict): annotation index of the model
+      elementtype(str): type of the element, e.g. 'link' or 'visual'
+      element(dict): element dictionary as returned by the derive functions
+
+    Returns:
+
+    """
+    if not element:
+        return
+    categories = [key for key in element if key.startswith('$')]
+    for key in categories:
+        entry = dict(element.pop(key))
+        entry['name'] = element['name']
+        annotations.setdefault(key[1:], {}).setdefault(elementtype, []).append(entry)
+
+
 def deriveDictEntry(obj):
     """Returns dictionary representation of the provided object for Phobos' model dictionary.
 
@@ -693,6 +720,8 @@ def deriveTextData(modelname):
 
     """
     datadict = {}
+    # make sure the text blocks of the pose libraries are up to date
+    poses.flushPoseStores()
     datatextfiles = [
         text for text in bpy.data.texts if text.name.startswith(modelname + '::')]
     for text in datatextfiles:
@@ -700,6 +729,9 @@ def deriveTextData(modelname):
             dataname = text.name.split('::')[-1]
         except IndexError:
             log("Possibly invalidly named model data text file: " + modelname, "WARNING")
+        if dataname == 'poses':
+            datadict[dataname] = poses.getPoseStore(modelname).toDict()
+            continue
         try:
             data = yaml.load(bUtils.readTextFile(text.name))
         except yaml.scanner.ScannerError:
@@ -822,21 +854,102 @@ def namespaced(name, namespace):
     return namespace+'_'+name
 
 
-def deriveModelDictionary(root, name='', objectlist=[]):
+def deriveModelDictionary(root, name='', objectlist=[], compact=False):
     """Returns a dictionary representation of a Phobos model.
 
     If name is not specified, it overrides the modelname in the root. If the modelname is not
     defined at all, 'unnamed' will be used instead.
 
+    If compact is set, the model is returned as phobos.model.records.Model, which stores links
+    and joints in typed records without references to Blender objects and with one transform
+    per pose. The records are created as the elements are derived, so no full dictionary of the
+    model is built. The model can be used like the dictionary and converted via its toDict method.
+
+    The model is derived in one go, use ModelDerivation to derive it in steps instead.
+
     Args:
         root(bpy_types.Object): root object of the model
         name(str): name for the derived model
         objectlist(list: bpy_types.Object): objects to derive the model from
+        compact(bool): return a phobos.model.records.Model instead of a dictionary
+    """
+    derivation = ModelDerivation(root, name, objectlist, compact)
+    derivation.step(timeout=float('inf'))
+    return derivation.model
+
+
+#: the stages of a model derivation in the order deriveModelSteps runs them
+derivation_stages = ('links', 'inertials', 'visuals and collisions', 'sensors and controllers',
+                     'materials', 'meshes', 'groups')
+
+
+class ModelDerivation(object):
+    """A model derivation which is run in steps, e.g. from a modal operator.
+
+    Every call of step continues the generator returned by deriveModelSteps for at least one
+    chunk, until *timeout* seconds are spent. Between the steps Blender can handle its events,
+    the derivation can be cancelled by simply dropping it. All steps share one TransformCache,
+    so the poses are derived from the state of the objects when the first step was run.
+
+    *progress* (0 to 1) and *info* are updated by every step, *model* is set once the
+    derivation is *finished*.
+    """
+
+    def __init__(self, root, name='', objectlist=[], compact=False, chunksize=20):
+        self.root = root
+        self.steps = deriveModelSteps(root, name, objectlist, compact, chunksize)
+        self.cache = eUtils.TransformCache()
+        self.progress = 0.
+        self.info = ''
+        self.model = None
+        self.finished = False
+
+    def step(self, timeout=0.):
+        """Derives the next chunks of the model.
+
+        Args:
+          timeout(float): seconds after which no further chunk is started
+
+        Returns:
+          bool -- True if the derivation is finished
+        """
+        start = time.time()
+        with self.cache:
+            while not self.finished:
+                try:
+                    self.progress, self.info = next(self.steps)
+                except StopIteration as stop:
+                    self.model = stop.value
+                    self.progress = 1.
+                    self.finished = True
+                if time.time() - start >= timeout:
+                    break
+        return self.finished
+
+
+def deriveModelSteps(root, name='', objectlist=[], compact=False, chunksize=20):
+    """Derives the model dictionary in chunks, see deriveModelDictionary.
+
+    This is a generator which yields a tuple of the progress (0 to 1) and the name of the
+    current stage (see derivation_stages) after every stage and after every *chunksize* links
+    or visual and collision objects. The derived model is its return value, i.e. the value
+    of the final StopIteration, so use it via ModelDerivation or *yield from*.
+
+    Args:
+        root(bpy_types.Object): root object of the model
+        name(str): name for the derived model
+        objectlist(list: bpy_types.Object): objects to derive the model from
+        compact(bool): return a phobos.model.records.Model instead of a dictionary
+        chunksize(int): number of objects derived between two yields
     """
     if root.phobostype not in ['link', 'submodel']:
         log(root.name + " is no valid 'link' or 'submodel' object.", "ERROR")
         return None
 
+    def progress(stage, done=1, total=1):
+        return ((derivation_stages.index(stage) + done / max(total, 1)) /
+                len(derivation_stages), stage)
+
     # define model name
     if name:
         modelname = name
@@ -856,6 +969,7 @@ def deriveModelDictionary(root, name='', objectlist=[]):
         'lights': {},
         'groups': {},
         'chains': {},
+        'annotations': {},
         'date': datetime.now().strftime("%Y%m%d_%H:%M"),
         'name': modelname
     }
@@ -869,21 +983,40 @@ def deriveModelDictionary(root, name='', objectlist=[]):
                                         include_hidden=False)
     linklist = [link for link in objectlist if link.phobostype == 'link']
 
+    # compact models store every element as record as soon as it is derived, the poses of all
+    # links, combined inertials, visuals and collisions share one array (the inertials of
+    # deriveLink are empty and take no pose)
+    poseallocator = None
+    if compact:
+        poseallocator = records.PoseAllocator(2 * len(linklist) + sum(
+            1 for obj in objectlist if obj.phobostype in ('visual', 'collision')))
+        model = records.Model(**model)
+
+    def record(recordtype, element):
+        return recordtype.fromDict(element, poseallocator) if compact else element
+
     # digest all the links to derive link and joint information
     log("Parsing links, joints and motors... " + (str(len(linklist))) + " total.", "INFO")
-    for link in linklist:
+    for number, link in enumerate(linklist):
+        if number and number % chunksize == 0:
+            yield progress('links', number, len(linklist))
         # parse link information (including inertia)
-        model['links'][nUtils.getObjectName(link, 'link')] = deriveLink(link)
+        linkdict = deriveLink(link)
+        indexAnnotations(model['annotations'], 'link', linkdict)
+        model['links'][nUtils.getObjectName(link, 'link')] = record(records.Link, linkdict)
 
         if sUtils.getEffectiveParent(link):
             # joint may be None if link is a root
             jointdict = deriveJoint(link)
-            model['joints'][jointdict['name']] = jointdict
+            indexAnnotations(model['annotations'], 'joint', jointdict)
+            model['joints'][jointdict['name']] = record(records.Joint, jointdict)
 
             motordict = deriveMotor(link, jointdict)
             # motor may be None if no motor is attached
             if motordict:
+                indexAnnotations(model['annotations'], 'motor', motordict)
                 model['motors'][motordict['name']] = motordict
+    yield progress('links')
 
     # combine inertia for each link, taking into account inactive links
     inertials = (i for i in objectlist if i.phobostype == 'inertial' and 'inertial/inertia' in i)
@@ -913,20 +1046,25 @@ def deriveModelDictionary(root, name='', objectlist=[]):
 
         # add inertia to model
         inertia = inertiamodel.inertiaMatrixToList(inertia)
-        model['links'][linkname]['inertial'] = {
+        model['links'][linkname]['inertial'] = record(records.Inertial, {
             'mass': mass, 'inertia': inertia,
             'pose': {'translation': list(com),
                      'rotation_euler': [0, 0, 0]}
-        }
+        })
+    yield progress('inertials')
 
     # complete link information by parsing visuals and collision objects
     log("Parsing visual and collision (approximation) objects...", 'INFO')
-    for obj in objectlist:
+    for number, obj in enumerate(objectlist):
+        if number and number % chunksize == 0:
+            yield progress('visuals and collisions', number, len(objectlist))
         if obj.phobostype in ['visual', 'collision']:
             props = deriveDictEntry(obj)
+            indexAnnotations(model['annotations'], obj.phobostype, props)
             parentname = nUtils.getObjectName(
                 sUtils.getEffectiveParent(obj, ignore_selection=bool(objectlist)))
-            model['links'][parentname][obj.phobostype][nUtils.getObjectName(obj)] = props
+            model['links'][parentname][obj.phobostype][nUtils.getObjectName(obj)] = record(
+                records.Visual if obj.phobostype == 'visual' else records.Collision, props)
         elif obj.phobostype == 'approxsphere':
             props = deriveDictEntry(obj)
             parentname = nUtils.getObjectName(
@@ -944,13 +1082,16 @@ def deriveModelDictionary(root, name='', objectlist=[]):
             except KeyError:
                 pass
         link['collision_bitmask'] = bitmask
+    yield progress('visuals and collisions')
 
     # parse sensors and controllers
     log("Parsing sensors and controllers...", 'INFO')
     for obj in objectlist:
         if obj.phobostype in ['sensor', 'controller']:
             props = deriveDictEntry(obj)
+            indexAnnotations(model['annotations'], obj.phobostype, props)
             model[obj.phobostype + 's'][nUtils.getObjectName(obj)] = props
+    yield progress('sensors and controllers')
 
     # parse materials
     log("Parsing materials...", 'INFO')
@@ -964,6 +1105,9 @@ def deriveModelDictionary(root, name='', objectlist=[]):
                     linkname = nUtils.getObjectName(sUtils.getEffectiveParent(obj,
                         ignore_selection=bool(objectlist)))
                     model['links'][linkname]['visual'][nUtils.getObjectName(obj)]['material'] = mat.name
+    for material in model['materials'].values():
+        indexAnnotations(model['annotations'], 'material', material)
+    yield progress('materials')
 
     # identify unique meshes
     log("Parsing meshes...", "INFO")
@@ -979,6 +1123,7 @@ def deriveModelDictionary(root, name='', objectlist=[]):
                         model['meshes'][lod.object.data.name] = lod.object
         except KeyError:
             log("Undefined geometry type in object " + obj.name, "ERROR")
+    yield progress('meshes')
 
     # gather information on groups of objects
     log("Parsing groups...", 'INFO')
@@ -1043,9 +1188,10 @@ def deriveModelDictionary(root, name='', objectlist=[]):
     # add additional data to model
     model.update(deriveTextData(model['name']))
 
-    # shorten numbers in dictionary to n decimalPlaces and return it
-    log("Rounding numbers...", "INFO")
-    return roundFloatsInDict(model, ioUtils.getExpSettings().decimalPlaces)
+    # numbers are rounded to the export settings' decimalPlaces by the writers
+    if compact:
+        model.transforms = poseallocator.transforms[:poseallocator.index]
+    return model
 
 
 def buildModelFromDictionary(model):
@@ -1059,7 +1205,21 @@ def buildModelFromDictionary(model):
     """
     # DOCU add some more docstring
     log("Creating Blender model...", 'INFO')
+    with nUtils.NameAllocator(bpy.data.objects.keys()):
+        _buildModelObjects(model)
+
+    # display all objects after import
+    for obj in bpy.data.objects:
+        bUtils.setObjectLayersActive(obj)
+    bpy.ops.object.mode_set(mode='OBJECT')
+    bpy.ops.object.select_all(action='SELECT')
+    bpy.ops.view3d.view_selected()
+    # update transformations
+    bUtils.update()
+
 
+def _buildModelObjects(model):
+    """Creates the objects of a model, see buildModelFromDictionary."""
     log("Creating links...", 'INFO')
     for l in model['links']:
         link = model['links'][l]
@@ -1135,15 +1295,6 @@ def buildModelFromDictionary(model):
     except KeyError:
         log("No lights in model " + model['name'], 'INFO')
 
-    # display all objects after import
-    for obj in bpy.data.objects:
-        bUtils.setObjectLayersActive(obj)
-    bpy.ops.object.mode_set(mode='OBJECT')
-    bpy.ops.object.select_all(action='SELECT')
-    bpy.ops.view3d.view_selected()
-    # update transformations
-    bUtils.update()
-
 
 def createGroup(group):
     # TODO lots of code missing here... make it a dev branch
@@ -32,16 +32,102 @@ Created on 13 Feb 2014
 """
 
 import os
+import base64
+from collections.abc import MutableMapping
 import yaml
+import numpy
 import bpy
+import bmesh
+from bpy.app.handlers import persistent
 import phobos.utils.selection as sUtils
 import phobos.utils.editing as eUtils
 import phobos.utils.naming as nUtils
 import phobos.utils.blender as bUtils
-import phobos.utils.general as gUtils
-import phobos.utils.io as ioUtils
+import phobos.model.kinematics as kinematics
 from phobos.phoboslog import log
-from phobos.utils.io import securepath
+from phobos.utils.io import securepath, YAMLDumper
+
+
+class ObjectPose(MutableMapping):
+    """The pose of an object, which reads like a dictionary of its representations.
+
+    Only the transform is stored, the other representations are computed on first access and
+    kept for later ones:
+        *rawmatrix*: mathutils.Matrix
+        *matrix*: list representation (list of lists) of mathutils.Matrix
+        *translation*: list (according to mathutils.Matrix.to_translation)
+        *rotation_euler*: list (according to mathutils.Matrix.to_euler)
+        *rotation_quaternion*: list (according to mathutils.Matrix.to_quaternion)
+
+    Representations can be overwritten and deleted like dictionary entries. Poses are written
+    to YAML as dictionaries without *rawmatrix*.
+    """
+    __slots__ = ('rawmatrix', 'values')
+
+    keylist = ('rawmatrix', 'matrix', 'translation', 'rotation_euler', 'rotation_quaternion')
+
+    def __init__(self, matrix):
+        self.rawmatrix = matrix
+        self.values = {}
+
+    def _compute(self, key):
+        matrix = self.rawmatrix
+        if key == 'matrix':
+            return [list(vector) for vector in matrix]
+        elif key == 'translation':
+            return list(matrix.to_translation())
+        elif key == 'rotation_euler':
+            return list(matrix.to_euler())
+        return list(matrix.to_quaternion())
+
+    def __getitem__(self, key):
+        if key in self.values:
+            value = self.values[key]
+        elif key == 'rawmatrix':
+            value = self.rawmatrix
+        elif key in self.keylist:
+            value = self.values[key] = self._compute(key)
+        else:
+            raise KeyError(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.values[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.values[key] = None
+
+    def __contains__(self, key):
+        if key in self.values:
+            return self.values[key] is not None
+        return key in self.keylist
+
+    def __iter__(self):
+        for key in self.keylist:
+            if key in self:
+                yield key
+        for key in self.values:
+            if key not in self.keylist and self.values[key] is not None:
+                yield key
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+    def toDict(self):
+        """Returns the pose as dictionary of all its representations except *rawmatrix*."""
+        return {key: value for key, value in self.items() if key != 'rawmatrix'}
+
+
+def _representObjectPose(dumper, pose):
+    return dumper.represent_dict(pose.toDict())
+
+
+yaml.add_representer(ObjectPose, _representObjectPose)
+YAMLDumper.add_representer(ObjectPose, _representObjectPose)
 
 
 def deriveObjectPose(obj):
@@ -50,7 +136,8 @@ def deriveObjectPose(obj):
     The transformations of the object are calculated according to
     phobos.utils.edititing.getCombinedTransform.
 
-    The returned dictionary contains this information:
+    The returned ObjectPose provides this information like a dictionary, computing each of
+    the representations only when first accessed:
         *rawmatrix*: mathutils.Matrix
         *matrix*: list representation (list of lists) of mathutils.Matrix
         *translation*: list (according to mathutils.Matrix.to_translation)
@@ -61,23 +148,107 @@ def deriveObjectPose(obj):
     :type obj: bpy.types.Object
 
     :return: pose information of the object
-    :rtype: dict
+    :rtype: ObjectPose
 
     .. seealso phobos.utils.editing.getCombinedTransform
     """
     effectiveparent = sUtils.getEffectiveParent(obj)
-    matrix = eUtils.getCombinedTransform(obj, effectiveparent)
+    return ObjectPose(eUtils.getCombinedTransform(obj, effectiveparent))
 
-    pose = {'rawmatrix': matrix,
-            'matrix': [list(vector) for vector in list(matrix)],
-            'translation': list(matrix.to_translation()),
-            'rotation_euler': list(matrix.to_euler()),
-            'rotation_quaternion': list(matrix.to_quaternion())
-            }
-    return pose
 
-# TODO delete me?
-#def bakeAllPoses(objlist, modelname, posename="", savetosubfolder=True):
+def _getBakePath():
+    """Returns the output folder for baked models according to the export settings."""
+    if bpy.context.scene.phobosexportsettings.relativePath:
+        # CHECK careful with path consistency (Windows)
+        outpath = securepath(os.path.expanduser(os.path.join(bpy.path.abspath("//"), bpy.context.scene.phobosexportsettings.path)))
+    else:
+        # CHECK careful with path consistency (Windows)
+        outpath = securepath(os.path.expanduser(bpy.context.scene.phobosexportsettings.path))
+
+    if bpy.context.scene.phobosexportsettings.structureExport:
+        securepath(os.path.join(outpath, 'bakes'))
+        outpath = os.path.join(outpath, 'bakes/')
+    return outpath
+
+
+class RestPose(object):
+    """Context manager which moves a model to its rest pose and restores the current pose on exit.
+
+    The location, rotation and scale of all pose bones in the model's pose bone map (see
+    getPoseBoneMap) are saved and reset, so transforms derived inside of the context do not
+    contain any joint motion.
+    """
+
+    def __init__(self, modelname):
+        self.modelname = modelname
+        self.saved = []
+
+    def __enter__(self):
+        for link, bone, prismatic in getPoseBoneMap(self.modelname).values():
+            self.saved.append((bone, bone.location.copy(), bone.rotation_euler.copy(),
+                               bone.rotation_quaternion.copy(), bone.scale.copy()))
+            bone.location = (0., 0., 0.)
+            bone.rotation_euler = (0., 0., 0.)
+            bone.rotation_quaternion = (1., 0., 0., 0.)
+            bone.scale = (1., 1., 1.)
+        bpy.context.scene.update()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for bone, location, rotation_euler, rotation_quaternion, scale in self.saved:
+            bone.location = location
+            bone.rotation_euler = rotation_euler
+            bone.rotation_quaternion = rotation_quaternion
+            bone.scale = scale
+        self.saved = []
+        bpy.context.scene.update()
+
+
+def _decimateLinkVisuals(link, visuals, decimate_type, decimate_parameter):
+    """Joins the visuals of one link and decimates them.
+
+    Args:
+      link(bpy.types.Object): link the visuals belong to
+      visuals(list): visual objects of the link
+      decimate_type(str): type of the Decimate modifier
+      decimate_parameter(float): ratio, iterations or angle limit depending on decimate_type
+
+    Returns:
+      tuple -- N x 3 array of vertices in the link frame, list of faces as vertex index tuples
+
+    """
+    scene = bpy.context.scene
+    bm = bmesh.new()
+    for visual in visuals:
+        mesh = visual.to_mesh(scene, True, 'PREVIEW')
+        mesh.transform(eUtils.getCombinedTransform(visual, link))
+        bm.from_mesh(mesh)
+        bpy.data.meshes.remove(mesh)
+    bmesh.ops.remove_doubles(bm, verts=bm.verts, dist=0.0001)
+    joined = bpy.data.meshes.new(link.name + '_bake')
+    bm.to_mesh(joined)
+    bm.free()
+
+    obj = bpy.data.objects.new(link.name + '_bake', joined)
+    scene.objects.link(obj)
+    modifier = obj.modifiers.new('Decimate', 'DECIMATE')
+    modifier.decimate_type = decimate_type
+    if decimate_type == 'COLLAPSE':
+        modifier.ratio = decimate_parameter
+    elif decimate_type == 'UNSUBDIV':
+        modifier.iterations = int(decimate_parameter)
+    elif decimate_type == 'DISSOLVE':
+        modifier.angle_limit = decimate_parameter
+    reduced = obj.to_mesh(scene, True, 'PREVIEW')
+    scene.objects.unlink(obj)
+    bpy.data.objects.remove(obj)
+    bpy.data.meshes.remove(joined)
+
+    vertices = numpy.empty(3 * len(reduced.vertices))
+    reduced.vertices.foreach_get('co', vertices)
+    faces = [tuple(polygon.vertices) for polygon in reduced.polygons]
+    bpy.data.meshes.remove(reduced)
+    return vertices.reshape((-1, 3)), faces
 
 
 def bakeModel(objlist, modelname, posename="", decimate_type='COLLAPSE', decimate_parameter=0.1):
@@ -93,20 +264,7 @@ def bakeModel(objlist, modelname, posename="", decimate_type='COLLAPSE', decimat
     Returns:
 
     """
-    if bpy.context.scene.phobosexportsettings.relativePath:
-        # CHECK careful with path consistency (Windows)
-        outpath = securepath(os.path.expanduser(os.path.join(bpy.path.abspath("//"), bpy.context.scene.phobosexportsettings.path)))
-    else:
-        # CHECK careful with path consistency (Windows)
-        outpath = securepath(os.path.expanduser(bpy.context.scene.phobosexportsettings.path))
-
-    # TODO delete me?
-    #bake_outpath = securepath(os.path.join(outpath, modelname) if savetosubfolder else outpath)
-    bake_outpath = outpath
-
-    if bpy.context.scene.phobosexportsettings.structureExport:
-        securepath(os.path.join(bake_outpath, 'bakes'))
-        bake_outpath = os.path.join(bake_outpath, 'bakes/')
+    bake_outpath = _getBakePath()
 
     export_name = modelname + '_' + posename
 
@@ -146,7 +304,7 @@ def bakeModel(objlist, modelname, posename="", decimate_type='COLLAPSE', decimat
 
         obj.hide_render = True
         previewfile = export_name
-        bUtils.createPreview(visuals, export_path=bake_outpath, modelname=modelname, previewfile=previewfile)
+        bUtils.createPreview(visuals, export_path=bake_outpath, modelname=previewfile)
 
         obj.select = True
 
@@ -157,10 +315,500 @@ def bakeModel(objlist, modelname, posename="", decimate_type='COLLAPSE', decimat
         log("No visuals to bake!", "WARNING")
 
 
+def bakePoses(objlist, model, posenames=None, decimate_type='COLLAPSE', decimate_parameter=0.1,
+              previews=True):
+    """Bakes a model in several of its stored poses to simplified .obj files.
+
+    In contrast to calling bakeModel for every pose, the visuals of every link are joined and
+    decimated only once. The reduced meshes are then placed in every pose by the link transforms
+    computed with phobos.model.kinematics.forwardKinematics and written directly to the .obj
+    files, which only contain the vertices and faces of the meshes. As with Blender's .obj
+    exporter, coordinates are converted to a Y-up frame. Joints not defined in a pose are kept
+    at zero.
+
+    Previews still need the pose to be applied to the Blender model and rendered, so they
+    make up most of the time of the bake if enabled.
+
+    The visuals are decimated in the rest pose of the model (see RestPose), so the model has to
+    be derived in its rest pose as well. The pose of the model is restored after baking.
+
+    Args:
+      objlist(list): the objects of the model to bake
+      model(dict): the model dictionary as returned by deriveModelDictionary in the rest pose
+      posenames(list, optional): names of the poses to bake, all stored poses if None
+      decimate_type: (Default value = 'COLLAPSE')
+      decimate_parameter: (Default value = 0.1)
+      previews(bool, optional): render a preview of every pose (Default value = True)
+
+    Returns:
+
+    """
+    modelname = model['name']
+    posestore = getPoseStore(modelname)
+    if posenames is None:
+        posenames = posestore.getPoseNames()
+    posenames = [name for name in posenames if name in posestore]
+    visuals = [o for o in objlist if ("phobostype" in o and o.phobostype == "visual")]
+    if not visuals or not posenames:
+        log("No visuals or poses to bake!", "WARNING")
+        return
+    bake_outpath = _getBakePath()
+    log("Baking {0} poses of model {1} to {2}".format(len(posenames), modelname, bake_outpath),
+        "INFO")
+
+    compiled = kinematics.compileKinematics(model)
+    linkindices = {name: i for i, name in enumerate(compiled['links'])}
+    visualsbylink = {}
+    for visual in visuals:
+        link = sUtils.getEffectiveParent(visual)
+        if link and nUtils.getObjectName(link) in linkindices:
+            visualsbylink.setdefault(link, []).append(visual)
+        else:
+            log("Visual " + visual.name + " is not part of the model, skipping it.", "WARNING")
+
+    with RestPose(modelname):
+        # decimate the visuals of every link once
+        log("Decimating visuals of {0} links...".format(len(visualsbylink)), "INFO")
+        meshes = []
+        facelines = []
+        offset = 1
+        for link, linkvisuals in visualsbylink.items():
+            vertices, faces = _decimateLinkVisuals(link, linkvisuals, decimate_type,
+                                                   decimate_parameter)
+            meshes.append((linkindices[nUtils.getObjectName(link)], vertices))
+            facelines.extend('f ' + ' '.join(str(index + offset) for index in face)
+                             for face in faces)
+            offset += len(vertices)
+        facetext = '\n'.join(facelines) + '\n'
+
+        # compose all poses from the reduced meshes, converting from Z-up to Y-up
+        configurations = kinematics.configurationArray(
+            compiled, [posestore.getPose(posename) for posename in posenames])
+        world = kinematics.forwardKinematics(compiled, configurations)
+        yup = numpy.array([[1., 0., 0.], [0., 0., 1.], [0., -1., 0.]])
+        for k, posename in enumerate(posenames):
+            export_name = modelname + '_' + posename
+            with open(os.path.join(bake_outpath, export_name + '.obj'), 'w') as objfile:
+                objfile.write('# baked pose ' + posename + ' of model ' + modelname + '\n')
+                objfile.write('o ' + export_name + '\n')
+                for linkindex, vertices in meshes:
+                    transform = world[k, linkindex]
+                    posed = numpy.dot(vertices, transform[:3, :3].T) + transform[:3, 3]
+                    numpy.savetxt(objfile, numpy.dot(posed, yup.T), fmt='v %.6f %.6f %.6f')
+                objfile.write(facetext)
+
+        if previews:
+            with bUtils.PreviewRenderer() as renderer:
+                for posename in iteratePoses(modelname, posenames):
+                    renderer.render(visuals, os.path.join(bake_outpath,
+                                                          modelname + '_' + posename + '.png'))
+    log("Done baking...", "INFO")
+
+
+class PoseStore(object):
+    """Library of joint poses of one model, backed by a numpy array.
+
+    Every pose is one row of the array, every joint one column; joints which are not part of a
+    pose are stored as NaN. Rows and columns are looked up by name, so adding, loading and
+    removing a pose only costs O(joints), independent of the size of the library.
+
+    Stores can be saved as *.npz* files or packed into a text payload for Blender text blocks.
+    *legacy* is set for stores unpacked from the former SMURF poses format.
+    """
+
+    #: marker identifying packed pose stores in text blocks
+    marker = 'phobos_posestore'
+
+    def __init__(self, joints=(), names=(), values=None):
+        self.joints = list(joints)
+        self.jointindex = {joint: i for i, joint in enumerate(self.joints)}
+        self.names = list(names)
+        self.rows = {name: i for i, name in enumerate(self.names)}
+        self._values = numpy.full((max(len(self.names), 8), max(len(self.joints), 8)), numpy.nan)
+        self.legacy = False
+        if values is not None and len(self.names):
+            self._values[:len(self.names), :len(self.joints)] = values
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, posename):
+        return posename in self.rows
+
+    @property
+    def values(self):
+        """Returns the P x J array of all stored joint values."""
+        return self._values[:len(self.names), :len(self.joints)]
+
+    def getPoseNames(self):
+        """Returns the names of all stored poses in the order they were added."""
+        return list(self.names)
+
+    def addPose(self, posename, joints):
+        """Stores a pose, overwriting an existing pose of the same name.
+
+        Args:
+          posename(str): name of the pose
+          joints(dict): joint values by joint name
+
+        Returns:
+
+        """
+        for joint in joints:
+            if joint not in self.jointindex:
+                if len(self.joints) == self._values.shape[1]:
+                    grown = numpy.full((self._values.shape[0], 2 * self._values.shape[1]), numpy.nan)
+                    grown[:, :self._values.shape[1]] = self._values
+                    self._values = grown
+                self.jointindex[joint] = len(self.joints)
+                self.joints.append(joint)
+        if posename not in self.rows:
+            if len(self.names) == self._values.shape[0]:
+                grown = numpy.full((2 * self._values.shape[0], self._values.shape[1]), numpy.nan)
+                grown[:self._values.shape[0]] = self._values
+                self._values = grown
+            self.rows[posename] = len(self.names)
+            self.names.append(posename)
+        row = self._values[self.rows[posename]]
+        row[:] = numpy.nan
+        for joint, value in joints.items():
+            row[self.jointindex[joint]] = value
+
+    def getPose(self, posename):
+        """Returns the joint values of a stored pose.
+
+        Args:
+          posename(str): name of the pose
+
+        Returns:
+          dict -- joint values by joint name, None if there is no such pose
+
+        """
+        if posename not in self.rows:
+            return None
+        row = self._values[self.rows[posename], :len(self.joints)]
+        return {self.joints[i]: float(row[i]) for i in numpy.flatnonzero(~numpy.isnan(row))}
+
+    def removePose(self, posename):
+        """Removes a pose by moving the last stored pose into its row.
+
+        Args:
+          posename(str): name of the pose
+
+        Returns:
+
+        """
+        row = self.rows.pop(posename)
+        last = self.names.pop()
+        if last != posename:
+            self._values[row] = self._values[len(self.names)]
+            self.names[row] = last
+            self.rows[last] = row
+        self._values[len(self.names)] = numpy.nan
+
+    def toDict(self):
+        """Returns the library in the dictionary format of the SMURF poses file."""
+        return {name: {'name': name, 'joints': self.getPose(name)} for name in self.names}
+
+    @classmethod
+    def fromDict(cls, posedict):
+        """Creates a pose store from a dictionary in the format of the SMURF poses file."""
+        store = cls()
+        for posename, pose in (posedict or {}).items():
+            store.addPose(posename, pose.get('joints', {}))
+        return store
+
+    def pack(self):
+        """Returns the library as YAML text with the values encoded in base64."""
+        values = numpy.ascontiguousarray(self.values, dtype='<f8')
+        return yaml.dump({self.marker: 1,
+                          'joints': self.joints,
+                          'names': self.names,
+                          'values': base64.b64encode(values.tobytes()).decode('ascii')},
+                         default_flow_style=None, width=2**31)
+
+    @classmethod
+    def unpack(cls, text):
+        """Creates a pose store from packed text. Text in the format of the SMURF poses file is
+        converted for backwards compatibility.
+        """
+        data = yaml.load(text) if text else None
+        if not data:
+            return cls()
+        if cls.marker not in data:
+            store = cls.fromDict(data)
+            store.legacy = True
+            return store
+        values = numpy.frombuffer(base64.b64decode(data['values']), dtype='<f8')
+        return cls(data['joints'], data['names'],
+                   values.reshape((len(data['names']), len(data['joints']))))
+
+    def save(self, filepath):
+        """Saves the library to an *.npz* file.
+
+        Args:
+          filepath(str): path of the file
+
+        Returns:
+
+        """
+        numpy.savez(filepath, joints=numpy.array(self.joints, dtype=str),
+                    names=numpy.array(self.names, dtype=str), values=self.values)
+
+    @classmethod
+    def load(cls, filepath):
+        """Loads a library from an *.npz* file.
+
+        Args:
+          filepath(str): path of the file
+
+        Returns:
+          PoseStore -- the loaded library
+
+        """
+        with numpy.load(filepath) as data:
+            return cls(data['joints'].tolist(), data['names'].tolist(), data['values'])
+
+
+# pose stores of the models in the current file and names of those changed since the last flush
+_posestores = {}
+_changedstores = set()
+
+
+def getPoseStore(modelname):
+    """Returns the pose library of a model.
+
+    The library is read from the text block '<modelname>::poses' only on first access and kept
+    in memory afterwards. Changes are written back to the text block by flushPoseStores, which
+    is called whenever the file is saved.
+
+    Args:
+      modelname(str): name of the model
+
+    Returns:
+      PoseStore -- pose library of the model
+
+    """
+    if modelname not in _posestores:
+        filename = modelname + '::poses'
+        text = bUtils.readTextFile(filename) if filename in bpy.data.texts else ''
+        _posestores[modelname] = PoseStore.unpack(text)
+        if _posestores[modelname].legacy:
+            _convertLegacyPoses(modelname, _posestores[modelname])
+    return _posestores[modelname]
+
+
+def _convertLegacyPoses(modelname, posestore):
+    """Removes the values of prismatic joints from poses stored in the former format.
+
+    Former versions stored the y rotation of the pose bones for all joints, which is
+    meaningless for prismatic joints, whose values are now their location along the y-axis.
+    The converted store is written back in the current format on the next flush.
+    """
+    prismatic = [joint for joint, (link, bone, isprismatic) in getPoseBoneMap(modelname).items()
+                 if isprismatic and joint in posestore.jointindex]
+    for joint in prismatic:
+        posestore.values[:, posestore.jointindex[joint]] = numpy.nan
+    if prismatic:
+        log("Dropped the stored values of prismatic joints " + ', '.join(prismatic) +
+            " of model " + modelname + ", as they were stored as rotations.", "WARNING")
+    posestore.legacy = False
+    _changedstores.add(modelname)
+
+
+def flushPoseStores():
+    """Writes all changed pose libraries to their text blocks."""
+    for modelname in _changedstores:
+        bUtils.updateTextFile(modelname + '::poses', _posestores[modelname].pack())
+    _changedstores.clear()
+
+
+@persistent
+def flushPoseStoresHandler(dummy):
+    flushPoseStores()
+
+
+@persistent
+def clearPoseStoresHandler(dummy):
+    _posestores.clear()
+    _changedstores.clear()
+    _bonemaps.clear()
+
+
+# joint name -> (link, pose bone, prismatic) maps of the models in the current file
+_bonemaps = {}
+
+
+def getPoseBoneMap(modelname, refresh=False):
+    """Returns the map of joint names to the pose bones of a model's links.
+
+    The map is built on first access and cached afterwards, so applying a pose does not need to
+    search the scene. It is rebuilt if *refresh* is set or the cached links no longer exist.
+    Rotations of all mapped bones are set to 'XYZ' euler mode once while building the map.
+
+    Args:
+      modelname(str): name of the model
+      refresh(bool, optional): rebuild the map even if it is cached (Default value = False)
+
+    Returns:
+      dict -- tuples (link, pose bone, prismatic) by joint name
+
+    """
+    if not refresh and modelname in _bonemaps:
+        try:
+            # accessing removed objects raises a ReferenceError
+            for link, bone, prismatic in _bonemaps[modelname].values():
+                link.name
+            return _bonemaps[modelname]
+        except ReferenceError:
+            log("Links of model " + modelname + " changed, rebuilding pose bone map.", "DEBUG")
+
+    bonemap = {}
+    root = sUtils.getObjectByProperty('modelname', modelname)
+    if root:
+        for link in sUtils.getChildren(root, ('link',)):
+            if ('joint/type' not in link or link['joint/type'] in ['fixed', 'floating'] or
+                    not link.pose or 'Bone' not in link.pose.bones):
+                continue
+            bone = link.pose.bones['Bone']
+            bone.rotation_mode = 'XYZ'
+            bonemap[nUtils.getObjectName(link, 'joint')] = (
+                link, bone, link['joint/type'] == 'prismatic')
+    _bonemaps[modelname] = bonemap
+    return bonemap
+
+
+def _poseColumns(bonemap, joints):
+    """Returns the (column, pose bone, prismatic) tuples of the joints present in the bone map."""
+    return [(column, bonemap[joint][1], bonemap[joint][2])
+            for column, joint in enumerate(joints) if joint in bonemap]
+
+
+def _writePoseRow(columns, row):
+    """Writes one row of joint values to the pose bones, skipping joints not in the pose."""
+    for column, bone, prismatic in columns:
+        value = row[column]
+        if numpy.isnan(value):
+            continue
+        if prismatic:
+            bone.location.y = value
+        else:
+            bone.rotation_euler.y = value
+
+
+def readPose(modelname, selected_only=False):
+    """Reads the current joint values of a model from its pose bones.
+
+    Revolute and continuous joints are read from the bone's rotation around its y-axis,
+    prismatic joints from its location along the y-axis. Poses stored in the former format
+    held rotations for prismatic joints as well, see _convertLegacyPoses.
+
+    Args:
+      modelname(str): name of the model
+      selected_only(bool, optional): only read the joints of selected links (Default value = False)
+
+    Returns:
+      dict -- joint values by joint name
+
+    """
+    return {joint: bone.location.y if prismatic else bone.rotation_euler.y
+            for joint, (link, bone, prismatic) in getPoseBoneMap(modelname).items()
+            if link.select or not selected_only}
+
+
+def applyPose(modelname, joints):
+    """Applies joint values to the pose bones of a model.
+
+    The values are written directly to the bones, so neither the mode nor the selection is
+    changed. Joints not part of the model are ignored.
+
+    Args:
+      modelname(str): name of the model
+      joints(dict): joint values by joint name
+
+    Returns:
+      int -- number of joints which have been set
+
+    """
+    jointnames = list(joints)
+    columns = _poseColumns(getPoseBoneMap(modelname), jointnames)
+    _writePoseRow(columns, [joints[joint] for joint in jointnames])
+    return len(columns)
+
+
+def _poseRows(posestore, posenames):
+    """Returns the rows of the named poses in a pose store, logging unknown names."""
+    rows = []
+    for posename in posenames:
+        if posename in posestore:
+            rows.append(posestore.rows[posename])
+        else:
+            log("No pose with name " + posename + " stored, skipping it.", "WARNING")
+    return rows
+
+
+def iteratePoses(modelname, posenames=None):
+    """Applies a sequence of stored poses one after another.
+
+    After each pose the scene is updated and the name of the pose is yielded, so the caller
+    can e.g. read world transforms or export the model in every pose. Poses not stored for the
+    model are skipped.
+
+    Args:
+      modelname(str): name of the model
+      posenames(list, optional): names of the poses, all stored poses if None
+
+    Returns:
+      generator -- names of the applied poses
+
+    """
+    posestore = getPoseStore(modelname)
+    if posenames is None:
+        posenames = posestore.getPoseNames()
+    columns = _poseColumns(getPoseBoneMap(modelname), posestore.joints)
+    for row in _poseRows(posestore, posenames):
+        _writePoseRow(columns, posestore.values[row])
+        bpy.context.scene.update()
+        yield posestore.names[row]
+
+
+def keyframePoses(modelname, posenames=None, startframe=None, step=10):
+    """Inserts keyframes for a sequence of stored poses to play them back as animation.
+
+    Every pose is keyed on all joints it defines, the poses follow each other in steps of
+    *step* frames beginning at *startframe*.
+
+    Args:
+      modelname(str): name of the model
+      posenames(list, optional): names of the poses, all stored poses if None
+      startframe(int, optional): frame of the first pose, the current frame if None
+      step(int, optional): number of frames between two poses (Default value = 10)
+
+    Returns:
+      int -- frame of the last keyed pose
+
+    """
+    posestore = getPoseStore(modelname)
+    if posenames is None:
+        posenames = posestore.getPoseNames()
+    frame = bpy.context.scene.frame_current if startframe is None else startframe
+    columns = _poseColumns(getPoseBoneMap(modelname), posestore.joints)
+    for row in _poseRows(posestore, posenames):
+        values = posestore.values[row]
+        _writePoseRow(columns, values)
+        for column, bone, prismatic in columns:
+            if not numpy.isnan(values[column]):
+                bone.keyframe_insert('location' if prismatic else 'rotation_euler', index=1,
+                                     frame=frame)
+        frame += step
+    return frame - step
+
+
 def storePose(root, posename):
     """Stores the current pose of all of a model's selected joints.
 
-    Existing poses of the same name will be overwritten.
+    Existing poses of the same name will be overwritten. The joint values are read directly
+    from the pose bones, the selection is not changed.
 
     Args:
       root(bpy_types.Object): root of the model the pose belongs to
@@ -171,23 +819,10 @@ def storePose(root, posename):
 
     """
     if root:
-        filename = nUtils.getModelName(root) + '::poses'
-        posedict = yaml.load(bUtils.readTextFile(filename))
-        if not posedict:
-            posedict = {posename: {'name': posename, 'joints': {}}}
-        else:
-            posedict[posename] = {'name': posename, 'joints': {}}
-        links = sUtils.getChildren(root, ('link',), True, False)
-        sUtils.selectObjects([root]+links, clear=True, active=0)
-        bpy.ops.object.mode_set(mode='POSE')
-        for link in (link for link in links if 'joint/type' in link and
-                     link['joint/type'] not in ['fixed', 'floating']):
-            link.pose.bones['Bone'].rotation_mode = 'XYZ'
-            posedict[posename]['joints'][nUtils.getObjectName(link, 'joint')] = link.pose.bones[
-                'Bone'].rotation_euler.y
-        bpy.ops.object.mode_set(mode='OBJECT')
-        posedict = gUtils.roundFloatsInDict(posedict, ioUtils.getExpSettings().decimalPlaces)
-        bUtils.updateTextFile(filename, yaml.dump(posedict, default_flow_style=False))
+        modelname = nUtils.getModelName(root)
+        getPoseBoneMap(modelname, refresh=True)
+        getPoseStore(modelname).addPose(posename, readPose(modelname, selected_only=True))
+        _changedstores.add(modelname)
     else:
         log("No model root provided to store the pose for", "ERROR")
 
@@ -200,32 +835,16 @@ def loadPose(modelname, posename):
     :param posename: the name the pose is stored under
     :type posename: str
     """
-
-    load_file = bUtils.readTextFile(modelname + '::poses')
-    if load_file == '':
+    posestore = getPoseStore(modelname)
+    if not posestore:
         log('No poses stored.', 'ERROR')
         return
 
-    loadedposes = yaml.load(load_file)
-    if posename not in loadedposes:
+    if posename not in posestore:
         log('No pose with name ' + posename + ' stored for model ' + modelname, 'ERROR')
         return
-    prev_mode = bpy.context.mode
-    pose = loadedposes[posename]
-
-    # apply rotations to all joints defined by the pose
-    try:
-        bpy.ops.object.mode_set(mode='POSE')
-        for obj in sUtils.getObjectsByPhobostypes(['link']):
-            if nUtils.getObjectName(obj, 'joint') in pose['joints']:
-                obj.pose.bones['Bone'].rotation_mode = 'XYZ'
-                obj.pose.bones['Bone'].rotation_euler.y = float(
-                    pose['joints'][nUtils.getObjectName(obj, 'joint')])
-    except KeyError as error:
-        log("Could not apply the pose: " + str(error), 'ERROR')
-    finally:
-        # restore previous mode
-        bpy.ops.object.mode_set(mode=prev_mode)
+    columns = _poseColumns(getPoseBoneMap(modelname), posestore.joints)
+    _writePoseRow(columns, posestore.values[posestore.rows[posename]])
 
 
 def getPoses(modelname):
@@ -238,8 +857,14 @@ def getPoses(modelname):
       A list containing the poses' names.
 
     """
-    load_file = bUtils.readTextFile(modelname + '::poses')
-    if load_file == '':
-        return []
-    poses = yaml.load(load_file)
-    return poses.keys()
+    return getPoseStore(modelname).getPoseNames()
+
+
+def register():
+    bpy.app.handlers.save_pre.append(flushPoseStoresHandler)
+    bpy.app.handlers.load_post.append(clearPoseStoresHandler)
+
+
+def unregister():
+    bpy.app.handlers.save_pre.remove(flushPoseStoresHandler)
+    bpy.app.handlers.load_post.remove(clearPoseStoresHandler)
@@ -0,0 +1,375 @@
+#!/usr/bin/python
+# coding=utf-8
+
+"""
+.. module:: phobos.model.records
+    :platform: Unix, Windows, Mac
+    :synopsis: Compact typed representation of derived models
+
+Copyright 2018, University of Bremen & DFKI GmbH Robotics Innovation Center
+
+This file is part of Phobos, a Blender Add-On to edit robot models.
+
+Phobos is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License
+as published by the Free Software Foundation, either version 3
+of the License, or (at your option) any later version.
+
+Phobos is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Phobos.  If not, see <http://www.gnu.org/licenses/>.
+
+File records.py
+
+Created on 19 Mar 2018
+
+The records store the elements of a model in __slots__ instead of dictionaries, poses are kept
+as 4x4 transforms in one array per model instead of four separate representations, and no
+references to Blender objects are kept. All records can be used like the dictionaries returned
+by phobos.model.models.deriveModelDictionary, and can be converted to them via toDict.
+
+This module does not depend on Blender, so it can be used headless and in worker processes.
+"""
+
+import math
+from collections.abc import MutableMapping
+import numpy
+from phobos.model.kinematics import quaternionToMatrix
+
+#: keys of model dictionaries which are not kept in compact models, as they reference Blender
+#: objects or duplicate pose information
+DROPPED_KEYS = ('object', 'parentobj', 'rawmatrix')
+
+
+def _matrixToQuaternion(matrix):
+    """Returns the quaternion (w, x, y, z) of the rotation of a transform."""
+    matrix = matrix.tolist()
+    trace = matrix[0][0] + matrix[1][1] + matrix[2][2]
+    if trace > 0:
+        s = 0.5 / math.sqrt(trace + 1.0)
+        return [0.25 / s, (matrix[2][1] - matrix[1][2]) * s, (matrix[0][2] - matrix[2][0]) * s,
+                (matrix[1][0] - matrix[0][1]) * s]
+    i = max(range(3), key=lambda index: matrix[index][index])
+    j, k = (i + 1) % 3, (i + 2) % 3
+    s = 2.0 * math.sqrt(max(1.0 + matrix[i][i] - matrix[j][j] - matrix[k][k], 0.))
+    quaternion = [0.] * 4
+    quaternion[0] = (matrix[k][j] - matrix[j][k]) / s
+    quaternion[i + 1] = 0.25 * s
+    quaternion[j + 1] = (matrix[j][i] + matrix[i][j]) / s
+    quaternion[k + 1] = (matrix[k][i] + matrix[i][k]) / s
+    return quaternion
+
+
+def _matrixToEuler(matrix):
+    """Returns the XYZ euler angles of the rotation of a transform, as mathutils.Matrix.to_euler."""
+    matrix = matrix.tolist()
+    cy = math.hypot(matrix[0][0], matrix[1][0])
+    if cy > 1e-6:
+        return [math.atan2(matrix[2][1], matrix[2][2]), math.atan2(-matrix[2][0], cy),
+                math.atan2(matrix[1][0], matrix[0][0])]
+    return [math.atan2(-matrix[1][2], matrix[1][1]), math.atan2(-matrix[2][0], cy), 0.]
+
+
+def _eulerToMatrix(euler):
+    """Returns the 3x3 rotation matrix of XYZ euler angles."""
+    cx, cy, cz = numpy.cos(euler)
+    sx, sy, sz = numpy.sin(euler)
+    return numpy.array([[cy * cz, sx * sy * cz - cx * sz, cx * sy * cz + sx * sz],
+                        [cy * sz, sx * sy * sz + cx * cz, cx * sy * sz - sx * cz],
+                        [-sy, sx * cy, cx * cy]])
+
+
+def poseDictToMatrix(pose, out=None):
+    """Returns the 4x4 transform of a pose dictionary as returned by deriveObjectPose.
+
+    The transform is composed of the *translation* and the *rotation_quaternion* or
+    *rotation_euler*, so any scaling is dropped as in phobos.model.kinematics.poseToMatrix.
+    Only poses without rotation use the *matrix* if available.
+
+    Args:
+      pose(dict): pose dictionary
+      out(numpy.ndarray, optional): 4x4 array to write the transform to
+
+    Returns:
+      numpy.ndarray -- 4x4 transform
+
+    """
+    matrix = numpy.identity(4) if out is None else out
+    if out is not None:
+        matrix[...] = numpy.identity(4)
+    if not pose:
+        return matrix
+    if 'rotation_quaternion' in pose:
+        matrix[:3, :3] = quaternionToMatrix(pose['rotation_quaternion'])
+    elif 'rotation_euler' in pose:
+        matrix[:3, :3] = _eulerToMatrix(pose['rotation_euler'])
+    elif 'matrix' in pose:
+        matrix[...] = pose['matrix']
+    if 'translation' in pose:
+        matrix[:3, 3] = pose['translation']
+    return matrix
+
+
+class Pose(MutableMapping):
+    """A pose stored as 4x4 transform, which can be read like a pose dictionary.
+
+    The keys *translation*, *rotation_euler*, *rotation_quaternion* and *matrix* are computed
+    from the transform on access. Setting one of them updates the transform.
+    """
+    __slots__ = ('matrix',)
+
+    keylist = ('translation', 'rotation_euler', 'rotation_quaternion', 'matrix')
+
+    def __init__(self, matrix=None):
+        self.matrix = numpy.identity(4) if matrix is None else matrix
+
+    @classmethod
+    def fromDict(cls, pose, out=None):
+        """Creates a pose from a pose dictionary, optionally backed by the array *out*."""
+        return cls(poseDictToMatrix(pose, out))
+
+    def __getitem__(self, key):
+        if key == 'translation':
+            return self.matrix[:3, 3].tolist()
+        elif key == 'rotation_quaternion':
+            return _matrixToQuaternion(self.matrix)
+        elif key == 'rotation_euler':
+            return _matrixToEuler(self.matrix)
+        elif key == 'matrix':
+            return self.matrix.tolist()
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key == 'translation':
+            self.matrix[:3, 3] = value
+        elif key == 'rotation_quaternion':
+            self.matrix[:3, :3] = quaternionToMatrix(value)
+        elif key == 'rotation_euler':
+            self.matrix[:3, :3] = _eulerToMatrix(value)
+        elif key == 'matrix':
+            self.matrix[...] = value
+        else:
+            raise KeyError(key)
+
+    def __delitem__(self, key):
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.keylist
+
+    def __iter__(self):
+        return iter(self.keylist)
+
+    def __len__(self):
+        return len(self.keylist)
+
+    def toDict(self):
+        return {key: self[key] for key in self.keylist}
+
+
+class Record(MutableMapping):
+    """Base class of the model elements, storing their data in __slots__.
+
+    The keys of a record are its *fields* which are set and the keys of its *extra* dictionary,
+    which holds all further properties of the element. Fields listed in *defaults* are always
+    present, as in the dictionaries of the derived model. While unset, they are set to a new
+    empty container of the given type when read, so changes to the container are kept.
+    """
+    __slots__ = ('extra',)
+
+    fields = ()
+    defaults = {}
+
+    def __init__(self, **kwargs):
+        self.extra = None
+        for field in self.fields:
+            setattr(self, field, None)
+        for key, value in kwargs.items():
+            self[key] = value
+
+    @classmethod
+    def fromDict(cls, data, poses=None):
+        """Creates a record from an element dictionary of a derived model.
+
+        Args:
+          data(dict): the element dictionary
+          poses(PoseAllocator, optional): allocator the arrays of the poses are taken from
+
+        Returns:
+          Record -- the record
+
+        """
+        record = cls()
+        for key, value in data.items():
+            if key in DROPPED_KEYS:
+                continue
+            elif key == 'pose' and value is not None and not isinstance(value, Pose):
+                value = Pose.fromDict(value, poses.next() if poses else None)
+            record[key] = value
+        return record
+
+    def __getitem__(self, key):
+        if key in self.fields:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+            elif key in self.defaults:
+                value = self.defaults[key]()
+                setattr(self, key, value)
+                return value
+        elif self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self.fields:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self.fields and getattr(self, key) is not None:
+            setattr(self, key, None)
+        elif self.extra is not None and key in self.extra:
+            del self.extra[key]
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        if key in self.fields:
+            return getattr(self, key) is not None or key in self.defaults
+        return self.extra is not None and key in self.extra
+
+    def __iter__(self):
+        for field in self.fields:
+            if getattr(self, field) is not None or field in self.defaults:
+                yield field
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+    def __repr__(self):
+        return '{0}({1})'.format(type(self).__name__, self.get('name', ''))
+
+    def toDict(self):
+        """Returns the record as plain (nested) dictionary."""
+        return {key: toDict(value) for key, value in self.items()}
+
+
+class Visual(Record):
+    __slots__ = ('name', 'geometry', 'pose', 'material')
+    fields = __slots__
+
+
+class Collision(Record):
+    __slots__ = ('name', 'geometry', 'pose', 'bitmask')
+    fields = __slots__
+
+
+class Inertial(Record):
+    __slots__ = ('mass', 'inertia', 'pose')
+    fields = __slots__
+
+
+class Joint(Record):
+    __slots__ = ('name', 'type', 'parent', 'child', 'axis', 'limits')
+    fields = __slots__
+
+
+class Link(Record):
+    __slots__ = ('name', 'parent', 'children', 'pose', 'visual', 'collision', 'inertial',
+                 'approxcollision', 'collision_bitmask')
+    fields = __slots__
+    defaults = {'children': list, 'visual': dict, 'collision': dict, 'inertial': dict,
+                'approxcollision': list}
+
+    @classmethod
+    def fromDict(cls, data, poses=None):
+        link = super(Link, cls).fromDict(data, poses)
+        link.visual = {name: Visual.fromDict(visual, poses)
+                       for name, visual in data.get('visual', {}).items()} or None
+        link.collision = {name: Collision.fromDict(collision, poses)
+                          for name, collision in data.get('collision', {}).items()} or None
+        link.inertial = Inertial.fromDict(data['inertial'], poses) if data.get('inertial') else None
+        link.children = data.get('children') or None
+        link.approxcollision = data.get('approxcollision') or None
+        return link
+
+
+class PoseAllocator(object):
+    """Hands out 4x4 views of one array, so all poses of a model share a single buffer."""
+
+    def __init__(self, number):
+        self.transforms = numpy.empty((number, 4, 4))
+        self.index = 0
+
+    def next(self):
+        self.index += 1
+        return self.transforms[self.index - 1]
+
+
+class Model(Record):
+    """Compact representation of a model dictionary.
+
+    Links and joints are stored as records, all other parts of the model (sensors, motors,
+    materials, meshes, ...) are kept as they are. The poses of all links, visuals, collisions
+    and inertials share the array *transforms*.
+    """
+    __slots__ = ('name', 'links', 'joints', 'transforms')
+    fields = ('name', 'links', 'joints')
+    defaults = {'links': dict, 'joints': dict}
+
+    def __init__(self, **kwargs):
+        self.transforms = None
+        super(Model, self).__init__(**kwargs)
+
+    @classmethod
+    def fromDict(cls, data):
+        """Converts a model dictionary as returned by deriveModelDictionary.
+
+        Args:
+          data(dict): the model dictionary
+
+        Returns:
+          Model -- the compact model
+
+        """
+        links = data.get('links', {})
+        npose = sum(1 + len(link.get('visual', {})) + len(link.get('collision', {})) +
+                    (1 if link.get('inertial') else 0) for link in links.values())
+        poses = PoseAllocator(npose)
+        model = cls()
+        for key, value in data.items():
+            if key not in ('links', 'joints'):
+                model[key] = value
+        model.links = {name: Link.fromDict(link, poses) for name, link in links.items()}
+        model.joints = {name: Joint.fromDict(joint) for name, joint in data.get('joints', {}).items()}
+        model.transforms = poses.transforms[:poses.index]
+        return model
+
+
+def toDict(data):
+    """Converts records, also nested in dictionaries and lists, to plain dictionaries.
+
+    Args:
+      data: a record, dictionary, list or any other value
+
+    Returns:
+      the data with all records replaced by dictionaries
+
+    """
+    if isinstance(data, (Record, Pose)):
+        return data.toDict()
+    elif type(data) is dict:
+        return {key: toDict(value) for key, value in data.items()}
+    elif type(data) is list:
+        return [toDict(value) for value in data]
+    return data
@@ -162,6 +162,7 @@ def createSensor(sensor, reference, origin=mathutils.Matrix()):
     # set sensor properties
     newsensor.phobostype = 'sensor'
     newsensor.name = sensor['name']
+    sUtils.updateObjectName(newsensor)
     newsensor['sensor/type'] = sensor['type']
 
     # TODO delete me?
@@ -46,6 +46,7 @@ from bpy.props import (BoolProperty, IntProperty, StringProperty, EnumProperty,
 import phobos.defs as defs
 import phobos.display as display
 import phobos.model.inertia as inertialib
+import phobos.model.models as models
 import phobos.utils.selection as sUtils
 import phobos.utils.general as gUtils
 import phobos.utils.blender as bUtils
@@ -1938,15 +1939,61 @@ def unregister():
 
 
 class ValidateOperator(Operator):
-    """Check the robot dictionary"""
+    """Check the robot dictionary
+
+    The model is derived in steps (see phobos.model.models.ModelDerivation) between which
+    Blender keeps handling navigation events, all others are blocked as they could change the
+    objects being derived. Pressing ESC cancels the validation. Without a window, e.g. when
+    run by a script in background mode, the model is derived and validated right away.
+    """
     bl_idname = "phobos.validate"
     bl_label = "Validate"
-    bl_options = {'REGISTER', 'UNDO'}
+    bl_options = {'REGISTER'}
 
     def execute(self, context):
-        messages = {}
         root = sUtils.getRoot(context.selected_objects[0])
-        model, objectlist = models.deriveModelDictionary(root)
+        self._derivation = models.ModelDerivation(root)
+        if context.window is None:
+            self._derivation.step(timeout=float('inf'))
+            return self.finish()
+        self._timer = context.window_manager.event_timer_add(0.05, context.window)
+        context.window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            log("Cancelled validation.", "WARNING")
+            self.stopDerivation(context)
+            return {'CANCELLED'}
+        elif bUtils.isNavigationEvent(event):
+            return {'PASS_THROUGH'}
+        elif event.type != 'TIMER':
+            return {'RUNNING_MODAL'}
+
+        try:
+            finished = self._derivation.step(timeout=0.1)
+        except Exception:
+            self.stopDerivation(context)
+            raise
+        if not finished:
+            display.setProgress(self._derivation.progress,
+                                'Deriving ' + self._derivation.root.name + ': ' +
+                                self._derivation.info)
+            return {'PASS_THROUGH'}
+        self.stopDerivation(context)
+        return self.finish()
+
+    def stopDerivation(self, context):
+        context.window_manager.event_timer_remove(self._timer)
+        display.setProgress(0)
+
+    def finish(self):
+        if self._derivation.model is None:
+            return {'CANCELLED'}
+        return self.validate(self._derivation.model)
+
+    def validate(self, model):
+        messages = {}
         vUtils.check_dict(model, defs.definitions['model'], messages)
         vUtils.checkMessages = messages if len(list(messages.keys())) > 0 else {"NoObject": []}
         for entry in messages:
@@ -30,6 +30,7 @@ import os
 import yaml
 import sys
 import inspect
+import time
 
 import bpy
 import bgl
@@ -42,12 +43,15 @@ import phobos.defs as defs
 import phobos.display as display
 from phobos.phoboslog import log
 import phobos.model.models as models
+import phobos.model.poses as poses
 import phobos.model.links as links
 import phobos.utils.selection as sUtils
 import phobos.utils.io as ioUtils
 import phobos.utils.blender as bUtils
 import phobos.utils.naming as nUtils
 from phobos.utils.io import securepath
+import phobos.utils.jobs as jobs
+import phobos.io.background as background
 import phobos.io.entities as entity_io
 from phobos.io.entities import entity_types
 from phobos.io.entities.entities import deriveGenericEntity
@@ -73,41 +77,39 @@ class ExportSceneOperator(Operator):
         if not rootobjects:
             log("There are no entities to export!", "WARNING")
 
-        # derive entities and export if necessary
-        modellist = []
+        # derive entities
+        exportlist = []
         for root in rootobjects:
             log("Adding entity '" + str(root["entity/name"]) + "' to scene.", "INFO")
             if root["entity/type"] in entity_types:
-                # TODO delete me?
-                # try:
-                if (self.exportModels and
-                        'export' in entity_types[root['entity/type']] and
-                        root['modelname'] not in models):
-                    modelpath = os.path.join(ioUtils.getExportPath(), self.sceneName, root['modelname'])
-                    exportModel(models.deriveModelDictionary(root), modelpath)
-                    models.add(root['modelname'])
                 # known entity export
                 entity = entity_types[root["entity/type"]]['derive'](root,
                                                                      os.path.join(ioUtils.getExportPath(), self.sceneName))
-                # TODO delete me?
-                # except KeyError:
-                #    log("Required method ""deriveEntity"" not implemented for type " + entity["entity/type"], "ERROR")
-                #    continue
             # generic entity export
             else:
                 entity = deriveGenericEntity(root)
             exportlist.append(entity)
-        for scenetype in scene_types:
-            typename = "export_scene_" + scenetype
-            # check if format exists and should be exported
-            if getattr(bpy.context.scene, typename):
-                scene_types[scenetype]['export'](exportlist, os.path.join(
-                    ioUtils.getExportPath(), self.sceneName))
+
+        # export every distinct model only once
+        ioUtils.exportScene({'name': self.sceneName, 'entities': exportlist, 'roots': rootobjects},
+                            ioUtils.getExportPath(), export_entity_models=self.exportModels)
         return {'FINISHED'}
 
 
 class ExportModelOperator(Operator):
-    """Export the selected model"""
+    """Export the selected model
+
+    The models are derived in steps (see phobos.model.models.ModelDerivation) between which
+    Blender keeps handling navigation events, and exported once all of them are derived. All
+    other events are blocked meanwhile, as they could change the objects being derived.
+    Without a window, e.g. when run by a script in background mode, the models are derived and
+    exported right away.
+
+    If background export is set in the export settings, the models are exported by background
+    Blender processes (see phobos.io.background) while the operator keeps polling their
+    progress. Pressing ESC cancels the derivation, the background exports are cancelled by
+    CancelBackgroundExportsOperator, which is shown in the export panel while they run.
+    """
     bl_idname = "phobos.export_model"
     bl_label = "Export Model"
     bl_options = {'REGISTER'}
@@ -147,14 +149,38 @@ class ExportModelOperator(Operator):
                     + str(len(roots)) + " times.", "ERROR")
                 return {'CANCELLED'}
 
-        for root in roots:
-            # setup paths
-            exportpath = ioUtils.getExportPath()
-            if not securepath(exportpath):
-                log("Could not secure path to export to.", "ERROR")
+        self._derivations = None
+        if ioUtils.getExpSettings().backgroundExport:
+            return self.exportInBackground(context, roots)
+
+        # setup paths
+        exportpath = ioUtils.getExportPath()
+        if not securepath(exportpath):
+            log("Could not secure path to export to.", "ERROR")
+            return {'CANCELLED'}
+        log("Export path: " + exportpath, "DEBUG")
+        self._roots = roots
+        self._exportpath = exportpath
+        self._derivations = [models.ModelDerivation(root, compact=True) for root in roots]
+        if context.window is None:
+            for derivation in self._derivations:
+                derivation.step(timeout=float('inf'))
+            return self.exportDerived(context)
+        self._timer = context.window_manager.event_timer_add(0.05, context.window)
+        context.window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def exportDerived(self, context):
+        roots = self._roots
+        # all models are exported in one job graph, see ioUtils.addModelExportJobs
+        graph = jobs.JobGraph()
+        for root, derivation in zip(roots, self._derivations):
+            if derivation.model is None:
+                log("Could not derive model of " + root.name + ".", "ERROR")
                 continue
-            log("Export path: " + exportpath, "DEBUG")
-            ioUtils.exportModel(models.deriveModelDictionary(root), exportpath)
+            ioUtils.addModelExportJobs(graph, derivation.model, self._exportpath,
+                                       label=root.name)
+        ioUtils.runExportJobs(graph)
 
         # select all exported models after export is done
         if ioUtils.getExpSettings().selectedOnly:
@@ -172,6 +198,95 @@ class ExportModelOperator(Operator):
         log("Export successful.", "INFO")
         return {'FINISHED'}
 
+    def exportInBackground(self, context, roots):
+        exportpath = ioUtils.getExportPath()
+        if not securepath(exportpath):
+            log("Could not secure path to export to.", "ERROR")
+            return {'CANCELLED'}
+        background.queueExports(roots, exportpath)
+        if context.window is None:
+            # no modal operator can poll the exports, so wait for them
+            while background.updateExports(ioUtils.getExpSettings().backgroundWorkers):
+                time.sleep(0.5)
+            return {'FINISHED'}
+        # the exports are already being polled by another instance of the operator
+        if not background.startMonitoring():
+            return {'FINISHED'}
+        self._timer = context.window_manager.event_timer_add(0.5, context.window)
+        context.window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if self._derivations is None:
+            return self.monitorExports(context, event)
+
+        if event.type == 'ESC':
+            log("Cancelled export.", "WARNING")
+            self.stopDerivation(context)
+            return {'CANCELLED'}
+        elif bUtils.isNavigationEvent(event):
+            return {'PASS_THROUGH'}
+        elif event.type != 'TIMER':
+            return {'RUNNING_MODAL'}
+
+        # derive the models one after another, returning to Blender after each step
+        for i, derivation in enumerate(self._derivations):
+            if not derivation.finished:
+                try:
+                    derivation.step(timeout=0.1)
+                except Exception:
+                    self.stopDerivation(context)
+                    raise
+                display.setProgress((i + derivation.progress) / len(self._derivations),
+                                    'Deriving ' + derivation.root.name + ': ' +
+                                    derivation.info)
+                return {'PASS_THROUGH'}
+        self.stopDerivation(context)
+        return self.exportDerived(context)
+
+    def stopDerivation(self, context):
+        context.window_manager.event_timer_remove(self._timer)
+        display.setProgress(0)
+
+    def monitorExports(self, context, event):
+        """Polls the background exports until all of them are finished or cancelled."""
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+        try:
+            exports = background.updateExports(ioUtils.getExpSettings().backgroundWorkers)
+        except Exception:
+            # the operator ends, so the next export has to poll the exports again
+            self.stopMonitoring(context)
+            raise
+        if not exports:
+            self.stopMonitoring(context)
+            return {'FINISHED'}
+        display.setProgress(sum(export.progress for export in exports) / len(exports),
+                            'Exporting in background: ' + ', '.join(
+                                '{0} ({1:.0%})'.format(export.rootname, export.progress)
+                                for export in exports))
+        return {'PASS_THROUGH'}
+
+    def stopMonitoring(self, context):
+        background.stopMonitoring()
+        context.window_manager.event_timer_remove(self._timer)
+        display.setProgress(0)
+
+
+class CancelBackgroundExportsOperator(Operator):
+    """Cancel all queued and running background exports"""
+    bl_idname = "phobos.cancel_background_exports"
+    bl_label = "Cancel Background Exports"
+    bl_options = {'REGISTER'}
+
+    @classmethod
+    def poll(cls, context):
+        return bool(background.getExports())
+
+    def execute(self, context):
+        background.cancelExports()
+        return {'FINISHED'}
+
 
 class ImportModelOperator(bpy.types.Operator):
     """Import robot model file from various formats"""
@@ -250,8 +365,8 @@ def loadModelsAndPoses():
                 if file.split('_')[-1] == "poses.yml":
                     if model_name not in robots_dict:
                         robots_dict[model_name] = []
-                    with open(os.path.join(os.path.dirname(robot), file)) as poses:
-                        poses_yml = yaml.load(poses)
+                    with open(os.path.join(os.path.dirname(robot), file)) as posefile:
+                        poses_yml = yaml.load(posefile)
                         for pose in poses_yml['poses']:
                             robots_dict[model_name].append(
                                 {"posename": pose['name']})
@@ -552,14 +667,14 @@ class ExportCurrentPoseOperator(Operator):
         objectlist = sUtils.getChildren(
             root, selected_only=True, include_hidden=False)
         sUtils.selectObjects([root] + objectlist, clear=True, active=0)
-        models.loadPose(selected_robot.robot_name, selected_robot.label)
+        poses.loadPose(selected_robot.robot_name, selected_robot.label)
         parameter = self.decimate_ratio
         if self.decimate_type == 'UNSUBDIV':
             parameter = self.decimate_iteration
         elif self.decimate_type == 'DISSOLVE':
             parameter = self.decimate_angle_limit
-        exporter.bakeModel(objectlist, root['modelname'], selected_robot.label, decimate_type=self.decimate_type,
-                           decimate_parameter=parameter)
+        poses.bakeModel(objectlist, root['modelname'], selected_robot.label, decimate_type=self.decimate_type,
+                        decimate_parameter=parameter)
         sUtils.selectObjects([root] + objectlist, clear=True, active=0)
         bpy.ops.scene.reload_models_and_poses_operator()
         return {'FINISHED'}
@@ -618,21 +733,17 @@ class ExportAllPosesOperator(Operator):
         root = sUtils.getRoot(context.selected_objects[0])
         objectlist = sUtils.getChildren(
             root, selected_only=True, include_hidden=False)
-        sUtils.selectObjects(objectlist)
-        poses = models.getPoses(root['modelname'])
-        i = 1
-        for pose in poses:
-            sUtils.selectObjects([root] + objectlist, clear=True, active=0)
-            models.loadPose(root['modelname'], pose)
-            parameter = self.decimate_ratio
-            if self.decimate_type == 'UNSUBDIV':
-                parameter = self.decimate_iteration
-            elif self.decimate_type == 'DISSOLVE':
-                parameter = self.decimate_angle_limit
-            exporter.bakeModel(objectlist, root[
-                               'modelname'], pose, decimate_type=self.decimate_type, decimate_parameter=parameter)
-            display.setProgress(i/len(poses))
-            i += 1
+        sUtils.selectObjects([root] + objectlist, clear=True, active=0)
+        parameter = self.decimate_ratio
+        if self.decimate_type == 'UNSUBDIV':
+            parameter = self.decimate_iteration
+        elif self.decimate_type == 'DISSOLVE':
+            parameter = self.decimate_angle_limit
+        # the model is derived and baked in its rest pose, see poses.bakePoses
+        with poses.RestPose(nUtils.getModelName(root)):
+            model = models.deriveModelDictionary(root)
+            poses.bakePoses(objectlist, model, decimate_type=self.decimate_type,
+                            decimate_parameter=parameter)
         sUtils.selectObjects([root] + objectlist, clear=True, active=0)
         bpy.ops.scene.reload_models_and_poses_operator()
         return {'FINISHED'}
@@ -150,12 +150,19 @@ class BatchRename(Operator):
         description="Replace names stored in '*/name' properties?")
 
     def execute(self, context):
-        for obj in context.selected_objects:
-            obj.name = self.add.replace('*', obj.name.replace(self.find, self.replace))
+        objects = context.selected_objects
+        newnames = [self.add.replace('*', obj.name.replace(self.find, self.replace))
+                    for obj in objects]
+        allocator = nUtils.NameAllocator(bpy.data.objects.keys())
+        for obj in objects:
+            allocator.release(obj.name)
+        for obj, newname in zip(objects, newnames):
+            allocator.rename(obj, newname)
             if self.include_properties:
                 for key in obj.keys():
                     if key.endswith('/name'):
                         obj[key] = self.add.replace('*', obj[key].replace(self.find, self.replace))
+            sUtils.updateObjectName(obj)
         return {'FINISHED'}
 
     @classmethod
@@ -232,6 +239,7 @@ class ChangeObjectName(Operator):
                         'INFO')
                     del obj['joint/name']
 
+        sUtils.updateObjectName(obj)
         return {'FINISHED'}
 
     @classmethod
@@ -28,6 +28,7 @@ Created on 6 Jan 2014
 
 import sys
 import inspect
+from collections.abc import Mapping
 
 import bpy
 # import bgl
@@ -39,12 +40,15 @@ from phobos.io import entities
 from phobos.io import meshes
 from phobos.io import scenes
 from phobos.io import libraries
+from phobos.io import background
 from phobos.model.models import deriveDictEntry
 from phobos.model.models import get_link_information
+import phobos.model.poses as poses
 from phobos.phoboslog import LOGLEVELS
 import phobos.utils.validation as validation
 import phobos.utils.io as ioUtils
 import phobos.utils.naming as nUtils
+import phobos.utils.selection as sUtils
 
 from . import defs
 from . import display
@@ -148,6 +152,28 @@ class PhobosExportSettings(bpy.types.PropertyGroup):
     decimalPlaces = IntProperty(name="decimals", description="Number of " +
                                 "decimal places to export", default=5)
     exportTextures = BoolProperty(name='Export textures', default=True)
+    backgroundExport = BoolProperty(name='Export in background', default=False,
+                                    description="Export models in background Blender " +
+                                    "processes, so Blender can be used meanwhile")
+    backgroundWorkers = IntProperty(name='Workers', default=2, min=1,
+                                    description="Maximum number of background exports " +
+                                    "running at the same time")
+    srdfCollisionSamples = IntProperty(name='Collision samples', default=0, min=0,
+                                       description="Number of random joint configurations " +
+                                       "sampled to derive disabled collisions for SRDF " +
+                                       "export (0 to disable)")
+    heightmapMesh = BoolProperty(name='Heightmaps as mesh', default=False,
+                                 description="Export heightmaps as tiled meshes instead of " +
+                                 "their images")
+    heightmapTileSize = IntProperty(name='Tile size', default=0, min=0,
+                                    description="Number of heightmap pixels per tile edge " +
+                                    "(0 for a single tile)")
+    heightmapLODs = IntProperty(name='Levels of detail', default=1, min=1, max=8,
+                                description="Number of levels of detail exported per " +
+                                "heightmap tile, each halving the resolution")
+    marsZipScene = BoolProperty(name='Zip MARS scene', default=False,
+                                description="Pack exported MARS scenes and their meshes " +
+                                "into a .scn archive")
     outputMeshtype = EnumProperty(items=getMeshTypeListForEnumProp,
                                   name='link',
                                   description="Mesh type to use in exported " +
@@ -648,7 +674,7 @@ class PhobosPropertyInformationPanel(bpy.types.Panel):
         categories = {}
 
         # generate general category only if needed
-        props = set([key for key in proplist if not isinstance(dictprops[key], dict)])
+        props = set([key for key in proplist if not isinstance(dictprops[key], Mapping)])
         if props - ignoredProps:
             box = layout.box()
             row = box.split()
@@ -663,7 +689,7 @@ class PhobosPropertyInformationPanel(bpy.types.Panel):
             value = dictprops[prop]
 
             # just a value for the general category
-            if not isinstance(value, dict):
+            if not isinstance(value, Mapping):
                 if isinstance(value, bpy.types.Object) or (isinstance(value, str) and value in
                                                            context.scene.objects):
                     if isinstance(value, str):
@@ -715,7 +741,7 @@ class PhobosPropertyInformationPanel(bpy.types.Panel):
                     self.addObjLink(prop_t2, value, categories[category], params)
 
                 # is it another dictionary with values?
-                elif isinstance(value, dict):
+                elif isinstance(value, Mapping):
                     # gather keys, parameters etc as lists
                     props = value.keys()
                     values = [value[key] for key in props]
@@ -902,6 +928,11 @@ class PhobosExportPanel(bpy.types.Panel):
         g1.prop(expsets, "selectedOnly")
         g2 = ginlayout.column(align=True)
         g2.prop(expsets, "decimalPlaces")
+        g2.prop(expsets, "backgroundExport")
+        if expsets.backgroundExport:
+            g2.prop(expsets, "backgroundWorkers")
+        if background.getExports():
+            layout.operator('phobos.cancel_background_exports', icon='CANCEL')
 
         layout.separator()
 
@@ -936,6 +967,20 @@ class PhobosExportPanel(bpy.types.Panel):
             box.prop(ioUtils.getExpSettings(), 'obj_axis_forward')
             box.prop(ioUtils.getExpSettings(), 'obj_axis_up')
 
+        # additional mars parameters
+        if getattr(bpy.context.scene, 'export_scene_mars', False):
+            layout.separator()
+            box = layout.box()
+            box.label('MARS scene')
+            box.prop(ioUtils.getExpSettings(), 'marsZipScene')
+
+        # additional srdf parameters
+        if getattr(bpy.context.scene, 'export_entity_srdf', False):
+            layout.separator()
+            box = layout.box()
+            box.label('SRDF collisions')
+            box.prop(ioUtils.getExpSettings(), 'srdfCollisionSamples')
+
         # TODO delete me?
         # c2.prop(expsets, "exportCustomData", text="Export custom data")
 
@@ -945,7 +990,13 @@ class PhobosExportPanel(bpy.types.Panel):
         # layout.operator("phobos.export_bake", text="Bake Robot Model", icon="OUTLINER_OB_ARMATURE")
         # layout.operator("phobos.create_robot_instance", text="Create Robot Lib Instance", icon="RENDERLAYERS")
 
-        #  self.layout.prop(expsets, "heightmapMesh", text="export heightmap as mesh")
+        layout.separator()
+        box = layout.box()
+        box.label('Heightmaps')
+        box.prop(expsets, 'heightmapMesh')
+        if expsets.heightmapMesh:
+            box.prop(expsets, 'heightmapTileSize')
+            box.prop(expsets, 'heightmapLODs')
 
         layout.separator()
         layout.operator("phobos.export_model", icon="EXPORT")
@@ -1016,6 +1067,7 @@ class PhobosModelLibraryPanel(bpy.types.Panel):
 
         if wm.category != '-':
             layout.prop(wm, 'category')
+            layout.prop(wm, 'modelsearch', icon='VIEWZOOM')
 
             if wm.modelpreview != '-':
                 layout.template_icon_view(wm, 'modelpreview', show_labels=True, scale=5.0)
@@ -1243,11 +1295,17 @@ def register():
     # Read in model and pose data from the respective folders
     # loadModelsAndPoses()
     libraries.register()
+    poses.register()
+    sUtils.register()
+    background.register()
 
 
 def unregister():
     print("Unregistering phobosgui...")
     libraries.unregister()
+    poses.unregister()
+    sUtils.unregister()
+    background.unregister()
 
     # Unregister icons
     for pcoll in prev_collections.values():
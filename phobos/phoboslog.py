@@ -33,6 +33,8 @@ Created on 05 Dec 2014
 """
 
 import inspect
+import threading
+from collections import deque
 from datetime import datetime
 from enum import Enum
 from types import SimpleNamespace
@@ -47,6 +49,9 @@ LOGLEVELS = ('NONE', 'ERROR', 'WARNING', 'INFO', 'DEBUG')
 #: Calling functions that will never be logged to the GUI of Blender.
 FUNCTION_BLACKLIST = ('register')
 
+#: Messages logged by other threads than Blender's main thread, see :func:`flushThreadMessages`.
+_threadmessages = deque()
+
 
 class Col(Enum):
     """Provides the color ids for different terminal messages."""
@@ -107,6 +112,26 @@ def log(message, level="INFO", prefix="", guionly=False, end='\n'):
     originname = '{0} - {1} (l{2})'.format(info.filename.split('addons/')[-1], info.function,
                                            info.lineno)
 
+    # Blender's data must not be accessed by other threads, so their messages are kept until
+    # the main thread logs again
+    if threading.current_thread() is not threading.main_thread():
+        _threadmessages.append((message, level, prefix, guionly, end, originname))
+        return
+    flushThreadMessages()
+    _write(message, level, prefix, guionly, end, originname)
+
+
+def flushThreadMessages():
+    """Logs the messages of other threads which have been kept by :func:`log`.
+
+    This has to be called from Blender's main thread.
+    """
+    while _threadmessages:
+        _write(*_threadmessages.popleft())
+
+
+def _write(message, level, prefix, guionly, end, originname):
+    """Writes a message logged by :func:`log` according to the Phobos preferences."""
     # display only messages up to preferred log level
     prefs = bpy.context.user_preferences.addons["phobos"].preferences
 
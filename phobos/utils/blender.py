@@ -27,13 +27,16 @@ along with Phobos.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 import os
+import math
+import json
+import hashlib
+import numpy
 import bpy
 import mathutils
 import phobos.defs as defs
 import phobos.model.materials as materials
 from phobos.phoboslog import log
 from phobos.phobossystem import getConfigPath
-from . import selection as sUtils
 from . import naming as nUtils
 
 
@@ -67,6 +70,29 @@ def getPhobosPreferences():
     return bpy.context.user_preferences.addons["phobos"].preferences
 
 
+#: events which only move the view, passed on by modal operators which keep Blender data
+navigation_events = ('MIDDLEMOUSE', 'WHEELUPMOUSE', 'WHEELDOWNMOUSE', 'WHEELINMOUSE',
+                     'WHEELOUTMOUSE', 'MOUSEMOVE', 'INBETWEEN_MOUSEMOVE', 'TRACKPADPAN',
+                     'TRACKPADZOOM', 'MOUSEROTATE')
+
+
+def isNavigationEvent(event):
+    """Returns whether an event only moves the view, so no Blender data can change by it.
+
+    Modal operators which keep references to Blender data between their steps pass on only
+    these events (and their timers), all others could e.g. undo, delete objects or load
+    another file while the references are kept.
+
+    Args:
+      event(bpy.types.Event): the event
+
+    Returns:
+      bool -- True if the event only navigates
+
+    """
+    return event.type in navigation_events or event.type.startswith('NDOF_')
+
+
 def printMatrices(obj, info=None):
     """This function prints the matrices of an object to the screen.
 
@@ -294,9 +320,199 @@ def cleanScene():
         bpy.data.lamps.remove(lamp)
 
 
+def geometryHash(objects, *settings):
+    """Returns a hash of the geometry, transforms and materials of objects.
+
+    The hash changes whenever the appearance of the objects in a preview would change, so it
+    can be used to decide whether a cached preview is still valid.
+
+    Args:
+      objects(list of bpy.types.Object): objects to hash
+      *settings: additional values which influence the result, e.g. the render resolution
+
+    Returns:
+      str -- hexadecimal digest of the hash
+
+    """
+    sha = hashlib.sha1(repr(settings).encode('utf-8'))
+    for obj in sorted(objects, key=lambda o: o.name):
+        sha.update(obj.name.encode('utf-8'))
+        sha.update(numpy.array(obj.matrix_world, dtype=float).tobytes())
+        if obj.type == 'MESH':
+            mesh = obj.data
+            vertices = numpy.empty(3 * len(mesh.vertices))
+            mesh.vertices.foreach_get('co', vertices)
+            loops = numpy.empty(len(mesh.loops), dtype=numpy.int32)
+            mesh.loops.foreach_get('vertex_index', loops)
+            sha.update(vertices.tobytes())
+            sha.update(loops.tobytes())
+            for material in mesh.materials:
+                if material:
+                    sha.update(material.name.encode('utf-8'))
+                    sha.update(numpy.array(material.diffuse_color, dtype=float).tobytes())
+    return sha.hexdigest()
+
+
+class PreviewRenderer(object):
+    """Renders previews of many sets of objects in one session.
+
+    All previews of a session are rendered in a separate scene holding one camera and sun lamp,
+    into which only the objects of the current preview are linked. Thus no objects of the user's
+    scenes need to be hidden and the rig is created only once. Previews are rendered with
+    OpenGL from the scene camera where possible (falling back to Blender Internal when no
+    OpenGL context is available, e.g. in background mode).
+
+    The geometry hash of every rendered preview is recorded in a manifest next to the image,
+    so previews of unchanged objects are not rendered again.
+
+    Use as context manager:
+        with PreviewRenderer() as renderer:
+            renderer.render(objects, filepath)
+    """
+
+    #: name of the scene, camera, lamp and world of the preview rig
+    rigname = 'phobos_preview'
+
+    #: file name of the manifests of cached previews
+    manifestname = '.phobos_previews.json'
+
+    def __init__(self, render_resolution=256, opengl=True, cache=True):
+        self.render_resolution = render_resolution
+        self.opengl = opengl
+        self.cache = cache
+        self.scene = None
+        self.camera = None
+        self.lamp = None
+        self.linked = set()
+        self.manifests = {}
+        self.changedmanifests = set()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def open(self):
+        """Creates the preview scene with its camera and lamp."""
+        self.scene = bpy.data.scenes.new(self.rigname)
+        self.scene.render.image_settings.file_format = 'PNG'
+        self.scene.render.resolution_x = self.render_resolution
+        self.scene.render.resolution_y = self.render_resolution
+        self.scene.render.resolution_percentage = 100
+        self.scene.world = bpy.data.worlds.new(self.rigname)
+        self.scene.world.horizon_color = mathutils.Color((1.0, 1.0, 1.0))
+
+        self.camera = bpy.data.objects.new(self.rigname, bpy.data.cameras.new(self.rigname))
+        self.camera.data.type = 'ORTHO'
+        self.camera.rotation_euler = mathutils.Euler((math.radians(60), 0, math.radians(45)))
+        self.scene.objects.link(self.camera)
+        self.scene.camera = self.camera
+        self.lamp = bpy.data.objects.new(self.rigname + '_lamp',
+                                         bpy.data.lamps.new(self.rigname, 'SUN'))
+        self.lamp.parent = self.camera
+        self.scene.objects.link(self.lamp)
+
+    def close(self):
+        """Removes the preview rig and writes the manifests of the rendered previews."""
+        for path in self.changedmanifests:
+            with open(path, 'w') as manifestfile:
+                json.dump(self.manifests[path], manifestfile, indent=2, sort_keys=True)
+        self.changedmanifests.clear()
+        if not self.scene:
+            return
+        world = self.scene.world
+        bpy.data.scenes.remove(self.scene)
+        for obj, datablocks in ((self.lamp, bpy.data.lamps), (self.camera, bpy.data.cameras)):
+            data = obj.data
+            bpy.data.objects.remove(obj)
+            datablocks.remove(data)
+        bpy.data.worlds.remove(world)
+        self.scene = self.camera = self.lamp = None
+        self.linked.clear()
+
+    def _getManifest(self, filepath):
+        """Returns the manifest of cached previews of the folder containing filepath."""
+        path = os.path.join(os.path.dirname(filepath), self.manifestname)
+        if path not in self.manifests:
+            try:
+                with open(path, 'r') as manifestfile:
+                    self.manifests[path] = json.load(manifestfile)
+            except (IOError, ValueError):
+                self.manifests[path] = {}
+        return path, self.manifests[path]
+
+    def _frame(self, objects):
+        """Places the camera such that it captures all objects."""
+        corners = [o.matrix_world * mathutils.Vector(corner)
+                   for o in objects for corner in o.bound_box]
+        center = sum(corners, mathutils.Vector()) / len(corners)
+        radius = max(max((corner - center).length for corner in corners), 0.001)
+        direction = self.camera.rotation_euler.to_matrix() * mathutils.Vector((0, 0, -1))
+        self.camera.location = center - 4 * radius * direction
+        self.camera.data.ortho_scale = 2.1 * radius
+        self.camera.data.clip_end = 8 * radius
+
+    def render(self, objects, filepath):
+        """Renders a preview of objects to a PNG file.
+
+        Args:
+          objects(list of bpy.types.Object): the objects to show in the preview
+          filepath(str): path of the image file
+
+        Returns:
+          bool -- True if the preview was rendered, False if the cached image is up to date
+
+        """
+        objects = [obj for obj in objects if obj.type != 'EMPTY']
+        if not objects:
+            log("No objects to create a preview of for " + filepath, "WARNING")
+            return False
+        manifestpath, manifest = self._getManifest(filepath)
+        filename = os.path.basename(filepath)
+        objecthash = geometryHash(objects, self.render_resolution)
+        if self.cache and manifest.get(filename) == objecthash and os.path.exists(filepath):
+            log("Preview " + filepath + " is up to date.", "DEBUG")
+            return False
+
+        # exchange only the objects which differ from the previous preview
+        objectset = set(objects)
+        for obj in self.linked - objectset:
+            self.scene.objects.unlink(obj)
+        for obj in objectset - self.linked:
+            self.scene.objects.link(obj)
+        self.linked = objectset
+        # the objects are shown on their own layers, e.g. visuals are not on the first layer
+        self.scene.layers = [any(obj.layers[i] for obj in objects)
+                             for i in range(len(self.scene.layers))]
+        self.scene.update()
+        self._frame(objects)
+
+        log("Saving preview to: " + filepath, "INFO")
+        if self.opengl:
+            try:
+                override = bpy.context.copy()
+                override['scene'] = self.scene
+                # render from the scene's camera, not from the viewport the operator is run in
+                bpy.ops.render.opengl(override, view_context=False)
+            except RuntimeError as error:
+                log("OpenGL rendering not available, rendering previews with Blender "
+                    "Internal: " + str(error), "WARNING")
+                self.opengl = False
+        if not self.opengl:
+            bpy.ops.render.render(scene=self.scene.name)
+        bpy.data.images['Render Result'].save_render(filepath, scene=self.scene)
+        manifest[filename] = objecthash
+        self.changedmanifests.add(manifestpath)
+        return True
+
+
 def createPreview(objects, export_path, modelname, render_resolution=256, opengl=False):
     """Creates a thumbnail of the given objects.
 
+    To create many thumbnails, use a PreviewRenderer directly to keep the rig between them.
+
     Args:
       objects(list of bpy.types.Object): list of objects for the thumbnail
       export_path(str): folder to export image to
@@ -308,52 +524,8 @@ def createPreview(objects, export_path, modelname, render_resolution=256, opengl
 
     """
     log("Creating thumbnail of model: "+modelname, "INFO")
-
-    # render presets
-    bpy.context.scene.render.image_settings.file_format = 'PNG'
-    bpy.context.scene.render.resolution_x = render_resolution
-    bpy.context.scene.render.resolution_y = render_resolution
-    bpy.context.scene.render.resolution_percentage = 100
-
-    # hide everything that is not supposed to show
-    for ob in bpy.data.objects:
-        if not (ob in objects):
-            ob.hide_render = True
-            ob.hide = True
-
-    # render the preview
-    if opengl:  # use the viewport representation to create preview
-        bpy.ops.view3d.view_selected()
-        bpy.ops.render.opengl(view_context=True)
-    else:  # use real rendering
-        # create camera
-        bpy.ops.object.camera_add(view_align=True)
-        cam = bpy.context.scene.objects.active
-        bpy.data.cameras[cam.data.name].type = 'ORTHO'
-        bpy.data.scenes[0].camera = cam  # set camera as active camera
-
-        sUtils.selectObjects(objects, True, 0)
-        bpy.ops.view3d.camera_to_view_selected()
-        # create light
-        bpy.ops.object.lamp_add(type='SUN', radius=1)
-        light = bpy.context.scene.objects.active
-        light.matrix_world = cam.matrix_world
-        # set background
-        oldcolor = bpy.data.worlds[0].horizon_color.copy()
-        bpy.data.worlds[0].horizon_color = mathutils.Color((1.0, 1.0, 1.0))
-        bpy.ops.render.render()
-        bpy.data.worlds[0].horizon_color = oldcolor
-        sUtils.selectObjects([cam, light], True, 0)
-        bpy.ops.object.delete()
-
-    # safe render and reset the scene
-    log("Saving model preview to: " + os.path.join(export_path, modelname + '.png'), "INFO")
-    bpy.data.images['Render Result'].save_render(os.path.join(export_path, modelname + '.png'))
-
-    # make all objects visible again
-    for ob in bpy.data.objects:
-        ob.hide_render = False
-        ob.hide = False
+    with PreviewRenderer(render_resolution, opengl) as renderer:
+        renderer.render(objects, os.path.join(export_path, modelname + '.png'))
 
 
 def toggleTransformLock(obj, setting=None):
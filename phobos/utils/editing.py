@@ -29,6 +29,7 @@ along with Phobos.  If not, see <http://www.gnu.org/licenses/>.
 import bpy
 import mathutils
 import math
+import numpy
 from phobos.phoboslog import log
 from . import selection as sUtils
 from . import naming as nUtils
@@ -43,8 +44,99 @@ def addDictionaryToObj(dict, obj, category=None):
         obj[(category+'/'+key) if category else key] = value
 
 
+#: the TransformCache getCombinedTransform currently uses, if any
+_transformcache = None
+
+
+class TransformCache(object):
+    """Memoizes the transforms computed by getCombinedTransform during a derivation.
+
+    While the cache is active (used as context manager), the transform of every object
+    relative to an effective parent is computed only once, as are the partial products of the
+    intermediate objects, so sibling objects below the same empties share them.
+
+    If *prefetch* is set, the world matrices of all objects are read at once via foreach_get
+    when entering the context, and transforms are computed from those instead of multiplying
+    up the parent chain. The cache does not notice changes to the objects, so it should only be
+    kept for one derivation. It can be entered repeatedly, e.g. for every step of a derivation
+    run in chunks, the world matrices are only read the first time.
+    """
+
+    def __init__(self, prefetch=True):
+        self.prefetch = prefetch
+        self.transforms = {}
+        self.inverses = {}
+        self.worldmatrices = None
+        self.indices = {}
+        self._previous = None
+
+    def __enter__(self):
+        global _transformcache
+        if self.prefetch and self.worldmatrices is None:
+            self.readWorldMatrices()
+        self._previous = _transformcache
+        _transformcache = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _transformcache
+        _transformcache = self._previous
+        self._previous = None
+
+    def readWorldMatrices(self):
+        """Reads the world matrices of all objects with a single foreach_get."""
+        objects = bpy.data.objects
+        matrices = numpy.empty(len(objects) * 16, dtype=numpy.float32)
+        objects.foreach_get('matrix_world', matrices)
+        # Blender stores matrices column-major
+        self.worldmatrices = matrices.reshape((-1, 4, 4)).transpose((0, 2, 1)).astype(float)
+        self.indices = {obj.as_pointer(): i for i, obj in enumerate(objects)}
+
+    def _inverseWorld(self, index):
+        if index not in self.inverses:
+            self.inverses[index] = numpy.linalg.inv(self.worldmatrices[index])
+        return self.inverses[index]
+
+    def getTransform(self, obj, effectiveparent):
+        """Returns the transform of *obj* relative to *effectiveparent* (see getCombinedTransform).
+
+        The returned matrix is shared with later calls and must not be modified.
+        """
+        key = (obj.as_pointer(), effectiveparent.as_pointer() if effectiveparent else None)
+        if key in self.transforms:
+            return self.transforms[key]
+        index = self.indices.get(key[0])
+        parentindex = self.indices.get(key[1])
+        if index is not None and (effectiveparent is None or parentindex is not None):
+            matrix = self.worldmatrices[index]
+            if effectiveparent is not None:
+                matrix = self._inverseWorld(parentindex).dot(matrix)
+            matrix = mathutils.Matrix(matrix.tolist())
+        elif obj.parent is None or obj.parent == effectiveparent:
+            matrix = obj.matrix_local.copy()
+        else:
+            matrix = self.getTransform(obj.parent, effectiveparent) * obj.matrix_local
+        self.transforms[key] = matrix
+        return matrix
+
+
 def getCombinedTransform(obj, effectiveparent):
-    # DOCU add some docstring
+    """Returns the transform of an object relative to one of its (indirect) parents.
+
+    The local matrices from the object up to the effective parent are multiplied. Inside of a
+    TransformCache context, the transforms are looked up in the cache instead.
+
+    Args:
+      obj(bpy.types.Object): the object to get the transform of
+      effectiveparent(bpy.types.Object): ancestor of *obj* the transform is relative to, None
+        for the world transform
+
+    Returns:
+      mathutils.Matrix -- the transform of *obj* in the frame of *effectiveparent*
+
+    """
+    if _transformcache is not None:
+        return _transformcache.getTransform(obj, effectiveparent).copy()
     parent = obj.parent
     matrix = obj.matrix_local
     while parent != effectiveparent and parent is not None:
@@ -4,6 +4,8 @@
 import shutil
 import sys
 import os.path
+import threading
+import yaml
 import bpy
 
 from phobos import defs
@@ -13,10 +15,12 @@ from phobos.phoboslog import log
 from phobos.io.entities import entity_types
 from phobos.io.meshes import mesh_types
 from phobos.io.scenes import scene_types
+from phobos.model import records
 
 from phobos.utils import selection as sUtils
 from phobos.utils import naming as nUtils
 from phobos.utils import blender as bUtils
+from phobos.utils.jobs import JobGraph
 
 
 indent = '  '
@@ -32,15 +36,17 @@ def xmlline(ind, tag, names, values):
       ind(int >= 0): Indentation level
       tag(String): xml element tag
       names(list (same order as for values)): Names of xml element's attributes
-      values(list (same order as for names)): Values of xml element's attributes
+      values(list (same order as for names)): Values of xml element's attributes, floats are
+        written as by formatNumber
 
     Returns:
       String -- Generated xml line.
 
     """
+    decimals = getDecimalPlaces()
     line = [indent * max(0, ind) + '<' + tag]
     for i in range(len(names)):
-        line.append(' ' + names[i] + '="' + str(values[i]) + '"')
+        line.append(' ' + names[i] + '="' + formatNumber(values[i], decimals) + '"')
     line.append('/>\n')
     return ''.join(line)
 
@@ -49,7 +55,8 @@ def l2str(items, start=0, end=-1):
     """Generates string from (part of) a list.
 
     Args:
-      items(list): List from which the string is derived (elements need to implement str())
+      items(list): List from which the string is derived (elements need to implement str(),
+        floats are written as by formatNumber)
       start(int, optional): Inclusive start index for iteration (Default value = 0)
       end(int, optional): Exclusive end index for iteration (Default value = -1)
 
@@ -59,7 +66,110 @@ def l2str(items, start=0, end=-1):
     """
     start = max(start, 0)
     end = end if end >= 0 else len(items)
-    return ' '.join([str(i) for i in items[start:end]])
+    decimals = getDecimalPlaces()
+    return ' '.join([formatNumber(i, decimals) for i in items[start:end]])
+
+
+class NumberFormat(object):
+    """Context manager setting the number of decimal places numbers are written with.
+
+    Within the context, the writers (xmlline, l2str, YAMLDumper) do not need to look up the
+    export settings. Contexts can be nested, the previous number is restored on exit.
+    """
+
+    def __init__(self, decimals):
+        self.decimals = decimals
+        self.previous = None
+
+    def __enter__(self):
+        global _decimalplaces
+        self.previous = _decimalplaces
+        _decimalplaces = self.decimals
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _decimalplaces
+        _decimalplaces = self.previous
+
+
+#: number of decimal places set by the active NumberFormat, None outside of any
+_decimalplaces = None
+
+
+def getDecimalPlaces():
+    """Returns the number of decimal places numbers are currently written with.
+
+    This is the number of the active NumberFormat or the one of the export settings.
+    """
+    if _decimalplaces is not None:
+        return _decimalplaces
+    return getExpSettings().decimalPlaces
+
+
+def roundNumber(value, decimals):
+    """Rounds a float to *decimals*, returning 0 for values smaller than the last decimal.
+
+    This is the rounding formerly applied to whole model dictionaries by
+    phobos.utils.general.roundFloatsInDict.
+
+    Args:
+      value(float): the number to round
+      decimals(int): number of decimal places
+
+    Returns:
+      float or int -- the rounded number
+
+    """
+    return 0 if abs(value) < 10**-decimals else round(value, decimals)
+
+
+def formatNumber(value, decimals=None):
+    """Returns the string a value is written as, rounding floats to *decimals*.
+
+    Values other than floats are converted with str().
+
+    Args:
+      value: the value to format
+      decimals(int, optional): number of decimal places, getDecimalPlaces() if None
+
+    Returns:
+      str -- the formatted value
+
+    """
+    if not isinstance(value, float):
+        return str(value)
+    return str(roundNumber(value, getDecimalPlaces() if decimals is None else decimals))
+
+
+class YAMLDumper(yaml.Dumper):
+    """YAML dumper rounding floats as they are written, see formatNumber.
+
+    The number of decimal places is determined once per dump by getDecimalPlaces.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(YAMLDumper, self).__init__(*args, **kwargs)
+        self.decimals = getDecimalPlaces()
+
+
+def _representFloat(dumper, value):
+    value = roundNumber(value, dumper.decimals)
+    if isinstance(value, int):
+        return dumper.represent_int(value)
+    return dumper.represent_float(value)
+
+
+def _representRecord(dumper, record):
+    return dumper.represent_dict(dict(record.items()))
+
+
+def _representPose(dumper, pose):
+    return dumper.represent_dict(pose.toDict())
+
+
+YAMLDumper.add_representer(float, _representFloat)
+YAMLDumper.add_multi_representer(records.Record, _representRecord)
+YAMLDumper.add_representer(records.Pose, _representPose)
 
 
 def securepath(path):
@@ -115,7 +225,13 @@ def getModelListForEnumProp(self, context):
 
 
 def getOutputMeshtype():
-    """Returns the mesh type to be used in exported files as specified in the GUI"""
+    """Returns the mesh type to be used in exported files as specified in the GUI.
+
+    Within an active ExportData, the mesh type taken from the GUI before is returned.
+    """
+    exportdata = _activeExportData()
+    if exportdata is not None:
+        return exportdata.meshtype
     return str(getExpSettings().outputMeshtype)
 
 
@@ -137,6 +253,59 @@ def getOutputMeshpath(path, meshtype=None):
     return os.path.join(path, 'meshes', meshtype if meshtype else getOutputMeshtype())
 
 
+def getModelTexts(modelname):
+    """Returns the contents of the texts of a model by text name.
+
+    These are all texts whose names start with the model name, such as the element order of
+    the URDF or the custom data of the SMURF. Within an active ExportData, the texts taken
+    from Blender before are returned.
+
+    Args:
+        modelname(str): name of the model
+
+    Returns:
+        dict: contents of the texts by name
+
+    """
+    exportdata = _activeExportData()
+    if exportdata is not None and exportdata.modelname == modelname:
+        return exportdata.texts
+    return {text.name: text.as_string() for text in bpy.data.texts
+            if text.name.startswith(modelname)}
+
+
+#: data of the current thread, holds the stack of active ExportData
+_threaddata = threading.local()
+
+
+def _activeExportData():
+    """Returns the ExportData active in the current thread, None if there is none."""
+    stack = getattr(_threaddata, 'exportdata', ())
+    return stack[-1] if stack else None
+
+
+class ExportData(object):
+    """The Blender data of a model read by the exporters, taken in the main thread.
+
+    Exporters run by worker threads must not access Blender's data. While the ExportData is
+    active in a thread (as context), getOutputMeshtype and getModelTexts return the data taken
+    on creation instead of looking it up. Numbers are formatted as set by NumberFormat. One
+    ExportData can be active in several threads at once.
+    """
+
+    def __init__(self, model):
+        self.modelname = model['name']
+        self.meshtype = getOutputMeshtype()
+        self.texts = getModelTexts(self.modelname)
+
+    def __enter__(self):
+        _threaddata.exportdata = getattr(_threaddata, 'exportdata', ()) + (self,)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _threaddata.exportdata = _threaddata.exportdata[:-1]
+
+
 def getEntityTypesForExport():
     """Returns list of entity types available for export"""
     return [typename for typename in sorted(entity_types)
@@ -202,60 +371,131 @@ def getAbsolutePath(path):
         return os.path.join(bpy.path.abspath('//'), path)
 
 
-def importBlenderModel(filepath, namespace='', prefix=False):
+def _instantiateLinkedModel(filepath):
+    """Creates local copies of all objects of a .blend file which share the library data.
+
+    The objects of the file are linked only once, all further calls reuse the linked objects.
+    Parents and all object references in custom properties of the copies (such as the ones of
+    submechanisms) are mapped to the other copies.
+
+    Args:
+        filepath(str): Path of the .blend file
+
+    Returns:
+        list of bpy.types.Object: the new objects, linked to the current scene
+
+    """
+    with bpy.data.libraries.load(filepath, link=True) as (data_from, data_to):
+        data_to.objects = data_from.objects
+    copies = {obj: obj.copy() for obj in data_to.objects if obj is not None}
+    for original, copy in copies.items():
+        if original.parent in copies:
+            copy.parent = copies[original.parent]
+        for key in copy.keys():
+            value = _mapObjectReferences(copy[key], copies)
+            if value is not None:
+                copy[key] = value
+        bpy.context.scene.objects.link(copy)
+    return list(copies.values())
+
+
+def _mapObjectReferences(value, objectmap):
+    """Maps a custom property value referencing objects, e.g. by _instantiateLinkedModel.
+
+    Args:
+        value: the value of the custom property
+        objectmap(dict): new object by original object
+
+    Returns:
+        the mapped object or list of objects, None if the value does not reference objects
+
+    """
+    if isinstance(value, bpy.types.Object):
+        return objectmap.get(value, value)
+    elif isinstance(value, str):
+        return None
+    try:
+        items = list(value)
+    except TypeError:
+        return None
+    if not any(isinstance(item, bpy.types.Object) for item in items):
+        return None
+    return [objectmap.get(item, item) if isinstance(item, bpy.types.Object) else item
+            for item in items]
+
+
+def importBlenderModel(filepath, namespace='', prefix=False, link=False):
     """Imports an existing Blender model into the current .blend scene
 
+    With *link* set, the objects of the file are linked as library data and each import creates
+    lightweight copies of them, which share the meshes and armatures of the library. Thus many
+    instances of the same model cost little memory and their meshes are only exported once.
+    The mesh data of such instances can not be edited unless it is made local.
+
     Args:
         filepath(str): Path of the .blend file
         namespace:
         prefix:
+        link(bool): instance the model from library data instead of appending it
 
     Returns:
 
     """
     if os.path.exists(filepath) and os.path.isfile(filepath) and filepath.endswith('.blend'):
         log("Importing Blender model" + filepath, "INFO")
-        objects = []
-        with bpy.data.libraries.load(filepath) as (data_from, data_to):
-            for objname in data_from.objects:
-                objects.append({'name': objname})
-        bpy.ops.wm.append(directory=filepath + "/Object/", files=objects)
-        imported_objects = bpy.context.selected_objects
+        if link:
+            imported_objects = _instantiateLinkedModel(filepath)
+        else:
+            objects = []
+            with bpy.data.libraries.load(filepath) as (data_from, data_to):
+                for objname in data_from.objects:
+                    objects.append({'name': objname})
+            bpy.ops.wm.append(directory=filepath + "/Object/", files=objects)
+            imported_objects = list(bpy.context.selected_objects)
         resources = [obj for obj in imported_objects if obj.name.startswith('resource::')]
         new_objects = [obj for obj in imported_objects if not obj.name.startswith('resource::')]
         if resources:
             if 'resources' not in bpy.data.scenes.keys():
                 bpy.data.scenes.new('resources')
-            sUtils.selectObjects(resources)
-            bpy.ops.object.make_links_scene(scene='resources')
-            bpy.ops.object.delete(use_global=False)
-            sUtils.selectObjects(new_objects)
+            resourcescene = bpy.data.scenes['resources']
+            for obj in resources:
+                if obj.name not in resourcescene.objects:
+                    resourcescene.objects.link(obj)
+                if obj.name in bpy.context.scene.objects:
+                    bpy.context.scene.objects.unlink(obj)
+        sUtils.selectObjects(new_objects)
         bpy.ops.view3d.view_selected(use_all_regions=False)
         # allow the use of both prefixes and namespaces, thus truly merging
         # models or keeping them separate for export
         if namespace != '':
+            # compute all new names before renaming any object
             if prefix:
-                for obj in bpy.context.selected_objects:
-                    # set prefix instead of namespace
-                    obj.name = namespace + '__' + obj.name
-                    # make sure no internal name-properties remain
-                    for key in obj.keys():
-                        try:
-                            if obj[key].endswidth("/name"):
-                                del obj[key]
-                        except AttributeError:  # prevent exceptions from non-string properties
-                            pass
+                newnames = {obj: namespace + '__' + obj.name for obj in new_objects}
             else:
-                for obj in bpy.context.selected_objects:
-                    nUtils.addNamespace(obj, namespace)
-        submechanism_roots = [obj for obj in bpy.data.objects if obj.phobostype == 'link'
+                newnames = {obj: nUtils.addNamespaceToName(obj.name, namespace)
+                            for obj in new_objects}
+            with nUtils.NameAllocator(bpy.data.objects.keys()) as allocator:
+                for obj, newname in newnames.items():
+                    if prefix:
+                        # set prefix instead of namespace
+                        allocator.rename(obj, newname)
+                        # make sure no internal name-properties remain, the names of the
+                        # submechanisms are still needed for their groups
+                        for key in [key for key in obj.keys() if key.endswith("/name")
+                                    and key != 'submechanism/name']:
+                            del obj[key]
+                        sUtils.updateObjectName(obj)
+                    else:
+                        nUtils.safelyName(obj, newname)
+        submechanism_roots = [obj for obj in new_objects if obj.phobostype == 'link'
                               and 'submechanism/spanningtree' in obj]
         for root in submechanism_roots:
-            partlist = [root] + root['submechanism/spanningtree']
+            partlist = [root] + list(root['submechanism/spanningtree'])
             if 'submechanism/freeloader' in root:
-                partlist += root['submechanism/freeloader']
-            sUtils.selectObjects(partlist, active=0)
-            bpy.ops.group.create(name='submechanism:' + root['submechanism/name'])
+                partlist += list(root['submechanism/freeloader'])
+            group = bpy.data.groups.new('submechanism:' + root['submechanism/name'])
+            for obj in partlist:
+                group.objects.link(obj)
         return True
     else:
         return False
@@ -327,6 +567,9 @@ def getResource(specifiers):
 def exportModel(model, exportpath='.', entitytypes=None):
     """Exports model to a given path in the provided formats.
 
+    Compact models (see phobos.model.records) are exported as they are, the exporters read their
+    records like dictionaries. The export is run as a JobGraph, see addModelExportJobs.
+
     Args:
         model(dict): dictionary of model to export
         exportpath(str): path to export root
@@ -334,11 +577,39 @@ def exportModel(model, exportpath='.', entitytypes=None):
 
     Returns:
 
+    """
+    graph = JobGraph()
+    addModelExportJobs(graph, model, exportpath, entitytypes)
+    runExportJobs(graph)
+
+
+def addModelExportJobs(graph, model, exportpath='.', entitytypes=None, label=''):
+    """Adds the jobs exporting a model to a job graph.
+
+    All jobs depend on the model, which may be a dictionary or a compact model (see
+    phobos.model.records): one job per entity type, one per selected mesh format and one
+    copying the textures. Entity types registered as *threadsafe* do not access Blender data
+    but the ExportData taken by a job in the main thread, they are written by worker threads.
+    All other entity types as well as the mesh export run in the main thread.
+
+    Args:
+        graph(phobos.utils.jobs.JobGraph): the graph to add the jobs to
+        model(dict or JobResult): model to export, or the result of the job deriving it
+        exportpath(str): path to export root
+        entitytypes(list of str): export types - model will be exported to all
+        label(str): prefix of the job names, needed to add several models to one graph
+
+    Returns:
+        dict or JobResult: the model the jobs were added for
+
     """
     if not exportpath:
         exportpath = getExportPath()
     if not entitytypes:
         entitytypes = getEntityTypesForExport()
+    prefix = label + ' ' if label else ''
+    exportdata = None
+
     # export model in selected formats
     for entitytype in entitytypes:
         typename = "export_entity_" + entitytype
@@ -349,55 +620,202 @@ def exportModel(model, exportpath='.', entitytypes=None):
         model_path = os.path.join(exportpath, entitytype)
         securepath(model_path)
 
-        # the following is not surrounded by try..catch as that may mask exceptions occurring
-        # inside the export function; also, only existing functionars register to display anyway
-        entity_types[entitytype]['export'](model, model_path)
-        log("Export model '" + model['name'] + "' as " + entitytype + " to " + model_path, "DEBUG")
+        # the jobs do not catch exceptions occurring inside the export function, as that may
+        # mask them; also, only existing functionars register to display anyway
+        if entity_types[entitytype].get('threadsafe', False):
+            if exportdata is None:
+                exportdata = graph.add(prefix + 'export data', ExportData, (model,),
+                                       mainthread=True, stage='export data')
+            graph.add(prefix + entitytype, _exportEntity,
+                      (entitytype, model, model_path, exportdata), stage=entitytype)
+        else:
+            graph.add(prefix + entitytype, _exportEntity, (entitytype, model, model_path),
+                      mainthread=True, stage=entitytype)
 
     # export meshes in selected formats
-    i = 1
-    mt = len([m for m in mesh_types if getattr(bpy.context.scene, "export_mesh_" + m, False)])
-    mc = len(model['meshes'])
-    n = mt * mc
     for meshtype in mesh_types:
+        if getattr(bpy.context.scene, "export_mesh_" + meshtype, False):
+            graph.add(prefix + 'meshes ' + meshtype, _exportModelMeshes,
+                      (model, exportpath, meshtype), mainthread=True, stage='meshes ' + meshtype)
+
+    # TODO: Move texture export to individual formats? This is practically SMURF
+    # TODO: Also, this does not properly take care of textures embedded in a .blend file
+    if getExpSettings().exportTextures:
+        graph.add(prefix + 'textures', _exportModelTextures,
+                  (model, exportpath, os.path.expanduser(bpy.path.abspath('//'))),
+                  stage='textures')
+    return model
+
+
+def _exportEntity(entitytype, model, path, exportdata=None):
+    """Job exporting a model as one entity type, with the ExportData active if given."""
+    if exportdata is None:
+        entity_types[entitytype]['export'](model, path)
+    else:
+        with exportdata:
+            entity_types[entitytype]['export'](model, path)
+    log("Export model '" + model['name'] + "' as " + entitytype + " to " + path, "DEBUG")
+
+
+def _exportModelMeshes(model, exportpath, meshtype):
+    """Job exporting the meshes of a model in one format."""
+    exportMeshes(model['meshes'], exportpath, (meshtype,))
+
+
+def _exportModelTextures(model, exportpath, sourcepath):
+    """Job copying the textures of a model."""
+    exportTextures(model['materials'], exportpath, sourcepath)
+
+
+def runExportJobs(graph, callback=None):
+    """Runs a graph of export jobs, rounding numbers as set in the export settings.
+
+    Args:
+        graph(phobos.utils.jobs.JobGraph): the export jobs
+        callback(function): progress callback, see phobos.utils.jobs.JobGraph.run
+
+    Returns:
+        dict: the results of the jobs by name
+
+    """
+    # numbers are rounded as they are written
+    with NumberFormat(getExpSettings().decimalPlaces):
+        return graph.run(callback=callback)
+
+
+def exportMeshes(meshes, exportpath, meshtypes=None):
+    """Exports meshes in the given mesh formats.
+
+    Args:
+        meshes(dict): mesh objects by mesh name, as in the *meshes* of a model dictionary
+        exportpath(str): path to export root, the meshes are put in its mesh folders
+        meshtypes(list of str): mesh formats, defaults to all formats selected in the GUI
+
+    Returns:
+
+    """
+    if meshtypes is None:
+        meshtypes = [m for m in mesh_types if getattr(bpy.context.scene, "export_mesh_" + m, False)]
+    i = 1
+    n = len(meshtypes) * len(meshes)
+    for meshtype in meshtypes:
         mesh_path = getOutputMeshpath(exportpath, meshtype)
         try:
-            if getattr(bpy.context.scene, "export_mesh_" + meshtype, False):
-                securepath(mesh_path)
-                for meshname in model['meshes']:
-                    mesh_types[meshtype]['export'](model['meshes'][meshname], mesh_path)
-                    display.setProgress(i / n, 'Exporting ' + meshname + '.' + meshtype + '...')
-                    i += 1
+            securepath(mesh_path)
+            for meshname in meshes:
+                mesh_types[meshtype]['export'](meshes[meshname], mesh_path)
+                display.setProgress(i / n, 'Exporting ' + meshname + '.' + meshtype + '...')
+                i += 1
         except KeyError as e:
             log("Error exporting mesh {0} as {1}: {2}".format(meshname, meshtype, str(e)), "ERROR")
     display.setProgress(0)
 
-    # TODO: Move texture export to individual formats? This is practically SMURF
-    # TODO: Also, this does not properly take care of textures embedded in a .blend file
-    # export textures
-    if getExpSettings().exportTextures:
-        for materialname in model['materials']:
-            mat = model['materials'][materialname]
-            for texturetype in ['diffuseTexture', 'normalTexture',
-                                'displacementTexture']:
-                if texturetype in mat:
-                    sourcepath = os.path.join(os.path.expanduser(
-                        bpy.path.abspath('//')), mat[texturetype])
-                    if os.path.isfile(sourcepath):
-                        texture_path = securepath(
-                            os.path.join(exportpath, 'textures'))
-                        log("Exporting textures to " + texture_path, "INFO")
-                        try:
-                            shutil.copy(sourcepath, os.path.join(
-                                texture_path, os.path.basename(mat[texturetype])))
-                        except shutil.SameFileError:
-                            log("{} already in place".format(texturetype), "INFO")
+
+def exportTextures(materials, exportpath, sourcepath=None):
+    """Copies the texture files of materials to the texture folder of an export.
+
+    Args:
+        materials(dict): material dictionaries, as in the *materials* of a model dictionary
+        exportpath(str): path to export root
+        sourcepath(str): folder the texture paths are relative to, the one of the .blend file
+          if None
+
+    Returns:
+
+    """
+    if sourcepath is None:
+        sourcepath = os.path.expanduser(bpy.path.abspath('//'))
+    for materialname in materials:
+        mat = materials[materialname]
+        for texturetype in ['diffuseTexture', 'normalTexture',
+                            'displacementTexture']:
+            if texturetype in mat:
+                texturefile = os.path.join(sourcepath, mat[texturetype])
+                if os.path.isfile(texturefile):
+                    texture_path = securepath(
+                        os.path.join(exportpath, 'textures'))
+                    log("Exporting textures to " + texture_path, "INFO")
+                    try:
+                        shutil.copy(texturefile, os.path.join(
+                            texture_path, os.path.basename(mat[texturetype])))
+                    except shutil.SameFileError:
+                        log("{} already in place".format(texturetype), "INFO")
+
+
+def getModelKey(root):
+    """Returns the key identifying the model of an entity root, i.e. its model name and version.
+
+    Args:
+        root(bpy.types.Object): root object of the entity
+
+    Returns:
+        tuple: (modelname, version), the version is an empty string if not specified
+
+    """
+    return (nUtils.getModelName(root), str(root.get('version', '')))
+
+
+def getModelFolderName(root):
+    """Returns the name of the folder the model of an entity root is exported to in a scene.
+
+    Entities sharing model name and version share this folder.
+
+    Args:
+        root(bpy.types.Object): root object of the entity
+
+    Returns:
+        str: folder name of the model
+
+    """
+    modelname, version = getModelKey(root)
+    return modelname + '_' + version if version else modelname
+
+
+def exportSceneModels(roots, exportpath, entitytypes=None):
+    """Exports the models of all entity roots, deriving and exporting every distinct model once.
+
+    Entities are grouped by their model name and version (see getModelKey) and the first root
+    of every group is used to derive the model. Only entities of a type which can be exported
+    as model are considered. All models are exported in one JobGraph.
+
+    Args:
+        roots(list of bpy.types.Object): roots of the scene's entities
+        exportpath(str): path of the scene folder, the models are put in subfolders
+        entitytypes(list of str): types to export the models in
+
+    Returns:
+        dict: model export paths by model key
+
+    """
+    from phobos.model.models import deriveModelDictionary
+    modelroots = {}
+    for root in roots:
+        if (root.phobostype in ('link', 'submodel') and root.get('entity/type') in entity_types
+                and 'export' in entity_types[root['entity/type']]):
+            modelroots.setdefault(getModelKey(root), root)
+    log("Exporting {0} distinct models of {1} entities.".format(len(modelroots), len(roots)),
+        "INFO")
+    # one graph for all models, so models are written while the next ones are derived
+    graph = JobGraph()
+    modelpaths = {}
+    for modelkey, root in sorted(modelroots.items()):
+        foldername = getModelFolderName(root)
+        modelpaths[modelkey] = os.path.join(exportpath, foldername)
+        model = graph.add(foldername + ' derive', deriveModelDictionary, (root, '', [], True),
+                          mainthread=True, stage='derive')
+        addModelExportJobs(graph, model, modelpaths[modelkey], entitytypes, label=foldername)
+    runExportJobs(graph)
+    return modelpaths
 
 
 def exportScene(scenedict, exportpath='.', scenetypes=None, export_entity_models=False,
                 entitytypes=None):
     """Exports provided scene to provided path
 
+    If the models are exported as well, the scene dictionary needs to provide the entity roots
+    as *roots*; every distinct model is only exported once (see exportSceneModels) and all
+    entities referencing it share its files.
+
     Args:
         scenedict(dict): dictionary of scene
         exportpath(str): path to scene export folder
@@ -413,10 +831,12 @@ def exportScene(scenedict, exportpath='.', scenetypes=None, export_entity_models
     if not scenetypes:
         scenetypes = getSceneTypesForExport()
     if export_entity_models:
-        for entity in scenedict['entities']:
-            exportModel(entity, exportpath, entitytypes)
-    for scenetype in scenetypes:
-        gui_typename = "export_scene_" + scenetype
-        # check if format exists and should be exported
-        if getattr(bpy.context.scene, gui_typename):
-            scene_types[scenetype]['export'](scenedict['entities'], os.path.join(exportpath, scenedict['name']))
+        exportSceneModels(scenedict.get('roots', []),
+                          os.path.join(exportpath, scenedict['name']), entitytypes)
+    with NumberFormat(getExpSettings().decimalPlaces):
+        for scenetype in scenetypes:
+            gui_typename = "export_scene_" + scenetype
+            # check if format exists and should be exported
+            if getattr(bpy.context.scene, gui_typename):
+                scene_types[scenetype]['export'](scenedict['entities'],
+                                                 os.path.join(exportpath, scenedict['name']))
@@ -0,0 +1,182 @@
+#!/usr/bin/python
+# coding=utf-8
+
+"""
+.. module:: phobos.utils.jobs
+    :platform: Unix, Windows, Mac
+    :synopsis: Runs graphs of dependent jobs, such as the stages of an export
+
+Copyright 2018, University of Bremen & DFKI GmbH Robotics Innovation Center
+
+This file is part of Phobos, a Blender Add-On to edit robot models.
+
+Phobos is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License
+as published by the Free Software Foundation, either version 3
+of the License, or (at your option) any later version.
+
+Phobos is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with Phobos.  If not, see <http://www.gnu.org/licenses/>.
+
+File jobs.py
+
+Created on 26 Mar 2018
+"""
+
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from phobos.phoboslog import log
+
+
+class JobResult(object):
+    """Placeholder for the result of a job, which is passed to the jobs depending on it."""
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+
+class Job(object):
+    """A function to run in a JobGraph, see JobGraph.add."""
+
+    def __init__(self, name, function, args, dependencies, mainthread, stage):
+        self.name = name
+        self.function = function
+        self.args = args
+        self.dependencies = dependencies
+        self.mainthread = mainthread
+        self.stage = stage
+
+
+class JobGraph(object):
+    """A graph of jobs which runs every job as soon as all jobs it depends on are finished.
+
+    Jobs which use Blender's data or operators have to run in the main thread, all other jobs
+    are run by a pool of worker threads meanwhile. Jobs can only depend on jobs which have been
+    added before, so the graph is free of cycles.
+
+    The duration of every job is logged, as is the summed up duration of the jobs per *stage*
+    once the graph is finished.
+    """
+
+    def __init__(self):
+        self.jobs = OrderedDict()
+        self.results = {}
+        self.timings = OrderedDict()
+
+    def add(self, name, function, args=(), dependencies=(), mainthread=False, stage=None):
+        """Adds a job to the graph.
+
+        Arguments which are a JobResult are replaced by the result of that job when the job is
+        run, the job implicitly depends on them.
+
+        Args:
+          name(str): unique name of the job
+          function(function): the function to run
+          args(tuple): arguments of the function
+          dependencies(list of str): names of further jobs which need to be finished first
+          mainthread(bool): True if the job has to run in Blender's main thread
+          stage(str): stage the timing of the job is summed up in, defaults to the name
+
+        Returns:
+          JobResult -- placeholder for the result of the job
+
+        """
+        if name in self.jobs:
+            raise ValueError("Job " + name + " is already part of the graph.")
+        dependencies = set(dependencies) | {arg.name for arg in args if isinstance(arg, JobResult)}
+        for dependency in dependencies:
+            if dependency not in self.jobs:
+                raise ValueError("Job " + name + " depends on unknown job " + dependency + ".")
+        self.jobs[name] = Job(name, function, tuple(args), dependencies, mainthread,
+                              stage if stage else name)
+        return JobResult(name)
+
+    def _execute(self, job):
+        """Runs a job, returning its result and duration."""
+        args = [self.results[arg.name] if isinstance(arg, JobResult) else arg
+                for arg in job.args]
+        start = time.time()
+        result = job.function(*args)
+        return result, time.time() - start
+
+    def run(self, workers=None, callback=None):
+        """Runs all jobs of the graph.
+
+        If a job fails, no further jobs are started. Once the running jobs are finished, the
+        exception of the failed job is raised again, so it is not masked by the scheduling.
+
+        Args:
+          workers(int): number of worker threads, the default of ThreadPoolExecutor if None
+          callback(function): called in the calling thread after every finished job with the
+            number of finished jobs, the number of all jobs and the name of the job
+
+        Returns:
+          dict -- the results of the jobs by name
+
+        """
+        dependents = {name: [] for name in self.jobs}
+        remaining = {}
+        for name, job in self.jobs.items():
+            remaining[name] = set(job.dependencies)
+            for dependency in job.dependencies:
+                dependents[dependency].append(name)
+        ready = [name for name in self.jobs if not remaining[name]]
+        running = {}
+        error = None
+        start = time.time()
+
+        with ThreadPoolExecutor(workers) as executor:
+            while (ready and error is None) or running:
+                finished = []
+                if error is None:
+                    for name in [name for name in ready if not self.jobs[name].mainthread]:
+                        ready.remove(name)
+                        running[executor.submit(self._execute, self.jobs[name])] = name
+                mainjobs = [name for name in ready if self.jobs[name].mainthread]
+                if mainjobs and error is None:
+                    # run one job in the main thread while the workers go on
+                    ready.remove(mainjobs[0])
+                    try:
+                        finished.append((mainjobs[0], self._execute(self.jobs[mainjobs[0]]), None))
+                    except Exception as exception:
+                        finished.append((mainjobs[0], None, exception))
+                    done = [future for future in running if future.done()]
+                else:
+                    done = wait(running, return_when=FIRST_COMPLETED)[0]
+                for future in done:
+                    name = running.pop(future)
+                    exception = future.exception()
+                    finished.append((name, None if exception else future.result(), exception))
+
+                for name, outcome, exception in finished:
+                    if exception is not None:
+                        log("Job " + name + " failed: " + str(exception), "ERROR")
+                        error = error if error else exception
+                        continue
+                    self.results[name], self.timings[name] = outcome
+                    log("Finished {0} in {1:.3f} s.".format(name, self.timings[name]), "DEBUG")
+                    if callback:
+                        callback(len(self.timings), len(self.jobs), name)
+                    for dependent in dependents[name]:
+                        remaining[dependent].discard(name)
+                        if not remaining[dependent]:
+                            ready.append(dependent)
+
+        stages = OrderedDict()
+        for name, duration in self.timings.items():
+            stage = self.jobs[name].stage
+            stages[stage] = stages.get(stage, 0.) + duration
+        for stage, duration in stages.items():
+            log("Stage {0}: {1:.3f} s".format(stage, duration), "INFO")
+        log("Finished {0} of {1} jobs in {2:.3f} s.".format(len(self.timings), len(self.jobs),
+                                                            time.time() - start), "INFO")
+        if error is not None:
+            raise error
+        return self.results
@@ -30,13 +30,138 @@ import bpy
 import re
 
 
+#: maximum length of names of Blender objects
+MAX_NAME_LENGTH = 63
+
+# name allocator used by safelyName, set while a NameAllocator is used as context manager
+_allocator = None
+
+# allocator used by safelyName outside of NameAllocator contexts, see getNameAllocator
+_fileallocator = None
+
+
+class NameAllocator(object):
+    """Allocates unique names following Blender's naming scheme (*name.001*, *name.002*, ...).
+
+    The allocator keeps a set of all taken names and the last number used per base name, so a
+    name is allocated in constant time regardless of how many names with the same base exist.
+    Numbers are not reused, thus names may differ from those Blender would choose.
+
+    Used as context manager, e.g. for the duration of an import, safelyName allocates all
+    object names from it::
+
+        with NameAllocator(bpy.data.objects.keys()):
+            ...
+
+    """
+
+    def __init__(self, names=()):
+        self.taken = set(names)
+        self.counters = {}
+        self._previous = None
+
+    def __enter__(self):
+        global _allocator
+        self._previous = _allocator
+        _allocator = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _allocator
+        _allocator = self._previous
+        self._previous = None
+
+    def allocate(self, name):
+        """Returns *name* or, if it is taken, a numbered version of it and marks it as taken.
+
+        Args:
+          name(str): the requested name
+
+        Returns:
+          str -- the allocated name
+
+        """
+        if name not in self.taken:
+            self.taken.add(name)
+            return name
+        base = re.sub(r'\.[0-9]{3,}$', '', name)
+        number = self.counters.get(base, 0)
+        while True:
+            number += 1
+            numberstr = '.{0:03d}'.format(number)
+            newname = base[:MAX_NAME_LENGTH - len(numberstr)] + numberstr
+            if newname not in self.taken:
+                break
+        self.counters[base] = number
+        self.taken.add(newname)
+        return newname
+
+    def release(self, name):
+        """Marks a name as free again."""
+        self.taken.discard(name)
+
+    def rename(self, obj, name):
+        """Renames a Blender object to a unique name derived from *name*.
+
+        Names of objects the allocator does not know about are resolved as well, as Blender
+        itself appends a number if the name is taken.
+
+        Args:
+          obj(bpy.types.Object): object to rename
+          name(str): the requested name
+
+        Returns:
+          str -- the new name of the object
+
+        """
+        self.release(obj.name)
+        newname = self.allocate(name)
+        obj.name = newname
+        while obj.name != newname:
+            newname = self.allocate(newname)
+            obj.name = newname
+        return newname
+
+
+def getNameAllocator():
+    """Returns the NameAllocator safelyName takes object names from.
+
+    This is the allocator of the innermost NameAllocator context or else an allocator of all
+    object names of the file, which is kept until invalidateNameAllocator is called, i.e.
+    whenever the name index of phobos.utils.selection is invalidated.
+
+    Returns:
+      NameAllocator -- the allocator
+
+    """
+    global _fileallocator
+    if _allocator:
+        return _allocator
+    if _fileallocator is None:
+        _fileallocator = NameAllocator(bpy.data.objects.keys())
+    return _fileallocator
+
+
+def invalidateNameAllocator():
+    """Drops the allocator of all object names, so it is created anew on the next use."""
+    global _fileallocator
+    _fileallocator = None
+
+
 def getUniqueName(newname, names):
-    i = 0
-    while newname in names:
-        numberstr = '.{0:03d}'.format(i)
-        newname = newname[:63 - len(numberstr)] + numberstr
-        i += 1
-    return newname
+    """Returns *newname* or, if it is contained in *names*, a numbered version of it.
+
+    Args:
+      newname(str): the requested name
+      names(iterable): the names already taken
+
+    Returns:
+      str -- a name not contained in *names*
+
+    """
+    if newname not in names:
+        return newname
+    return NameAllocator(names).allocate(newname)
 
 
 def safelyName(obj, name, phobostype=None):
@@ -47,7 +172,9 @@ def safelyName(obj, name, phobostype=None):
      itself, the actual object is renamed, generating a name that no other
      object in Blender has, using Blender's own naming scheme. This prevents
      Blender to assign the name and change another object's name that
-     previously held that name.
+     previously held that name. The name is taken from the active NameAllocator
+     (see getNameAllocator), which avoids collecting all object names for every
+     call.
 
      If the *name* provided cannot be assigned to the object, it is stored in a
      custom variable '*phobostype*/name' Note that other '*/name' variables in
@@ -63,15 +190,15 @@ def safelyName(obj, name, phobostype=None):
         str: new name of the Blender object
     """
     from phobos.phoboslog import log
+    from phobos.utils.selection import updateObjectName
 
     objectname = name
     if not phobostype:
         phobostype = obj.phobostype
 
     if obj.phobostype == phobostype:
-        objectname = getUniqueName(objectname, bpy.data.objects)
+        objectname = getNameAllocator().rename(obj, objectname)
         log("Acquired unique name for Blender object: " + objectname, 'DEBUG')
-        obj.name = objectname
 
     # use custom property if the object.name can not be set properly
     if objectname != name:
@@ -79,6 +206,7 @@ def safelyName(obj, name, phobostype=None):
     elif phobostype + '/name' in obj:
         del obj[phobostype + '/name']
 
+    updateObjectName(obj)
     return obj.name
 
 
@@ -27,7 +27,9 @@ along with Phobos.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 import bpy
+from bpy.app.handlers import persistent
 import phobos.defs as defs
+import phobos.utils.naming as nUtils
 from phobos.phoboslog import log
 
 
@@ -95,11 +97,8 @@ def getEffectiveParent(obj, ignore_selection=False, include_hidden=False, object
       ignore_selection:  (Default value = False)
       objectlist: list of bpy.types.Object to which possible parents are restricted
     """
-    if not objectlist:
-        objectlist = list(bpy.data.objects)
-
     parent = obj.parent
-    while (parent and parent in objectlist
+    while (parent and (not objectlist or parent in objectlist)
            and ((parent.hide and not include_hidden)
                 or (not parent.select and bpy.context.scene.phobosexportsettings.selectedOnly
                 and not ignore_selection)
@@ -197,6 +196,158 @@ def selectObjects(objects, clear=True, active=-1):
         bpy.context.scene.objects.active = objects[active]
 
 
+class ObjectNameIndex(object):
+    """Index of the Blender names and custom names (*<phobostype>/name*) of all objects.
+
+    Entries are validated when they are returned, so renamed or deleted objects are never
+    returned for a name they no longer hold; a stale entry causes the index to be rebuilt.
+    Objects added since the last lookup are indexed incrementally, changes of existing objects
+    are picked up via updateObject and the handlers registered in register(). As objects can be
+    added and deleted without changing their number, all objects are checked for missing
+    entries before a name is reported as not found.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.indexed = {}
+        self.scenes = {}
+        self.objectcount = -1
+        self.valid = False
+
+    def invalidate(self):
+        self.valid = False
+        nUtils.invalidateNameAllocator()
+
+    def _add(self, obj, scenes=None):
+        pointer = obj.as_pointer()
+        names = [(obj.name, None)] + [(obj[key], key) for key in obj.keys()
+                                      if key.endswith('/name') and isinstance(obj[key], str)]
+        for name, key in names:
+            self.entries.setdefault(name, []).append((pointer, obj, key))
+        self.indexed[pointer] = [name for name, key in names]
+        self.scenes[pointer] = (scenes if scenes is not None else
+                                set(scene.name for scene in obj.users_scene))
+
+    def _remove(self, pointer):
+        for name in self.indexed.pop(pointer, ()):
+            entries = [entry for entry in self.entries.get(name, ()) if entry[0] != pointer]
+            if entries:
+                self.entries[name] = entries
+            else:
+                self.entries.pop(name, None)
+        self.scenes.pop(pointer, None)
+
+    def rebuild(self):
+        """Indexes all objects of the current file from scratch."""
+        self.entries.clear()
+        self.indexed.clear()
+        self.scenes.clear()
+        scenes = {}
+        for scene in bpy.data.scenes:
+            for obj in scene.objects:
+                scenes.setdefault(obj.as_pointer(), set()).add(scene.name)
+        for obj in bpy.data.objects:
+            self._add(obj, scenes.get(obj.as_pointer(), set()))
+        self.objectcount = len(bpy.data.objects)
+        self.valid = True
+
+    def updateObject(self, obj):
+        """Updates the entries of an object after it has been renamed."""
+        if self.valid:
+            self._remove(obj.as_pointer())
+            self._add(obj)
+
+    def _ensureCurrent(self):
+        objectcount = len(bpy.data.objects)
+        if not self.valid or objectcount < self.objectcount:
+            self.rebuild()
+        elif objectcount > self.objectcount:
+            self._indexMissing()
+
+    def _indexMissing(self):
+        """Indexes all objects which are not indexed under their current name.
+
+        This also catches objects allocated at the address of a deleted object.
+        """
+        for obj in bpy.data.objects:
+            pointer = obj.as_pointer()
+            if pointer not in self.indexed or self.indexed[pointer][0] != obj.name:
+                self._remove(pointer)
+                self._add(obj)
+        self.objectcount = len(bpy.data.objects)
+
+    @staticmethod
+    def _isCurrent(obj, key, name):
+        try:
+            return (obj.name if key is None else obj.get(key)) == name
+        except ReferenceError:
+            return False
+
+    def _validEntries(self, names):
+        """Returns all entries of the names, rebuilding the index once if one is stale."""
+        for attempt in range(2):
+            self._ensureCurrent()
+            if not all(name in self.entries for name in names):
+                self._indexMissing()
+            entries = [(name, pointer, obj, key) for name in names
+                       for pointer, obj, key in self.entries.get(name, ())]
+            if all(self._isCurrent(obj, key, name) for name, pointer, obj, key in entries):
+                break
+            self.invalidate()
+        return entries
+
+    def lookup(self, name, scene=None):
+        """Returns (object, key) tuples of all objects holding *name*.
+
+        The key is the custom property holding the name, or None for the object's name.
+
+        Args:
+          name(str): the name to look up
+          scene(bpy.types.Scene, optional): only return objects linked to this scene
+
+        Returns:
+          list -- (bpy.types.Object, str) tuples
+
+        """
+        return [(obj, key) for name, pointer, obj, key in self._validEntries((name,))
+                if scene is None or scene.name in self.scenes[pointer]]
+
+    def search(self, match):
+        """Returns all objects holding a name for which *match* returns True.
+
+        Args:
+          match(function): predicate on the indexed names
+
+        Returns:
+          list -- matching objects in the order of their first matching name
+
+        """
+        self._ensureCurrent()
+        self._indexMissing()
+        objects = []
+        for name, pointer, obj, key in self._validEntries([name for name in self.entries
+                                                          if match(name)]):
+            if obj not in objects:
+                objects.append(obj)
+        return objects
+
+
+# index of the names of all objects in the current file
+_nameindex = ObjectNameIndex()
+
+
+def updateObjectName(obj):
+    """Updates the name index after an object's name or custom names have been changed.
+
+    Args:
+      obj(bpy.types.Object): the renamed object
+
+    Returns:
+
+    """
+    _nameindex.updateObject(obj)
+
+
 def getObjectByName(name):
     """Returns list of objects that either have a specific *name* or contain a custom
     name property with that name.
@@ -212,16 +363,9 @@ def getObjectByName(name):
 
     """
     objlist = []
-    for obj in bpy.context.scene.objects:
-        if name == obj.name:
+    for obj, key in _nameindex.lookup(name, bpy.context.scene):
+        if obj not in objlist:
             objlist.append(obj)
-        else:
-            for key in obj.keys():
-                try:
-                    if obj[key].endswith('/name') and name == obj[key]:
-                        objlist.append(obj)
-                except AttributeError:
-                    continue
     return objlist[0] if len(objlist) == 1 else objlist
 
 
@@ -238,24 +382,18 @@ def getObjectsByPattern(pattern, match_case=False):
       list - all matching objects.
 
     """
-    objlist = []
-    for obj in bpy.data.objects:
-        for key in obj.keys():
-            if key.endswith('/name'):
-                objname = obj[key]
-                if ((match_case and pattern in objname) or
-                        (not match_case and pattern.lower() in objname.lower())):
-                    objlist.append(obj)
-        if (match_case and pattern in obj.name) \
-                or (not match_case and pattern.lower() in obj.name.lower()):
-            objlist.append(obj)
-    return objlist
+    if match_case:
+        return _nameindex.search(lambda name: pattern in name)
+    pattern = pattern.lower()
+    return _nameindex.search(lambda name: pattern in name.lower())
 
 
 def getObjectByNameAndType(name, phobostype):
     """Find an object with a specified phobostype and having the property
     "phobostype/'name' == name".
 
+    Objects without this property are found by their Blender name, if their phobostype matches.
+
     Args:
       name(str): The name to search for.
       phobostype(str): The phobostype to search for.
@@ -266,8 +404,9 @@ def getObjectByNameAndType(name, phobostype):
     """
     # FIXME: make this API-compatible with geObjectByName
     name_tag = phobostype + "/name"
-    for obj in bpy.data.objects:
-        if name_tag in obj and name == obj[name_tag]:
+    for obj, key in _nameindex.lookup(name):
+        if key == name_tag or (key is None and obj.phobostype == phobostype and
+                               name_tag not in obj):
             return obj
     log("No object of type " + phobostype + " with name " + name + " found.", "WARNING")
     return None
@@ -287,13 +426,18 @@ def selectByName(name, match_case=False, exact=False):
     """
     if exact:
         obj = getObjectByName(name)
-        selectObjects(object if isinstance(obj, list) else [obj], True)
+        selectObjects(obj if isinstance(obj, list) else [obj], True)
     else:
         selectObjects(getObjectsByPattern(name, match_case), True)
 
 
 def getObjectByProperty(property, value):
     """Returns the first object found in the .blend file data with matching property and value"""
+    if property.endswith('/name'):
+        for obj, key in _nameindex.lookup(value):
+            if key == property:
+                return obj
+        return None
     candidate = None
     for obj in bpy.data.objects:
         if property in obj and obj[property] == value:
@@ -310,3 +454,28 @@ def getSubmechanismRootForJoint(jointobj):
     for root in getSubmechanismRoots():
         if jointobj in root['submechanism/spanningtree']:
             return root
+
+
+@persistent
+def invalidateNameIndexHandler(dummy):
+    _nameindex.invalidate()
+
+
+@persistent
+def checkNameIndexHandler(scene):
+    if bpy.data.objects.is_updated:
+        _nameindex.invalidate()
+
+
+def register():
+    bpy.app.handlers.load_post.append(invalidateNameIndexHandler)
+    bpy.app.handlers.undo_post.append(invalidateNameIndexHandler)
+    bpy.app.handlers.redo_post.append(invalidateNameIndexHandler)
+    bpy.app.handlers.scene_update_post.append(checkNameIndexHandler)
+
+
+def unregister():
+    bpy.app.handlers.load_post.remove(invalidateNameIndexHandler)
+    bpy.app.handlers.undo_post.remove(invalidateNameIndexHandler)
+    bpy.app.handlers.redo_post.remove(invalidateNameIndexHandler)
+    bpy.app.handlers.scene_update_post.remove(checkNameIndexHandler)
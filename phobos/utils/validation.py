@@ -26,6 +26,7 @@ Created on 26 March 2015
 @author: Ole Schwiegert
 """
 
+from collections.abc import Mapping
 from copy import deepcopy as dc
 
 import phobos.defs as defs
@@ -183,7 +184,7 @@ def traverse_dict(dic, entry_list):
     keys are not found.
 
     Args:
-      dic(dict): The dictionary to traverse.
+      dic(dict): The dictionary to traverse, may be any mapping such as a pose or record.
       entry_list(list: list): The list of keys you want to traverse with.
 
     Returns:
@@ -193,9 +194,9 @@ def traverse_dict(dic, entry_list):
     length = len(entry_list)
     if length > 0:
         element = entry_list[0]
-        if isinstance(dic, dict) and length > 1 and element in dic:
+        if isinstance(dic, Mapping) and length > 1 and element in dic:
             return traverse_dict(dic[element], entry_list[1:])
-        elif isinstance(dic, dict) and length == 1 and element in dic:
+        elif isinstance(dic, Mapping) and length == 1 and element in dic:
             return dic[element]
     return None
 